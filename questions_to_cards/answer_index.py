@@ -0,0 +1,239 @@
+import re
+import numpy as np
+from tqdm import tqdm
+from similarity import distill, wordify, jaro_upper_bound, BRACKETS_RE, REJECT_SPLIT_RE
+
+#bracketed or parenthesized part of an answer line, e.g. "[or DBs; accept relational databases]"
+ALTERNATES_RE = re.compile(r'\[([^\[\]]*)\]|\(([^()]*)\)')
+#separates the sides of an "A or B" answer, which only block (see answer_keys())
+OR_SPLIT_RE = re.compile(r'\sor\s')
+#instruction words in front of an alternate form
+FORM_LEADIN_RE = re.compile(r'^\s*(?:(?:also|or|accept|either)\b\s*)+', re.IGNORECASE)
+#a form with any of these isn't an equivalent answer (prompts, rejects, notes, and
+#grading instructions like "accept any underlined portion" that many lines share)
+NOT_ALTERNATE_RE = re.compile(r'\b(?:prompt|directed|reject|do not|don’t|don\'t|until|before|after|'
+                              r'reveal|read|mentioned|note|antiprompt|anti-prompt|underlined|'
+                              r'portions?|parts?|equivalents?|synonyms?|word forms like|any)\b',
+                              re.IGNORECASE)
+#separator between a form and an instruction after it, e.g. the comma in "DBs, prompt on data"
+FORM_TAIL_RE = re.compile(r'(?:,|\s(?:and|or|but))$', re.IGNORECASE)
+#distilled forms shorter than this only block by exact alias, not by prefix
+PREFIX_LEN = 4
+#tokens shorter than this are too common to be useful blocking keys
+MIN_TOKEN_LEN = 3
+#token and prefix keys shared by more unique answers than this are ignored
+MAX_POSTINGS = 500
+#distilled aliases shorter than this (e.g. "S" for sulfur) only block, they never match outright
+MIN_ALIAS_LEN = 3
+#alias keys shared by more unique answers than this are ignored; a real alternate
+#form is shared by a handful of answer lines, not by dozens of unrelated ones
+MAX_ALIAS_POSTINGS = 25
+
+
+def answer_forms(answer_line):
+    '''
+    Split an answer line into the forms it accepts as equivalent: the primary
+    answer, plus every alternate given in brackets. Alternates are separated
+    by semicolons only, so titles like "Romeo and Juliet" or "The Good, the
+    Bad and the Ugly" stay whole, and leading "or"/"accept" is dropped.
+    Parenthesized text only counts if it starts with such a word, since it
+    is usually a disambiguation, e.g. "Queen (band)". Prompts, rejects and
+    moderator notes aren't forms.
+
+    e.g. "databases [or DBs; accept relational databases; prompt on data]"
+    -> ['databases', 'DBs', 'relational databases']
+
+    Returns (list of strs): forms, as written
+    '''
+    answer_line = str(answer_line)
+    forms = [REJECT_SPLIT_RE.split(BRACKETS_RE.sub('', answer_line))[0]]
+    for match in ALTERNATES_RE.finditer(answer_line):
+        bracketed = match.group(1) is not None
+        inside = match.group(1) if bracketed else match.group(2)
+        for clause in inside.split(';'):
+            if not bracketed and not FORM_LEADIN_RE.match(clause):
+                continue
+            instruction = NOT_ALTERNATE_RE.search(clause)
+            if instruction is not None:
+                # "DBs, prompt on data" keeps DBs; "X until mentioned" is conditional
+                before = clause[:instruction.start()].rstrip()
+                tail = FORM_TAIL_RE.search(before)
+                if tail is None:
+                    continue
+                clause = before[:tail.start()]
+            forms.append(FORM_LEADIN_RE.sub('', clause))
+    return [form.strip() for form in forms if form.strip() != '']
+
+
+def answer_keys(answer_line, max_length=50):
+    '''
+    Blocking keys for an answer line. Alias keys are the distilled forms
+    themselves; two answer lines sharing one accept each other. Block keys
+    are the words of each form and the first PREFIX_LEN characters of each
+    distilled form and of each side of an "A or B" form, and only decide
+    which answers get compared at all. Those sides aren't aliases: "Rock or
+    Paper" is one title as often as it is two answers.
+
+    Returns (tuple of sets of strs): alias keys, block keys
+    '''
+    aliases, blocks = set(), set()
+    for form in answer_forms(answer_line):
+        alias = distill(form, answerline=True, max_length=max_length)
+        if alias == '':
+            continue
+        aliases.add(alias)
+        for side in [form] + OR_SPLIT_RE.split(form):
+            prefix = distill(side, answerline=True, max_length=max_length)[:PREFIX_LEN]
+            if len(prefix) == PREFIX_LEN:
+                blocks.add('^' + prefix)
+        blocks.update(word for word in wordify(form, answerline=True) if len(word) >= MIN_TOKEN_LEN)
+    return aliases, blocks
+
+
+class AnswerIndex:
+    '''
+    Inverted index from answer keys (see answer_keys()) to the unique simple
+    answers of a prepared dedup table. Used by remove_redundancies() as a
+    blocking step: an answer is only scored against the answers it shares a
+    key with, instead of every answer of plausible length, and answers that
+    share an alternate form ("databases [or DBs]" and "DBs") match outright.
+    Aliases shorter than MIN_ALIAS_LEN or shared by too many answers only
+    block.
+    '''
+
+    def __init__(self, unique_strs, unique_idxs, answer_lines, max_length=50,
+                 max_postings=MAX_POSTINGS, max_alias_postings=MAX_ALIAS_POSTINGS):
+        '''
+        Inputs:
+            - unique_strs (numpy array of strs): sorted unique simple answers
+            - unique_idxs (numpy array of ints): each row's position in unique_strs
+            - answer_lines (iterable of strs): each row's full answer line
+            - max_length (int): as in distill()
+            - max_postings (int): block keys shared by more unique answers
+            than this are too common to narrow anything down, and are ignored
+            - max_alias_postings (int): alias keys shared by more unique
+            answers than this are ignored too
+        '''
+        self.unique_strs = unique_strs
+        self.lengths = np.array([len(ans) for ans in unique_strs])
+        self.aliases = [{ans} for ans in unique_strs]
+        self.blocks = [set() for _ in unique_strs]
+        line_keys = {}
+        print("Indexing answer lines and their alternates...")
+        for unique_i, line in zip(tqdm(unique_idxs), answer_lines):
+            if line not in line_keys:
+                line_keys[line] = answer_keys(line, max_length)
+            aliases, blocks = line_keys[line]
+            self.aliases[unique_i] |= aliases
+            self.blocks[unique_i] |= blocks
+
+        self.postings = {}
+        for unique_i in range(len(unique_strs)):
+            for key in self.aliases[unique_i]:
+                self.postings.setdefault('=' + key, []).append(unique_i)
+            for key in self.blocks[unique_i]:
+                self.postings.setdefault(key, []).append(unique_i)
+        self.postings = {key: np.array(positions, dtype=np.int64)
+                         for key, positions in self.postings.items()}
+        self.common_keys = {key for key, positions in self.postings.items()
+                            if len(positions) > (max_alias_postings if key.startswith('=')
+                                                 else max_postings)}
+        print(f"Indexed {len(self.postings)} answer keys " +
+              f"({len(self.common_keys)} too common to block on)")
+
+    def alias_matches(self, unique_i):
+        '''
+        Positions of unique answers sharing an accepted form with this one,
+        long enough and rare enough to match outright, and this one itself.
+        '''
+        keys = ['=' + key for key in self.aliases[unique_i] if len(key) >= MIN_ALIAS_LEN]
+        lists = [self.postings[key] for key in keys if key not in self.common_keys]
+        return np.unique(np.concatenate([np.array([unique_i], dtype=np.int64)] + lists))
+
+    def candidates(self, unique_i):
+        '''Positions of unique answers sharing any usable key with this one.'''
+        keys = list(self.blocks[unique_i]) + ['=' + key for key in self.aliases[unique_i]]
+        lists = [self.postings[key] for key in keys if key not in self.common_keys]
+        return np.unique(np.concatenate([self.alias_matches(unique_i)] + lists))
+
+    def match(self, unique_i, ans_thresh):
+        '''
+        Which unique answers match unique answer unique_i: those sharing an
+        accepted form, plus blocking candidates whose Jaro similarity is
+        above ans_thresh. Candidates of implausible length aren't scored, as
+        in score_answer().
+
+        Returns (tuple): boolean numpy array aligned with unique_strs, and
+        the number of strings actually scored
+        '''
+        import batch_jaro_winkler as bjw
+        answer = self.unique_strs[unique_i]
+        matches = np.full((len(self.unique_strs),), False)
+        matches[self.alias_matches(unique_i)] = True
+
+        candidates = self.candidates(unique_i)
+        # small slack because batch_jaro_winkler scores are float32
+        plausible = np.array([jaro_upper_bound(len(answer), length) + 1e-6 > ans_thresh
+                              for length in self.lengths[candidates]], dtype=bool)
+        candidates = candidates[plausible]
+        if len(candidates) > 0:
+            rt_model = bjw.build_runtime_model(bjw.build_exportable_model(self.unique_strs[candidates]))
+            bjw_result = bjw.jaro_distance(rt_model, answer)
+            positions = np.searchsorted(self.unique_strs, [result_tuple[0] for result_tuple in bjw_result])
+            scores = np.array([result_tuple[1] for result_tuple in bjw_result])
+            matches[positions[scores > ans_thresh]] = True
+        return matches, len(candidates)
+
+
+def answer_forms_test():
+    '''
+    Checks that titles with "and", "or" or commas stay one form, so their
+    words never become aliases of other answers, and that alternates,
+    prompts and rejects are still told apart.
+    '''
+    cases = {
+        'Romeo and Juliet [accept Romeo and Juliet]': ['Romeo and Juliet', 'Romeo and Juliet'],
+        'Rock or Paper': ['Rock or Paper'],
+        'The Good, the Bad and the Ugly [or Il buono, il brutto, il cattivo]':
+            ['The Good, the Bad and the Ugly', 'Il buono, il brutto, il cattivo'],
+        'Queen (band)': ['Queen'],
+        'Lewis Carroll (or Charles Dodgson)': ['Lewis Carroll', 'Charles Dodgson'],
+        'databases [or DBs; accept relational databases; prompt on data]':
+            ['databases', 'DBs', 'relational databases'],
+        'databases [or DBs, prompt on "data"]': ['databases', 'DBs'],
+        'carbon monoxide [or CO; do not accept "carbon dioxide"]': ['carbon monoxide', 'CO'],
+        'Hamlet [accept Prince of Denmark until mentioned]': ['Hamlet'],
+        'Paris [accept any underlined portion]': ['Paris'],
+        'The Divine Comedy [accept clear-knowledge equivalents]': ['The Divine Comedy'],
+        'fast [accept synonyms]': ['fast'],
+        'democracy [accept word forms like "democratic"]': ['democracy'],
+        'sulfur [or S; accept any part of "brimstone"]': ['sulfur', 'S'],
+    }
+    for answer_line, expected in cases.items():
+        forms = answer_forms(answer_line)
+        assert forms == expected, f"{answer_line!r}: {forms}"
+
+    aliases, blocks = answer_keys('Romeo and Juliet [accept Romeo and Juliet]')
+    assert aliases == {'romeojuliet'}, aliases
+    assert 'romeo' in blocks and 'juliet' in blocks, blocks
+    aliases, blocks = answer_keys('Rock or Paper')
+    assert 'rock' not in aliases and 'paper' not in aliases, aliases
+    assert '^rock' in blocks and '^pape' in blocks, blocks
+
+    # shared instructions, one-letter aliases and aliases of many unrelated
+    # answers must not make answers match outright
+    lines = ['Paris [accept any underlined portion]', 'Berlin [accept any underlined portion]',
+             'sulfur [or S]', 'Superman [or S]', 'databases [or DBs]', 'DBs',
+             'Cronus [or Saturn]', 'Sega Saturn [or Saturn]', 'Saturn V [or Saturn]']
+    simple = [distill(line, answerline=True) for line in lines]
+    unique_strs = np.unique(simple)
+    unique_idxs = np.searchsorted(unique_strs, simple)
+    index = AnswerIndex(unique_strs, unique_idxs, lines, max_alias_postings=2)
+    def aliased(line):
+        unique_i = unique_idxs[lines.index(line)]
+        return set(unique_strs[index.alias_matches(unique_i)])
+    assert aliased('Paris [accept any underlined portion]') == {'paris'}
+    assert aliased('sulfur [or S]') == {'sulfur'}
+    assert aliased('DBs') == {'dbs', 'databases'}
+    assert aliased('Cronus [or Saturn]') == {'cronus'}
+    print("answer_forms_test passed")
@@ -0,0 +1,172 @@
+import gzip
+import glob
+import io
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import pandas as pd
+from tqdm import tqdm
+from utility import arrow_strings
+
+METADATA_COLUMNS = ['subcategory', 'category', 'type', 'difficulty', 'setName',
+                    'setYear']
+TOSSUP_COLUMNS = ['question', 'answer'] + METADATA_COLUMNS
+BONUS_COLUMNS = ['leadin', 'parts', 'answers'] + METADATA_COLUMNS
+#with pyarrow_strings, rows read are converted to Arrow this many at a time
+ARROW_CHUNK_ROWS = 20000
+
+
+def find_shards(source):
+    '''Split the backup files in a directory or matching a glob into tossup
+    and bonus shards, by filename.
+
+    Inputs:
+        -source (str): directory, or glob such as 'backup/*.jsonl.gz'
+    Returns (tuple of lists of strs): tossup shard paths, bonus shard paths'''
+
+    if os.path.isdir(source):
+        source = os.path.join(source, '*')
+    paths = sorted(path for path in glob.glob(source) if os.path.isfile(path))
+    tossup_files = [path for path in paths if 'tossup' in os.path.basename(path).lower()]
+    bonus_files = [path for path in paths if 'bonus' in os.path.basename(path).lower()]
+    skipped = [path for path in paths if path not in tossup_files and path not in bonus_files]
+    if len(skipped) > 0:
+        print(f"WARNING: skipping {len(skipped)} files at {source} whose names contain " +
+              f"neither 'tossup' nor 'bonus': {', '.join(skipped)}")
+    assert len(tossup_files) + len(bonus_files) > 0, f"No tossup or bonus shards found at {source}"
+    print(f"Found {len(tossup_files)} tossup shards and {len(bonus_files)} bonus shards")
+    return tossup_files, bonus_files
+
+
+def read_backup_files(filepaths, columns, workers=None, pyarrow_strings=False, **filters):
+    '''Read several backup shards with read_backup_file(), in parallel when
+    there is more than one, and join them in filepath order.
+
+    Inputs:
+        -filepaths (list of strs): shards to read
+        -columns (list of strs): fields to keep from each record
+        -workers (int or None): most processes to use; None uses every core
+        -pyarrow_strings, filters: see intake()
+    Returns (pandas DataFrame): one row per kept question'''
+
+    if len(filepaths) == 0:
+        return pd.DataFrame(columns=columns)
+    if len(filepaths) == 1 or workers == 1:
+        frames = [read_backup_file(path, columns, pyarrow_strings=pyarrow_strings, **filters)
+                  for path in filepaths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(partial(read_backup_file, columns=columns,
+                                           pyarrow_strings=pyarrow_strings, **filters),
+                                   filepaths))
+    return pd.concat(frames, axis=0, ignore_index=True)
+
+
+def open_backup_file(filepath):
+    '''Open a backup file as text, decompressing .gz and .zst files on the fly.
+    Reading .zst files needs the zstandard package. Multi-frame .zst files
+    (from pzstd, zstd -T or concatenated shards) are read to the end.'''
+
+    if filepath.endswith('.gz'):
+        return gzip.open(filepath, 'rt', encoding='utf-8')
+    if filepath.endswith('.zst'):
+        import zstandard
+        reader = zstandard.ZstdDecompressor().stream_reader(open(filepath, 'rb'), closefd=True,
+                                                            read_across_frames=True)
+        return io.TextIOWrapper(reader, encoding='utf-8')
+    return open(filepath, encoding='utf-8')
+
+
+def read_backup_file(
+        filepath,
+        columns,
+        difficulties=None,
+        categories=None,
+        subcategories=None,
+        years=None,
+        pyarrow_strings=False
+):
+    '''Stream a QBReader backup JSONL file into a DataFrame, projecting each
+    record down to the given columns and dropping records that fail any filter
+    before they are stored.
+
+    Inputs:
+        -filepath (str): location of tossups.json, bonuses.json or one shard
+        of either (see open_backup_file())
+        -columns (list of strs): fields to keep from each record
+        -difficulties, categories, subcategories, years, pyarrow_strings:
+        see intake()
+    Returns (pandas DataFrame): one row per kept question'''
+
+    if difficulties is not None:
+        difficulties = set(difficulties)
+    if categories is not None:
+        categories = set(categories)
+    if subcategories is not None:
+        subcategories = set(subcategories)
+
+    rows, chunks = [], []
+    with open_backup_file(filepath) as f:
+        for line in tqdm(f, desc=f"Reading {filepath}"):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            #MongoDB integers are fixed here so the filters can compare them
+            record['difficulty'] = mongo_fix(record.get('difficulty'))
+            record['setYear'] = mongo_fix(record.get('setYear'))
+            if not passes_filters(record, difficulties, categories,
+                                  subcategories, years):
+                continue
+            rows.append({col: record.get(col) for col in columns})
+            #so the whole file is never held as Python strings
+            if pyarrow_strings and len(rows) == ARROW_CHUNK_ROWS:
+                chunks.append(arrow_strings(pd.DataFrame(rows, columns=columns)))
+                rows = []
+
+    questions = pd.DataFrame(rows, columns=columns)
+    if pyarrow_strings:
+        questions = pd.concat(chunks + [arrow_strings(questions)], ignore_index=True)
+    print(f"Kept {len(questions)} questions from {filepath}")
+    return questions
+
+
+def passes_filters(record, difficulties, categories, subcategories, years):
+    '''Check a single backup record against the user's selections. A filter
+    that is None lets everything through.
+
+    Inputs:
+        -record (dict): one parsed line of a backup file
+        -difficulties, categories, subcategories (sets or None)
+        -years (tuple of two ints or None)
+    Returns (boolean): whether to keep the record'''
+
+    if difficulties is not None and record['difficulty'] not in difficulties:
+        return False
+    if categories is not None and record.get('category') not in categories:
+        return False
+    if subcategories is not None and record.get('subcategory') not in subcategories:
+        return False
+    if years is not None and not (years[0] <= record['setYear'] <= years[1]):
+        return False
+    return True
+
+
+def mongo_fix(obj):
+    '''Turns a MongoDB representation of an integer from the QBReader database
+    into an integer. Uses 0 for missing values.
+    
+    Inputs:
+        -obj (dict): the {$...} JSON object
+    Returns (int): Integer representation'''
+
+    if type(obj) == int:
+        return obj
+
+    strobj = str(obj)
+    try:
+        fixed_obj = int(re.search(r"[0-9]{1,4}", strobj).group(0))
+    except AttributeError:
+        fixed_obj = 0
+    return fixed_obj
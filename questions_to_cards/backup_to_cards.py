@@ -10,11 +10,23 @@ import pandas as pd
 import numpy as np
 import re
 import os
+import json
+import time
+import io
+import sys
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from tqdm import tqdm
-from text_processing import tokenize_and_explode, cleanup, my_split, clean_clue_text, clean_answer_text
-from utility import write_out
-from similarity import remove_redundancies
+from text_processing import (tokenize_and_explode, cleanup, explode_clean, split_and_clean,
+                             clean_answer_text, BRACKET_RE)
+from backup_io import (find_shards, read_backup_files, read_backup_file, mongo_fix,
+                       TOSSUP_COLUMNS, BONUS_COLUMNS)
+from utility import (write_out, arrow_strings, uses_arrow_strings, str_values,
+                     TEXT_COLUMNS, ARROW_STRING)
+from dedup_estimate import estimate_redundancy_cost
+from similarity import (remove_redundancies, fingerprint_dedup, fingerprint_clue,
+                        distill, normalize_column, add_normalized_columns)
 
 tqdm.pandas()
 
@@ -23,17 +35,71 @@ NUM_BONUS_PARTS = 3
 COLUMNS_TO_KEEP = ['clue', 'answer', 'subcategory', 'category', 'type', 
                    'difficulty', 'setName', 'setYear']
 
-def intake():
-    '''Read in tossups.json and bonuses.json'''
+#columns a preview sample is stratified by; tossups and bonuses are sampled separately
+PREVIEW_STRATA = ['category', 'difficulty', 'setYear']
+
+#columns tagstring() reads
+TAG_COLUMNS = ['category', 'subcategory', 'difficulty', 'setYear', 'setYears', 'type', 'len']
+
+def intake(
+        difficulties=None,
+        categories=None,
+        subcategories=None,
+        years=None,
+        qtype='all',
+        source=None,
+        workers=None,
+        pyarrow_strings=False
+):
+    '''Read in tossups.json and bonuses.json, keeping only the questions and
+    columns the rest of the pipeline needs.
+
+    Filters are applied line by line while the JSONL is read, so a narrow
+    selection never materializes the full backup in memory.
+
+    The backup can also be split into many shards, plain or compressed
+    (.gz, .zst). Pass a directory or glob as source: files with 'tossup' in
+    their name are read as tossups and files with 'bonus' as bonuses, one
+    shard per worker process.
 
-    assert ('tossups.json' in os.listdir() and
-            'bonuses.json' in os.listdir()), "You don't have the qbreader backup files in this directory!"
-    
-    tossups = pd.read_json("tossups.json",lines=True)
+    Inputs:
+        -difficulties (iterable of ints or None): difficulties to keep
+        -categories (iterable of strs or None): top-level categories to keep
+        -subcategories (iterable of strs or None): subcategories to keep
+        -years (tuple of two ints or None): inclusive (first, last) setYear range
+        -qtype (str): 'tossup', 'bonus', or 'all'
+        -source (str or None): directory or glob of backup shards; None reads
+        tossups.json and bonuses.json from the current directory
+        -workers (int or None): processes to read shards with; None uses
+        every core
+        -pyarrow_strings (boolean): store text columns as string[pyarrow]
+        instead of Python objects (see utility.arrow_strings()). Each shard
+        is converted as soon as it is read.
+    Returns (tuple of DataFrames): tossups, bonuses'''
+
+    if source is None:
+        assert ('tossups.json' in os.listdir() and
+                'bonuses.json' in os.listdir()), "You don't have the qbreader backup files in this directory!"
+        tossup_files, bonus_files = ["tossups.json"], ["bonuses.json"]
+    else:
+        tossup_files, bonus_files = find_shards(source)
+
+    filters = {'difficulties': difficulties, 'categories': categories,
+               'subcategories': subcategories, 'years': years}
+
+    if qtype in ['tossup', 'all']:
+        tossups = read_backup_files(tossup_files, TOSSUP_COLUMNS, workers, pyarrow_strings, **filters)
+    else:
+        tossups = pd.DataFrame(columns=TOSSUP_COLUMNS)
     tossups.rename(columns={'question':'clue'}, inplace=True)
 
-    bonuses = pd.read_json("bonuses.json",lines=True)
+    if qtype in ['bonus', 'all']:
+        bonuses = read_backup_files(bonus_files, BONUS_COLUMNS, workers, pyarrow_strings, **filters)
+    else:
+        bonuses = pd.DataFrame(columns=BONUS_COLUMNS)
 
+    if pyarrow_strings:
+        tossups, bonuses = arrow_strings(tossups), arrow_strings(bonuses)
     return tossups, bonuses
 
 
@@ -115,6 +181,10 @@ def put_together(tossups, bonus_parts):
     assert list(bonus_parts.columns) == COLUMNS_TO_KEEP, "Bonus parts are not properly processed yet!"
 
     tossups = tossups.rename(columns={'question':'clue'}).loc[:,COLUMNS_TO_KEEP]
+    #bonus parts come out of lists as objects, so put them back in Arrow;
+    #concatenating Arrow with objects would turn every string into an object
+    if uses_arrow_strings(tossups) or uses_arrow_strings(bonus_parts):
+        tossups, bonus_parts = arrow_strings(tossups), arrow_strings(bonus_parts)
 
     clues = pd.concat((tossups, bonus_parts), axis=0)
     clues.reset_index(drop=True, inplace=True)
@@ -122,23 +192,88 @@ def put_together(tossups, bonus_parts):
     return clues
 
 
-def mongo_fix(obj):
-    '''Turns a MongoDB representation of an integer from the QBReader database
-    into an integer. Uses 0 for missing values.
-    
+def question_keys(clues):
+    '''
+    Key each tossup or bonus part by its type, fingerprinted text (see
+    fingerprint_clue()) and distilled answer line, for question_dedup().
+
     Inputs:
-        -obj (dict): the {$...} JSON object
-    Returns (int): Integer representation'''
+        -clues (pandas DataFrame): put_together() output
+    Returns (numpy array): one hash per row
+    '''
+    print("Fingerprinting questions and answers...")
+    #answer lines are still raw here, so formatting tags are dropped first
+    question_fps = normalize_column(clues.loc[:,'clue']).map(
+        lambda x: fingerprint_clue(x, normalized=True))
+    answers = str_values(clues.loc[:,'answer']).str.replace(BRACKET_RE, '', regex=True)
+    answer_fps = normalize_column(answers, answerline=True).map(
+        lambda x: distill(x, answerline=True, normalized=True))
+    # a bonus leadin and a tossup with the same text are still different cards
+    return pd.util.hash_array(
+        (str_values(clues.loc[:,'type']) + '|' + question_fps + '|' + answer_fps).to_numpy(dtype=object))
+
+
+def question_dedup(clues, keys=None):
+    '''
+    Collapse copies of the same tossup or bonus part that appear in several
+    sets (mirrors, re-releases, packet archives) before they are split into
+    clues. Questions match if their fingerprinted text (see fingerprint_clue())
+    and distilled answer line are the same, so copies that differ only in
+    case, accents, punctuation or stopwords are merged too.
 
-    if type(obj) == int:
-        return obj
+    The first copy is kept, with two new columns recording where every copy
+    came from: setNames (set names joined by '; ') and setYears (years
+    joined by spaces), which tagstring() turns into one yr:: tag per year.
 
-    strobj = str(obj)
-    try:
-        fixed_obj = int(re.search(r"[0-9]{1,4}", strobj).group(0))
-    except AttributeError:
-        fixed_obj = 0
-    return fixed_obj
+    Inputs:
+        -clues (pandas DataFrame): put_together() output
+        -keys (array or None): question_keys() of these rows, if already
+        computed (e.g. once for a whole backup that is then filtered)
+    Returns (pandas DataFrame): one row per distinct question
+    '''
+    clues = clues.reset_index(drop=True)
+    if keys is None:
+        keys = question_keys(clues)
+    keys = pd.Series(np.asarray(keys), index=clues.index)
+
+    #distinct (key, value) pairs, sorted, then joined per key; much faster
+    #than calling a Python function on every group
+    def join_distinct(values, sep):
+        pairs = pd.DataFrame({'key': keys, 'value': values}).dropna().drop_duplicates()
+        pairs = pairs.sort_values(by='value', kind='stable')
+        return pairs.loc[:,'value'].astype(str).groupby(pairs.loc[:,'key']).agg(sep.join)
+    set_names = join_distinct(clues.loc[:,'setName'].astype(object), '; ')
+    set_years = join_distinct(clues.loc[:,'setYear'].map(mongo_fix), ' ')
+
+    keep = ~keys.duplicated()
+    deduped = clues.loc[keep, :].copy()
+    deduped.loc[:,'setNames'] = keys[keep].map(set_names).fillna('').to_numpy()
+    deduped.loc[:,'setYears'] = keys[keep].map(set_years).fillna('').to_numpy()
+    if uses_arrow_strings(clues):
+        deduped = arrow_strings(deduped)
+
+    num_removed = len(clues) - len(deduped)
+    print(f"Question dedup removed {num_removed} of {len(clues)} questions " +
+          f"({100 * num_removed / max(len(clues), 1):.1f}%)")
+    return deduped.reset_index(drop=True)
+
+
+def normalize_length(clues):
+    '''
+    Replace the 'len' column with each clue's length in whole standard
+    deviations from the mean clue length, capped at 7, for the length:: tag.
+    '''
+    print("Normalizing length column...")
+    clues.loc[:,'len'] = clues.loc[:,'clue'].str.len() #recalculate
+    LEN_MEAN = clues.loc[:,'len'].agg(np.mean)
+    print(f"Mean clue length: {LEN_MEAN}")
+    LEN_STD = clues.loc[:,'len'].agg(np.std)
+    print(f"Clue length standard deviation: {LEN_STD}")
+    clues.loc[:,'len'] = (clues.loc[:,'len'] - LEN_MEAN) / LEN_STD
+    clues.loc[:,'len'] = clues.loc[:,'len'].apply(np.floor).astype(int)
+    #clues 7+ stdev above mean can be lumped together
+    clues.loc[:,'len'] = clues.loc[:,'len'].apply(lambda x: min(7, x))
+    return clues
 
 
 def tagstring(row):
@@ -160,11 +295,15 @@ def tagstring(row):
     except:
         subcat = "NA"
     diff = row['difficulty']
-    yr = row['setYear']
-    type = row['type']
+    #merged copies of a question (see question_dedup()) get a tag for each year
+    years = row.get('setYears')
+    if type(years) != str or years == '':
+        years = str(row['setYear'])
+    yr_tags = ' '.join(f"yr::{yr}" for yr in years.split())
+    qtype = row['type']
     length = row['len']
 
-    tag_str = f"cat::{cat}::{subcat} diff::{diff} yr::{yr} type::{type} length::{length}"
+    tag_str = f"cat::{cat}::{subcat} diff::{diff} {yr_tags} type::{qtype} length::{length}"
     #reduce redundant subcats like "Religion::Religion" to just cat
     CAT_RE = re.compile(r"(Religion|Mythology|Philosophy|Social Science|Geography|Current Events|Trash)::\1")
     tag_str = re.sub(CAT_RE, r"\1", tag_str)
@@ -175,6 +314,93 @@ def tagstring(row):
     # re.IGNORECASE)
     
 
+def tag_column(clues):
+    '''
+    tagstring() of every row. Only the columns it reads are passed to the
+    row-wise apply, which would otherwise turn every Arrow text column (clues
+    included) into Python strings for the length of the apply.
+
+    Returns (pandas Series): tags, same index as clues
+    '''
+    columns = [col for col in TAG_COLUMNS if col in clues.columns]
+    return clues.loc[:, columns].progress_apply(lambda x: tagstring(x), axis=1)
+
+
+def clean_clues(tossups, bonuses, normalize_len=True, pyarrow_strings=False, norm_cache=None,
+                timed=None):
+    '''
+    Every stage of run() between intake() and redundancy removal: turns
+    tossups and bonuses into one tagged table of cleaned, deduplicated clues.
+    run(), preview() and profile_string_dtype() all go through here, so they
+    always run the same stages in the same order.
+
+    Inputs:
+        -tossups, bonuses (pandas DataFrames): as returned by intake()
+        -normalize_len (boolean): whether to run normalize_length()
+        -pyarrow_strings (boolean): whether to convert text columns to
+        string[pyarrow] once the tags are added
+        -norm_cache (str or None): .feather file to cache normalized clue and
+        answer text in; see add_normalized_columns()
+        -timed (function): called as timed(stage, func, *args) to run each
+        stage, e.g. to time it; by default each stage is just called
+    Returns (pandas DataFrame): the clues
+    '''
+    if timed is None:
+        timed = lambda stage, func, *args: func(*args)
+
+    print("Splitting bonuses into parts...")
+    bonuses = timed('reformat', reformat, bonuses)
+
+    print("Putting tosusps and bonuses into single DataFrame...")
+    clues = timed('put_together', put_together, tossups, bonuses)
+
+    print("Collapsing questions repeated across sets...")
+    clues = timed('question_dedup', question_dedup, clues)
+
+    print("Fixing MongoDB junk in columns...")
+    def fix_columns(clues):
+        clues.loc[:,'setYear'] = clues.loc[:,'setYear'].apply(lambda x: mongo_fix(x))
+        clues.loc[:,'difficulty'] = clues.loc[:,'difficulty'].apply(lambda x: mongo_fix(x))
+        return clues
+    clues = timed('mongo_fix', fix_columns, clues)
+
+    #one pass per question instead of tokenize_and_explode(), removing
+    #repeat clues (about 103536 rows) and cleanup() over the whole table
+    print("Splitting, filtering and cleaning each question's clues...")
+    clues = timed('explode_clean', explode_clean, clues)
+
+    clues = timed('normalize_text', add_normalized_columns, clues, norm_cache)
+
+    print("Eliminating clues that repeat up to case, punctuation and accents...")
+    clues = timed('fingerprint_dedup', fingerprint_dedup, clues)
+
+    #clean length here
+    if normalize_len:
+        clues = timed('normalize_length', normalize_length, clues)
+
+    print("Generating Anki tags...")
+    clues['tags'] = timed('tagstring', tag_column, clues)
+    if pyarrow_strings:
+        clues = arrow_strings(clues)
+    return clues
+
+
+def add_simple_answers(clues):
+    '''
+    Add the 'simple_answer' column that the redundancy estimate and
+    remove_redundancies() group clues by. It is stored as string[pyarrow]
+    when the rest of the text columns are.
+
+    Returns (pandas DataFrame): clues, with 'simple_answer'
+    '''
+    print("Simplifying answer lines...")
+    clues.loc[:,'simple_answer'] = clues.loc[:,'norm_answer'].progress_apply(
+        lambda x: distill(x, answerline=True, normalized=True))
+    if uses_arrow_strings(clues):
+        clues = arrow_strings(clues)
+    return clues
+
+
 ###TESTS###  
 
 def single_question_test(qtext, atext=''):
@@ -192,17 +418,7 @@ def single_question_test(qtext, atext=''):
     if atext is None:
         atext = ''
 
-    ANSWER_FOLLOWING_RE = re.compile('(Answer|Identify|Respond appropriately to) (th(e|is)|these|some) (following|questions)',
-                                     re.IGNORECASE)
-    
-    NO_CLUE_BONUS_LEADIN_RE = re.compile('(identify|name|give) (these|three|some).+(for 10 points each|ftpe)',
-                                         re.IGNORECASE)
-
-    qlist = my_split(qtext)
-    qlist = [str for str in qlist if not re.search(ANSWER_FOLLOWING_RE, str)]
-    qlist = [str for str in qlist if not re.search(NO_CLUE_BONUS_LEADIN_RE, str)]
-    qlist = [clean_clue_text(clue) for clue in qlist]
-    qlist = [clue for clue in qlist if len(clue) > 25]
+    qlist = [clue for _, clue in split_and_clean(qtext)]
 
     alist = [clean_answer_text(atext)]
 
@@ -258,69 +474,358 @@ def intake_test(tokenized=True, add_len_col=True, drop_repeats=True, clean_up=Tr
     print("Done")
     return clues
 
-def run(normalize_len=True, write_to_file=True):
+def zst_shard_test():
     '''
-    Runs the whole data transformation pipeline to turn QBReader database backups
-    into a file that is ready to import into Anki as flashcards.
-    #TODO: Add some parameters to restrict to subsets of the data
+    Checks that a .zst shard written as two frames (as pzstd, zstd -T and
+    concatenated shards are) is read to the end. Needs the zstandard package.
     '''
-    print("Reading in tossups and bonuses from QBReader backup file...")
-    tossups, bonuses = intake()
-    #pd.options.display.max_colwidth = max_tossup_length(tossups)
+    import tempfile
+    import zstandard
+    records = [{'question': f"This is question {i}.", 'answer': f"answer {i}",
+                'category': 'Science', 'subcategory': 'Biology', 'type': 'tossup',
+                'difficulty': 3, 'setName': '2020 ACF Fall', 'setYear': 2020} for i in range(4)]
+    lines = [json.dumps(record) + '\n' for record in records]
+    compressor = zstandard.ZstdCompressor()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, 'tossups_0.jsonl.zst')
+        with open(filepath, 'wb') as f:
+            f.write(compressor.compress(''.join(lines[:2]).encode('utf-8')))
+            f.write(compressor.compress(''.join(lines[2:]).encode('utf-8')))
+        with contextlib.redirect_stdout(io.StringIO()):
+            tossups = read_backup_file(filepath, TOSSUP_COLUMNS)
+    assert len(tossups) == len(records), f"Read {len(tossups)} of {len(records)} questions"
+    assert tossups.loc[3, 'question'] == "This is question 3."
+    print("zst_shard_test passed")
+
+
+def question_dedup_test():
+    '''
+    Checks that copies of a question in two sets merge into one row, and that
+    the row's tags carry a yr:: tag for each year. Cards of questions that
+    appear in one set are tagged as before.
+    '''
+    clues = pd.DataFrame({
+        'clue': ['This man wrote Hamlet.', 'This  man wrote HAMLET', 'This city is Paris.'],
+        'answer': ['William Shakespeare', 'William <b>Shakespeare</b>', 'Paris'],
+        'subcategory': ['Drama', 'Drama', 'Europe'],
+        'category': ['Literature', 'Literature', 'Geography'],
+        'type': ['tossup'] * 3,
+        'difficulty': [3, 3, 2],
+        'setName': ['2019 ACF Fall', '2012 ACF Fall', '2019 ACF Fall'],
+        'setYear': [2019, 2012, 2019]})
+    with contextlib.redirect_stdout(io.StringIO()):
+        deduped = question_dedup(clues)
+    deduped.loc[:,'len'] = deduped.loc[:,'clue'].str.len()
+    tags = tag_column(deduped).tolist()
+
+    assert len(deduped) == 2, deduped
+    assert deduped.loc[0, 'setNames'] == '2012 ACF Fall; 2019 ACF Fall'
+    assert deduped.loc[0, 'setYears'] == '2012 2019'
+    assert tags[0] == "cat::Literature::Drama diff::3 yr::2012 yr::2019 type::tossup length::22", tags[0]
+    assert tags[1] == "cat::Geography::Europe diff::2 yr::2019 type::tossup length::19", tags[1]
+    print("question_dedup_test passed")
+
+
+def allocate_sample(sizes, num):
+    '''
+    Split num draws among groups of the given sizes: in proportion to size,
+    with the draws left over by rounding down going to the groups with the
+    largest remainders, and at least one draw per non-empty group when num
+    allows.
 
-    print("Splitting bonuses into parts...")
-    bonuses = reformat(bonuses)
+    Inputs:
+        -sizes (array of ints): number of rows in each group
+        -num (int): total rows to draw
+    Returns (numpy array of ints): rows to draw from each group
+    '''
+    sizes = np.asarray(sizes, dtype=np.int64)
+    num = min(int(num), int(sizes.sum()))
+    quotas = sizes * num / max(sizes.sum(), 1)
+    counts = np.floor(quotas).astype(np.int64)
+    if num >= (sizes > 0).sum():
+        counts = np.maximum(counts, (sizes > 0).astype(np.int64))
+    #the minimum of one per group can overshoot; take back from the groups
+    #furthest above their quota
+    while counts.sum() > num:
+        order = np.argsort(quotas - counts, kind='stable')
+        order = order[counts[order] > 1][:counts.sum() - num]
+        counts[order] -= 1
+    while counts.sum() < num:
+        order = np.argsort(counts - quotas, kind='stable')
+        order = order[counts[order] < sizes[order]][:num - counts.sum()]
+        counts[order] += 1
+    return counts
+
+
+def stratified_sample(questions, frac, seed=0):
+    '''
+    Draw the same fraction of questions from every combination of category,
+    difficulty and year, so a small sample has the full corpus's mix. The
+    sample has round(frac * len(questions)) rows, split among the strata by
+    allocate_sample(), so small strata aren't rounded away.
 
-    print("Putting tosusps and bonuses into single DataFrame...")
-    clues = put_together(tossups, bonuses)
+    Inputs:
+        -questions (pandas DataFrame): tossups or bonuses from intake()
+        -frac (float): fraction of questions to keep
+        -seed (int): random seed, so the same preview can be rerun
+    Returns (pandas DataFrame): sampled questions in original order
+    '''
+    if len(questions) == 0:
+        return questions
+    strata = list(questions.groupby(PREVIEW_STRATA, dropna=False).indices.values())
+    counts = allocate_sample([len(rows) for rows in strata], round(frac * len(questions)))
+    rng = np.random.default_rng(seed)
+    chosen = [rng.choice(rows, size=count, replace=False) for rows, count in zip(strata, counts)]
+    return questions.iloc[np.sort(np.concatenate(chosen))]
+
+
+def preview(
+        sample_size=2000,
+        seed=0,
+        dedup=True,
+        normalize_len=True,
+        difficulties=None,
+        categories=None,
+        subcategories=None,
+        years=None,
+        qtype='all',
+        source=None,
+        pyarrow_strings=False
+):
+    '''
+    Runs every stage of run(), including redundancy removal, on a seeded
+    stratified sample of the backup, so changes to splitting and cleaning
+    rules can be checked in seconds. Prints how long each stage took and how
+    long it would take on the full selection.
 
-    print("Splitting questions and parts into individual clues...")
-    clues = tokenize_and_explode(clues)
+    Projections scale the measured time by the ratio of full to sampled
+    questions. Redundancy removal compares each clue against every answer, so
+    its projection is scaled by the square of that ratio.
 
-    print("Fixing MongoDB junk in columns...")
-    clues.loc[:,'setYear'] = clues.loc[:,'setYear'].apply(lambda x: mongo_fix(x))
-    clues.loc[:,'difficulty'] = clues.loc[:,'difficulty'].apply(lambda x: mongo_fix(x))
+    Inputs:
+        -sample_size (int): roughly how many questions to sample
+        -seed (int): random seed for the sample
+        -dedup (boolean): whether to run remove_redundancies() (needs spaCy
+        and batch_jaro_winkler)
+        -normalize_len (boolean): as in run()
+        -difficulties, categories, subcategories, years, qtype, source,
+        pyarrow_strings: see intake()
+    Returns (pandas DataFrame): the sample's cards, as run() would return them
+    '''
+    timings = []
+    def timed(stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings.append((stage, time.perf_counter() - start))
+        return result
 
-    print("Adding a column for clue length...")
-    clues.loc[:,'len'] = clues.loc[:,'clue'].str.len()
+    print("Reading in tossups and bonuses from QBReader backup file...")
+    start = time.perf_counter()
+    tossups, bonuses = intake(difficulties=difficulties,
+                              categories=categories,
+                              subcategories=subcategories,
+                              years=years,
+                              qtype=qtype,
+                              source=source,
+                              pyarrow_strings=pyarrow_strings)
+    intake_time = time.perf_counter() - start
+    num_questions = len(tossups) + len(bonuses)
+    frac = min(1.0, sample_size / max(num_questions, 1))
+    tossups = stratified_sample(tossups, frac, seed)
+    bonuses = stratified_sample(bonuses, frac, seed)
+    scale = num_questions / max(len(tossups) + len(bonuses), 1)
+    print(f"Previewing {len(tossups)} tossups and {len(bonuses)} bonuses " +
+          f"(1 in {scale:.1f} of {num_questions} questions, seed {seed})")
+
+    clues = clean_clues(tossups, bonuses, normalize_len=normalize_len,
+                        pyarrow_strings=pyarrow_strings, timed=timed)
+    if dedup:
+        clues = timed('remove_redundancies', remove_redundancies, clues)
+
+    print("\nPREVIEW STAGE TIMES")
+    print(f"{'stage':<28}{'sample (s)':>12}{'projected (s)':>16}")
+    print(f"{'intake (full read)':<28}{intake_time:>12.2f}{intake_time:>16.2f}")
+    total = intake_time
+    for stage, seconds in timings:
+        projected = seconds * (scale ** 2 if stage == 'remove_redundancies' else scale)
+        total += projected
+        print(f"{stage:<28}{seconds:>12.2f}{projected:>16.2f}")
+    print(f"Projected full run: {total / 60:.1f} minutes")
+    return clues
 
-    print("Eliminating repeat clues...") #removes about 103536 rows
-    clues.drop_duplicates('clue', inplace=True)
 
-    print("Cleaning up remaining clues...")
-    clues = cleanup(clues)
+def profile_string_dtype(pyarrow_strings, source=None, repeats=5, **filters):
+    '''
+    Stage times, string operation times and memory of one pass of run()'s
+    stages up to redundancy removal, with or without Arrow-backed text
+    columns. With them, checks that every text column is still Arrow-backed.
+    Meant to run in a fresh process (see string_dtype_benchmark()), so peak
+    memory reflects only this pass.
 
-    #clean length here
-    if normalize_len:
-        print("Normalizing length column...")
-        clues.loc[:,'len'] = clues.loc[:,'clue'].str.len() #recalculate
-        LEN_MEAN = clues.loc[:,'len'].agg(np.mean)
-        print(f"Mean clue length: {LEN_MEAN}")
-        LEN_STD = clues.loc[:,'len'].agg(np.std)
-        print(f"Clue length standard deviation: {LEN_STD}")
-        clues.loc[:,'len'] = (clues.loc[:,'len'] - LEN_MEAN) / LEN_STD
-        clues.loc[:,'len'] = clues.loc[:,'len'].apply(np.floor).astype(int)
-        #clues 7+ stdev above mean can be lumped together
-        clues.loc[:,'len'] = clues.loc[:,'len'].apply(lambda x: min(7, x))
+    Inputs:
+        -pyarrow_strings, source, filters: see intake()
+        -repeats (int): each string operation's time is its best of this many
+    Returns (dict): 'stages' and 'string_ops' (dicts of seconds), 'frame_mb'
+    (deep memory of the finished clue table) and 'peak_mb' (peak resident
+    memory of the process)
+    '''
+    import resource
+    stages = {}
+    def timed(stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        stages[stage] = time.perf_counter() - start
+        return result
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        tossups, bonuses = timed('intake', intake, source=source,
+                                 pyarrow_strings=pyarrow_strings, **filters)
+        clues = clean_clues(tossups, bonuses, pyarrow_strings=pyarrow_strings, timed=timed)
+        clues = timed('simple_answer', add_simple_answers, clues)
+    if pyarrow_strings:
+        not_arrow = [col for col in TEXT_COLUMNS
+                     if col in clues.columns and clues[col].dtype != ARROW_STRING]
+        assert not not_arrow, f"text columns not stored as {ARROW_STRING}: {not_arrow}"
+
+    string_ops = {
+        'clue.str.len': lambda: clues.loc[:,'clue'].str.len(),
+        'clue.str.contains': lambda: clues.loc[:,'clue'].str.contains('this', case=False),
+        'clue.str.lower': lambda: clues.loc[:,'clue'].str.lower(),
+        'answer.str.contains': lambda: clues.loc[:,'answer'].str.contains('accept', regex=False),
+        'clue.duplicated': lambda: clues.loc[:,'clue'].duplicated(),
+        'answer.isin': lambda: clues.loc[:,'answer'].isin(clues.loc[:,'answer'].iloc[::7]),
+    }
+    op_times = {}
+    for op, func in string_ops.items():
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        op_times[op] = min(times)
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+    return {'stages': stages, 'string_ops': op_times, 'rows': len(clues),
+            'frame_mb': clues.memory_usage(deep=True).sum() / 2**20, 'peak_mb': peak_mb}
+
+
+def string_dtype_benchmark(source=None, repeats=5, **filters):
+    '''
+    Compare run()'s stages up to redundancy removal on object text columns (the
+    default) and on string[pyarrow] columns (run(pyarrow_strings=True)).
+    Each variant runs in its own fresh process, so their peak memory can be
+    compared. Prints and returns a table of stage times, string operation
+    times and memory, with the Arrow to object ratio of each.
 
-    print("Generating Anki tags...")
-    clues['tags'] = clues.progress_apply(lambda x: tagstring(x), axis=1)
+    Inputs:
+        -source, filters: see intake()
+        -repeats (int): see profile_string_dtype()
+    Returns (pandas DataFrame): 'object', 'arrow' and 'ratio' of each measure
+    '''
+    import multiprocessing
+    results = {}
+    for label, pyarrow_strings in [('object', False), ('arrow', True)]:
+        print(f"Profiling {label} text columns in a fresh process...")
+        with ProcessPoolExecutor(max_workers=1,
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            results[label] = pool.submit(profile_string_dtype, pyarrow_strings, source,
+                                         repeats, **filters).result()
+
+    rows = {}
+    for label, result in results.items():
+        column = {f"{stage} (s)": seconds for stage, seconds in result['stages'].items()}
+        column['pipeline total (s)'] = sum(result['stages'].values())
+        column.update({f"{op} (s)": seconds for op, seconds in result['string_ops'].items()})
+        column['clue table (MB)'] = result['frame_mb']
+        column['peak memory (MB)'] = result['peak_mb']
+        rows[label] = column
+    report = pd.DataFrame(rows)
+    report.loc[:, 'ratio'] = report.loc[:, 'arrow'] / report.loc[:, 'object']
+
+    print(f"\nSTRING DTYPE BENCHMARK ({results['object']['rows']} clues)")
+    print(report.round(3).to_string())
+    return report
+
+
+def run(
+        normalize_len=True,
+        write_to_file=True,
+        difficulties=None,
+        categories=None,
+        subcategories=None,
+        years=None,
+        qtype='all',
+        anki_collection=None,
+        source=None,
+        pyarrow_strings=False,
+        norm_cache=None
+):
+    '''
+    Runs the whole data transformation pipeline to turn QBReader database backups
+    into a file that is ready to import into Anki as flashcards.
+
+    difficulties, categories, subcategories, years and qtype restrict the
+    backup to a subset of questions at read time, and source reads it from
+    a directory or glob of (possibly compressed) shards; see intake().
+    anki_collection is an optional path to an existing collection.anki2 whose
+    cards are left out of the output file; see write_out().
+    pyarrow_strings keeps text columns in string[pyarrow] from intake on,
+    which takes less memory than Python strings; see string_dtype_benchmark().
+    norm_cache is a .feather file where normalized clue and answer text is
+    kept between runs on the same backup; see add_normalized_columns().
+    '''
+    print("Reading in tossups and bonuses from QBReader backup file...")
+    tossups, bonuses = intake(difficulties=difficulties,
+                              categories=categories,
+                              subcategories=subcategories,
+                              years=years,
+                              qtype=qtype,
+                              source=source,
+                              pyarrow_strings=pyarrow_strings)
+    #pd.options.display.max_colwidth = max_tossup_length(tossups)
+
+    clues = clean_clues(tossups, bonuses, normalize_len=normalize_len,
+                        pyarrow_strings=pyarrow_strings, norm_cache=norm_cache)
+
+    #simplified once here, for the estimate and for remove_redundancies()
+    clues = add_simple_answers(clues)
 
+    #lemmatizing needs spaCy, so it is only timed once the user opts in
+    print("Estimating redundant clue removal runtime...")
+    estimates = estimate_redundancy_cost(clues, settings=[{}], engines=('remove_redundancies',))
     print("Run redundant clue removal algorithm? Type 'yes' to confirm.")
-    rr_input = input("WARNING: This will take several hours.")
+    rr_input = input(f"WARNING: This is predicted to take {estimates.loc[0, 'minutes']} minutes.")
     if rr_input == 'yes':
         rr_input = input("Are you sure?? Type 'yes' again to confirm.")
         if rr_input == 'yes':
+            print("Estimating runtime with lemmatization...")
+            estimates = estimate_redundancy_cost(clues, settings=[{'lemmatize': True}],
+                                                 engines=('remove_redundancies',))
             print("Do you want to lemmatize words in clues? Type 'yes' to confirm.")
-            lemma_input = input("WARNING: This will add as much as several hours to runtime.")
+            if len(estimates) > 0:
+                lemma_input = input(f"WARNING: This is predicted to take {estimates.loc[0, 'minutes']} " +
+                                    "minutes in total.")
+            else:
+                lemma_input = input("WARNING: This will add as much as several hours to runtime.")
             lemma_choice = (lemma_input == 'yes')
-            clues = remove_redundancies(clues, lemmatize=lemma_choice)
+            budget_input = input("How many minutes can redundancy removal run? " +
+                                 "Type a number, or press Enter for no limit.")
+            try:
+                time_budget = float(budget_input) * 60
+            except ValueError:
+                time_budget = None
+            if lemma_choice:
+                #lemmatized simple answers are computed by remove_redundancies()
+                clues = clues.drop(columns=['simple_answer'])
+            clues = remove_redundancies(clues, lemmatize=lemma_choice,
+                                        time_budget=time_budget, norm_cache=norm_cache)
 
     if write_to_file:
         now = datetime.now().strftime("%Y%-m%d-%H%M%S")
         filepath = f"clues_{now}.csv"
         print(f"Writing clue cards to {filepath}...")
-        write_out(clues, filepath)
+        write_out(clues, filepath, anki_collection=anki_collection)
         print(f"Writeout complete! Now, open Anki and go to File->Import->{filepath}.")
         print("Enjoy carding!")
     else:
@@ -0,0 +1,226 @@
+import contextlib
+import io
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from dynamic_threshes import make_thresh_table, save_thresh_table, load_thresh_table
+from similarity import distill, wordify
+from similarity_graph import build_similarity_graph, replay_similarity_graph, EDGES_FILENAME, ROWS_FILENAME
+from dedup_estimate import simple_answer_freqs, block_sample, estimate_redundancy_cost
+from clue_store import is_clue_store, open_clue_store
+
+THRESH_TABLE_FILEPATH = "thresh_table.json"
+#keyword arguments of ans_thresh_hashtable(); the first is the built-in curve
+ANS_CURVES = [{}] + [{'denom': denom, 'min_thresh': min_thresh}
+                     for denom in [1.5, 2, 3] for min_thresh in [0.7, 0.75, 0.8, 0.85]
+                     if (denom, min_thresh) != (2, 0.7)]
+#keyword arguments of clue_thresh_hashtable(); the first is the built-in curve
+CLUE_CURVES = [{}, {'frac': 0.4}, {'frac': 0.6}, {'frac': 0.5, 'short_bag': 5}]
+LABEL_COLUMNS = ['clue_a', 'answer_a', 'clue_b', 'answer_b', 'duplicate']
+
+
+def overlap(bag_a, bag_b):
+    '''Overlap coefficient of two clue bags, scored as remove_redundancies() does.'''
+    if min(len(bag_a), len(bag_b)) < 1:
+        return 1.0
+    return len(bag_a & bag_b) / min(len(bag_a), len(bag_b))
+
+
+def score_pairs(pairs, max_ans_len=50):
+    '''
+    Answer similarity and clue overlap of labeled clue pairs, as
+    remove_redundancies() would score them with clue a as the current row.
+
+    Inputs:
+        - pairs (pandas DataFrame): LABEL_COLUMNS
+        - max_ans_len (int): as in remove_redundancies()
+    Returns (pandas DataFrame): ans_sim, clue_sim, ans_len and bag_size
+    (of clue a) for each pair
+    '''
+    import batch_jaro_winkler as bjw
+    rows = []
+    for pair in pairs.itertuples(index=False):
+        ans_a, ans_b = [distill(ans, answerline=True, max_length=max_ans_len)
+                        for ans in (pair.answer_a, pair.answer_b)]
+        rt_model = bjw.build_runtime_model(bjw.build_exportable_model([ans_b]))
+        bag_a, bag_b = wordify(str(pair.clue_a)), wordify(str(pair.clue_b))
+        rows.append({'ans_sim': bjw.jaro_distance(rt_model, ans_a)[0][1],
+                     'clue_sim': overlap(bag_a, bag_b),
+                     'ans_len': len(ans_a),
+                     'bag_size': len(bag_a)})
+    return pd.DataFrame(rows, index=pairs.index)
+
+
+def pair_quality(scored, labels, table):
+    '''
+    Precision, recall and F1 of a threshold table on scored, labeled pairs.
+
+    Returns (dict): precision, recall, f1
+    '''
+    ans_thresh_fn, clue_thresh_fn = load_thresh_table(table)
+    predicted = ((scored['ans_sim'] > scored['ans_len'].map(ans_thresh_fn)) &
+                 (scored['clue_sim'] > scored['bag_size'].map(clue_thresh_fn))).to_numpy()
+    labels = labels.astype(bool).to_numpy()
+    true_pos = (predicted & labels).sum()
+    precision = true_pos / max(predicted.sum(), 1)
+    recall = true_pos / max(labels.sum(), 1)
+    f1 = 2 * precision * recall / max(precision + recall, 1e-12)
+    return {'precision': round(precision, 3), 'recall': round(recall, 3), 'f1': round(f1, 3)}
+
+
+def write_label_sheet(graph_dir, filepath, num_pairs=200, seed=0):
+    '''
+    Sample candidate pairs from a similarity graph into a .csv with an empty
+    'duplicate' column. Mark each pair 1 (the shorter clue is redundant) or 0
+    and pass the file to calibrate_threshes() as labeled_pairs.
+
+    Pairs are spread evenly over answer similarity, so borderline matches
+    aren't crowded out by exact ones.
+    '''
+    graph = np.load(os.path.join(graph_dir, EDGES_FILENAME))
+    rows = pd.read_feather(os.path.join(graph_dir, ROWS_FILENAME))
+    ans_sim = graph['ans_sim']
+    rng = np.random.default_rng(seed)
+    # weight each pair by the inverse of how crowded its similarity bin is
+    bins = np.minimum((ans_sim * 20).astype(int), 19)
+    weights = 1 / np.bincount(bins, minlength=20)[bins]
+    chosen = rng.choice(len(ans_sim), size=min(num_pairs, len(ans_sim)), replace=False,
+                        p=weights / weights.sum())
+    src, dst = graph['src'][chosen], graph['dst'][chosen]
+    sheet = pd.DataFrame({'clue_a': rows.loc[src, 'clue'].to_numpy(),
+                          'answer_a': rows.loc[src, 'answer'].to_numpy(),
+                          'clue_b': rows.loc[dst, 'clue'].to_numpy(),
+                          'answer_b': rows.loc[dst, 'answer'].to_numpy(),
+                          'duplicate': ''})
+    sheet.to_csv(filepath, sep='\t', escapechar='\\', index=False)
+    print(f"Wrote {len(sheet)} pairs to label to {filepath}")
+
+
+def calibrate_threshes(
+        clue_df,
+        labeled_pairs=None,
+        ans_curves=ANS_CURVES,
+        clue_curves=CLUE_CURVES,
+        sample_rows=5000,
+        max_minutes=None,
+        coverage=0.9,
+        max_ans_len=50,
+        filepath=THRESH_TABLE_FILEPATH,
+        label_sheet=None,
+        seed=0
+):
+    '''
+    Sweep answer and clue threshold curves and pick the one that best trades
+    dedup quality against runtime, then save it as a threshold table that
+    remove_redundancies(thresh_table=...) loads.
+
+    A block-preserving sample of the corpus is scored once into a similarity
+    graph (see build_similarity_graph()), and every pair of curves is
+    replayed on it. For each pair of curves, the report gives:
+        - rows_deleted: rows the curves delete from the sample
+        - ans_matches: sample pairs with matching answers, i.e. clue
+        comparisons remove_redundancies() makes
+        - jaro_scores, minutes: answer similarity scores and predicted
+        runtime on the whole corpus (see estimate_redundancy_cost())
+        - precision, recall, f1: on labeled_pairs, if given
+        - default_gap: how many more or fewer sample rows the curves delete
+        than the built-in ones
+    With labels, the curves with the best F1 are chosen. Without them,
+    deleting more rows is not evidence of better dedup (loose curves delete
+    clues on spurious matches), so the fastest curves whose deletions are
+    off the built-in count by at most (1 - coverage) times that count, in
+    either direction, are chosen, with ties going to the closest. Either way, only
+    curves predicted to finish within max_minutes are considered.
+
+    Inputs:
+        - clue_df (str or DataFrame): as in remove_redundancies()
+        - labeled_pairs (str, DataFrame or None): clue pairs with
+        LABEL_COLUMNS, e.g. a sheet from write_label_sheet() once filled in
+        - ans_curves, clue_curves (lists of dicts): keyword arguments of
+        ans_thresh_hashtable() and clue_thresh_hashtable() to try
+        - sample_rows (int): rows in the replayed sample
+        - max_minutes (float or None): runtime limit on the whole corpus
+        - coverage (float): see above; only used without labels
+        - max_ans_len (int): as in remove_redundancies()
+        - filepath (str or None): where to save the chosen table
+        - label_sheet (str or None): also write a label sheet of sample
+        pairs here (see write_label_sheet())
+        - seed (int): random seed for the sample
+    Returns (tuple): chosen threshold table (dict), report (DataFrame)
+    '''
+    if is_clue_store(clue_df):
+        clue_df, _, _ = open_clue_store(clue_df)
+    elif type(clue_df) == str:
+        clue_df = pd.read_csv(clue_df, sep="\t")
+    tables = [make_thresh_table(ans, clue, max_ans_len) for ans in ans_curves for clue in clue_curves]
+    ans_floor = min(min(table['ans'].values()) for table in tables) - 1e-6
+    clue_floor = min(min(table['clue'].values()) for table in tables) - 1e-6
+
+    print(f"Scoring a sample of about {sample_rows} rows...")
+    ans_freqs = simple_answer_freqs(clue_df, max_ans_len)
+    sample = block_sample(clue_df, ans_freqs, sample_rows, max_ans_len, seed)
+    rows = []
+    with tempfile.TemporaryDirectory() as graph_dir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_similarity_graph(sample, graph_dir, ans_floor=ans_floor, clue_floor=clue_floor,
+                                   max_ans_len=max_ans_len)
+        if label_sheet is not None:
+            write_label_sheet(graph_dir, label_sheet, seed=seed)
+        graph = np.load(os.path.join(graph_dir, EDGES_FILENAME))
+        print(f"Replaying {len(tables)} threshold curves...")
+        for table in tables:
+            ans_thresh_fn, clue_thresh_fn = load_thresh_table(table)
+            with contextlib.redirect_stdout(io.StringIO()):
+                kept = replay_similarity_graph(graph_dir, ans_thresh_fn=ans_thresh_fn,
+                                               clue_thresh_fn=clue_thresh_fn)
+            src_threshes = np.array([ans_thresh_fn(n) for n in graph['ans_len']])[graph['src']]
+            rows.append({'name': table['name'],
+                         'rows_deleted': len(graph['ans_len']) - len(kept),
+                         'ans_matches': int((graph['ans_sim'] > src_threshes).sum())})
+
+    print("Predicting runtime for each curve...")
+    with contextlib.redirect_stdout(io.StringIO()):
+        estimates = estimate_redundancy_cost(clue_df, settings=[{'thresh_table': t} for t in tables],
+                                             engines=('remove_redundancies',),
+                                             max_ans_len=max_ans_len, seed=seed)
+    report = pd.DataFrame(rows)
+    report.loc[:, 'jaro_scores'] = estimates.loc[:, 'jaro_scores'].to_numpy()
+    report.loc[:, 'minutes'] = estimates.loc[:, 'minutes'].to_numpy()
+    report.loc[:, 'default_gap'] = (report.loc[:, 'rows_deleted'] - report.loc[0, 'rows_deleted']).abs()
+
+    if labeled_pairs is not None:
+        if type(labeled_pairs) == str:
+            labeled_pairs = pd.read_csv(labeled_pairs, sep='\t')
+        labeled_pairs = labeled_pairs.dropna(subset=['duplicate'])
+        scored = score_pairs(labeled_pairs, max_ans_len)
+        quality = pd.DataFrame([pair_quality(scored, labeled_pairs['duplicate'], table)
+                                for table in tables])
+        report = pd.concat((report, quality), axis=1)
+        eligible = report.index
+        order = ['f1', 'minutes']
+        ascending = [False, True]
+    else:
+        baseline = report.loc[0, 'rows_deleted']
+        eligible = report.index[report.loc[:, 'default_gap'] <= (1 - coverage) * baseline]
+        order = ['minutes', 'default_gap']
+        ascending = [True, True]
+    if max_minutes is not None:
+        eligible = eligible[report.loc[eligible, 'minutes'] <= max_minutes]
+        if len(eligible) == 0:
+            print(f"WARNING: no curves are predicted to finish in {max_minutes} minutes. " +
+                  "Choosing the fastest")
+            eligible, order, ascending = report.index, ['minutes'], [True]
+    best = report.loc[eligible, :].sort_values(by=order, ascending=ascending).index[0]
+
+    print("\nTHRESHOLD CALIBRATION (first row is the built-in curves)")
+    print(report.to_string())
+    chosen = tables[best]
+    chosen['metrics'] = {key: (value.item() if hasattr(value, 'item') else value)
+                         for key, value in report.loc[best, :].items() if key != 'name'}
+    print(f"Chose {chosen['name']}")
+    if filepath is not None:
+        save_thresh_table(chosen, filepath)
+        print(f"Saved threshold table to {filepath}. " +
+              f"Use it with remove_redundancies(thresh_table='{filepath}')")
+    return chosen, report
@@ -0,0 +1,309 @@
+import contextlib
+import io
+import os
+import sys
+import json
+import time
+import urllib.request
+from collections import OrderedDict
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from tqdm import tqdm
+from backup_to_cards import (intake, reformat, put_together, question_keys, question_dedup,
+                             mongo_fix, normalize_length, tag_column)
+from text_processing import explode_clean
+from similarity import (add_normalized_columns, distill, fingerprint_dedup,
+                        remove_redundancies, get_nlp)
+from utility import write_out, filter_existing_cards
+
+tqdm.pandas()
+
+#local only: the service reads and writes files on this machine
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+#cards kept for repeat requests
+RESPONSE_CACHE_SIZE = 16
+#remove_redundancies() settings a request may pass
+DEDUP_OPTIONS = ['skip_thresh', 'ans_thresh', 'clue_thresh', 'dynamic_threshes',
+                 'lemmatize', 'time_budget', 'answer_blocking', 'thresh_table']
+
+
+class WarmCorpus:
+    '''
+    The whole QBReader backup, read, split, cleaned and normalized once and
+    kept in memory, so a card request only has to filter rows and run the
+    selection-dependent stages of run(): collapsing repeated questions,
+    dropping repeated clues, fingerprint dedup, length tags and (optionally)
+    redundancy removal.
+    '''
+
+    def __init__(self, source=None, db_path=None, max_ans_len=50, warm_nlp=False,
+                 norm_cache=None):
+        '''
+        Inputs:
+            - source (str or None): backup shards, as in intake()
+            - db_path (str or None): corpus database from build_corpus_db(),
+            read instead of the backup if given
+            - max_ans_len (int): as in remove_redundancies()
+            - warm_nlp (boolean): load spaCy now rather than on the first
+            lemmatize request
+            - norm_cache (str or None): .feather file to cache normalized
+            clue and answer text in; see add_normalized_columns()
+        '''
+        start = time.perf_counter()
+        if db_path is not None:
+            from corpus_db import query_corpus
+            tossups, bonuses = query_corpus(db_path)
+        else:
+            tossups, bonuses = intake(source=source)
+        questions = put_together(tossups, reformat(bonuses))
+        questions.loc[:,'setYear'] = questions.loc[:,'setYear'].apply(mongo_fix)
+        questions.loc[:,'difficulty'] = questions.loc[:,'difficulty'].apply(mongo_fix)
+        questions.loc[:,'question_id'] = np.arange(len(questions))
+        questions.loc[:,'question_key'] = question_keys(questions)
+        self.questions = questions
+
+        clues = explode_clean(questions, drop_repeats=False)
+        clues = add_normalized_columns(clues, cache_path=norm_cache)
+        print("Generating simplified answer lines for every row...")
+        self.max_ans_len = max_ans_len
+        clues.loc[:,'simple_answer'] = clues.loc[:,'norm_answer'].progress_apply(
+            lambda x: distill(x, answerline=True, max_length=max_ans_len, normalized=True))
+        self.clues = clues.drop(columns=['question_key', 'setNames', 'setYears'], errors='ignore')
+
+        if warm_nlp:
+            get_nlp()
+        self.responses = OrderedDict()
+        print(f"Warm corpus ready: {len(questions)} questions, {len(clues)} clues " +
+              f"in {time.perf_counter() - start:.1f}s")
+
+    def select(self, difficulties=None, categories=None, subcategories=None, years=None,
+               qtype='all'):
+        '''
+        Questions passing the intake() filters, collapsed with question_dedup().
+
+        Returns (pandas DataFrame): one row per distinct selected question
+        '''
+        questions = self.questions
+        mask = np.full((len(questions),), True)
+        if difficulties is not None:
+            mask &= questions.loc[:,'difficulty'].isin(list(difficulties)).to_numpy()
+        if categories is not None:
+            mask &= questions.loc[:,'category'].isin(list(categories)).to_numpy()
+        if subcategories is not None:
+            mask &= questions.loc[:,'subcategory'].isin(list(subcategories)).to_numpy()
+        if years is not None:
+            mask &= questions.loc[:,'setYear'].between(years[0], years[1]).to_numpy()
+        if qtype == 'tossup':
+            mask &= (questions.loc[:,'type'] == 'tossup').to_numpy()
+        elif qtype == 'bonus':
+            mask &= (questions.loc[:,'type'] != 'tossup').to_numpy()
+        selected = questions.loc[mask, :]
+        return question_dedup(selected, keys=selected.loc[:,'question_key'])
+
+    def cards(self, dedup=False, normalize_len=True, **request):
+        '''
+        Cards for one request, as run() would make them from the same
+        selection of the backup.
+
+        Inputs:
+            - dedup (boolean): run remove_redundancies()
+            - normalize_len (boolean): as in run()
+            - request: intake() filters (difficulties, categories,
+            subcategories, years, qtype) and DEDUP_OPTIONS
+        Returns (pandas DataFrame): 'clue', 'answer' and 'tags' of every card
+        '''
+        dedup_options = {key: request.pop(key) for key in DEDUP_OPTIONS if key in request}
+        questions = self.select(**request)
+        clues = self.clues.loc[self.clues.loc[:,'question_id'].isin(questions.loc[:,'question_id']), :]
+        clues = clues.loc[~clues.loc[:,'split_clue'].duplicated(), :].copy()
+        for col in ['setNames', 'setYears']:
+            clues.loc[:,col] = clues.loc[:,'question_id'].map(
+                questions.set_index('question_id').loc[:,col]).to_numpy()
+        clues = fingerprint_dedup(clues)
+        if normalize_len:
+            clues = normalize_length(clues)
+        clues['tags'] = tag_column(clues)
+
+        if dedup:
+            if dedup_options.get('lemmatize', False):
+                clues = clues.drop(columns=['simple_answer'])
+            # remove_redundancies() prints every row it considers
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                clues = remove_redundancies(clues, max_ans_len=self.max_ans_len, **dedup_options)
+        return clues.loc[:, ['clue', 'answer', 'tags']]
+
+    def card_file(self, request):
+        '''
+        Card file text for a request (see cards()), in write_out() format.
+        The cards for the last RESPONSE_CACHE_SIZE requests are kept, so a
+        repeated request is answered without recomputing anything.
+
+        Inputs:
+            - request (dict): arguments to cards(), plus an optional
+            anki_collection path as in write_out()
+        Returns (tuple): file text, number of cards
+        '''
+        request = dict(request)
+        anki_collection = request.pop('anki_collection', None)
+        key = json.dumps(request, sort_keys=True)
+        if key in self.responses:
+            self.responses.move_to_end(key)
+        else:
+            if request.get('years') is not None:
+                request['years'] = tuple(request['years'])
+            self.responses[key] = self.cards(**request)
+            if len(self.responses) > RESPONSE_CACHE_SIZE:
+                self.responses.popitem(last=False)
+        # the collection can change between requests, so this isn't cached
+        clues = self.responses[key]
+        if anki_collection is not None:
+            clues = filter_existing_cards(clues, anki_collection)
+        buffer = io.StringIO()
+        write_out(clues, buffer)
+        return buffer.getvalue(), len(clues)
+
+
+class CardRequestHandler(BaseHTTPRequestHandler):
+    '''
+    GET /status: size of the warm corpus, as JSON.
+    POST /cards: JSON body of card_file() request arguments; the response
+    is the tab-separated card file.
+    '''
+    corpus = None
+
+    def send_text(self, status, text, content_type, headers=None):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', f"{content_type}; charset=utf-8")
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/status':
+            self.send_text(404, "Unknown path. Try GET /status or POST /cards", 'text/plain')
+            return
+        status = {'questions': len(self.corpus.questions), 'clues': len(self.corpus.clues),
+                  'cached_responses': len(self.corpus.responses)}
+        self.send_text(200, json.dumps(status), 'application/json')
+
+    def do_POST(self):
+        if self.path != '/cards':
+            self.send_text(404, "Unknown path. Try GET /status or POST /cards", 'text/plain')
+            return
+        start = time.perf_counter()
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or '{}')
+            text, num_cards = self.corpus.card_file(request)
+        except (ValueError, TypeError) as e:
+            self.send_text(400, f"Bad card request: {e}", 'text/plain')
+            return
+        except Exception as e:
+            # e.g. an unreadable anki_collection; answer rather than drop the connection
+            self.send_text(500, f"Card request failed: {type(e).__name__}: {e}", 'text/plain')
+            print(f"WARNING: card request failed: {type(e).__name__}: {e}")
+            return
+        seconds = time.perf_counter() - start
+        self.send_text(200, text, 'text/tab-separated-values',
+                       {'X-Card-Count': str(num_cards), 'X-Seconds': f"{seconds:.2f}"})
+        print(f"Served {num_cards} cards in {seconds:.2f}s")
+
+
+def serve(source=None, db_path=None, host=SERVICE_HOST, port=SERVICE_PORT, warm_nlp=False,
+          norm_cache=None):
+    '''
+    Load a WarmCorpus and answer card requests over HTTP until interrupted.
+    Requests are handled one at a time, since they share the warm corpus.
+    Everything stays on this machine; no network access is needed.
+
+    Inputs:
+        - source, db_path, warm_nlp, norm_cache: see WarmCorpus
+        - host (str), port (int): address to listen on
+    '''
+    CardRequestHandler.corpus = WarmCorpus(source=source, db_path=db_path, warm_nlp=warm_nlp,
+                                           norm_cache=norm_cache)
+    server = HTTPServer((host, port), CardRequestHandler)
+    print(f"Serving cards at http://{host}:{port}/cards")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down card service")
+    finally:
+        server.server_close()
+
+
+def request_cards(filepath, host=SERVICE_HOST, port=SERVICE_PORT, **request):
+    '''
+    Ask a running card service for cards and save them as an Anki import file.
+
+    Inputs:
+        - filepath (str): where to write the .csv
+        - host (str), port (int): where the service is listening
+        - request: see WarmCorpus.card_file(), e.g. categories=['Science'],
+        years=[2015, 2020], dedup=True
+    Returns (int): number of cards written
+    '''
+    http_request = urllib.request.Request(f"http://{host}:{port}/cards",
+                                          data=json.dumps(request).encode('utf-8'),
+                                          headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(http_request) as response:
+        with open(filepath, 'wb') as f:
+            f.write(response.read())
+        num_cards = int(response.headers['X-Card-Count'])
+        print(f"Wrote {num_cards} cards to {filepath} " +
+              f"(served in {response.headers['X-Seconds']}s)")
+    return num_cards
+
+
+def card_service_test():
+    '''
+    Round trips against a service on a tiny backup: a good request gets its
+    cards, malformed JSON gets a 400 and an unreadable anki_collection a 500,
+    instead of the connection being dropped.
+    '''
+    import tempfile
+    import threading
+    import urllib.error
+    records = [{'question': f"This scientist discovered element number {i} in a {'very ' * i}famous lab.",
+                'answer': f"Scientist {i}", 'category': 'Science', 'subcategory': 'Chemistry',
+                'type': 'tossup', 'difficulty': 3, 'setName': '2020 ACF Fall', 'setYear': 2020}
+               for i in range(4)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, 'tossups.jsonl'), 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+        class QuietHandler(CardRequestHandler):
+            def log_message(self, format, *args):
+                pass
+        with contextlib.redirect_stdout(io.StringIO()):
+            QuietHandler.corpus = WarmCorpus(source=tmpdir)
+        server = HTTPServer(('127.0.0.1', 0), QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/cards"
+
+        def post(body):
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, data=body)) as response:
+                    return response.status, response.read().decode('utf-8')
+            except urllib.error.HTTPError as e:
+                return e.code, e.read().decode('utf-8')
+
+        try:
+            status, text = post(json.dumps({'qtype': 'tossup'}).encode('utf-8'))
+            assert status == 200 and 'Scientist 3' in text, (status, text)
+            status, text = post(b'{not json')
+            assert status == 400, (status, text)
+            missing = os.path.join(tmpdir, 'missing', 'collection.anki2')
+            with contextlib.redirect_stdout(io.StringIO()):
+                status, text = post(json.dumps({'anki_collection': missing}).encode('utf-8'))
+            assert status == 500 and 'OperationalError' in text, (status, text)
+        finally:
+            server.shutdown()
+            server.server_close()
+    print("card_service_test passed")
+
+
+if __name__ == '__main__':
+    serve(source=sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,165 @@
+import re
+from functools import reduce
+import numpy as np
+from tqdm import tqdm
+from utility import str_values
+
+TOKEN_RE = re.compile(r'\w+')
+#a term containing any of these is a real regex and can't be served by the index
+REGEX_CHARS_RE = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+
+class ClueIndex:
+    '''
+    Inverted index over the casefolded word tokens of the answer and clue
+    columns of a clues DataFrame. Build it once, then run as many subset-style
+    lookups against the same DataFrame as you like.
+
+    Lookups narrow rows down by intersecting/unioning posting lists (arrays of
+    row positions), and only the surviving candidates are checked against the
+    actual text, so results match a full scan_subset() scan, which folds
+    case the same way (str.casefold()).
+    '''
+
+    def __init__(self, clues):
+        '''
+        Inputs:
+            - clues (pandas DataFrame): must have 'answer' and 'clue' columns
+        '''
+        self.df = clues
+        self.texts = {}
+        self.postings = {}
+        self.vocab = {}
+        self.vocab_matches = {}
+        for col in ['answer', 'clue']:
+            print(f"Indexing {col} column...")
+            self.texts[col] = str_values(clues.loc[:, col]).str.casefold().to_numpy()
+            token_rows = {}
+            for row_i, text in enumerate(tqdm(self.texts[col])):
+                for token in set(TOKEN_RE.findall(text)):
+                    token_rows.setdefault(token, []).append(row_i)
+            self.postings[col] = {token: np.array(rows, dtype=np.int64)
+                                  for token, rows in token_rows.items()}
+            self.vocab[col] = list(self.postings[col].keys())
+            self.vocab_matches[col] = {}
+        #subset() drops rows with missing answers
+        self.answer_present = ~clues.loc[:, 'answer'].isna().to_numpy()
+
+    def _tokens_containing(self, col, fragment):
+        '''Union of posting lists for every indexed token containing fragment.'''
+        if fragment not in self.vocab_matches[col]:
+            hits = [self.postings[col][tok] for tok in self.vocab[col] if fragment in tok]
+            # one sort over every hit; a running union1d re-sorts once per token
+            rows = np.unique(np.concatenate([np.array([], dtype=np.int64)] + hits))
+            self.vocab_matches[col][fragment] = rows
+        return self.vocab_matches[col][fragment]
+
+    def _candidates(self, col, term, phrase):
+        '''
+        Row positions that might contain term. For a substring term, each of
+        its word tokens must be inside some token of the text; for a phrase,
+        each must BE a token of the text. Returns None if the term has no word
+        tokens and so can't be narrowed by the index.
+        '''
+        fragments = TOKEN_RE.findall(term)
+        if len(fragments) == 0:
+            return None
+        if phrase:
+            lists = [self.postings[col].get(frag, np.array([], dtype=np.int64))
+                     for frag in fragments]
+        else:
+            lists = [self._tokens_containing(col, frag) for frag in fragments]
+        # intersect shortest lists first so the work shrinks fastest
+        lists.sort(key=len)
+        return reduce(np.intersect1d, lists)
+
+    def match(self, col, term, phrase=False):
+        '''
+        Sorted row positions whose col contains term.
+
+        Inputs:
+            - col (str): 'answer' or 'clue'
+            - term (str): plain (non-regex) search string, case-insensitive
+            - phrase (boolean): if True, term must appear as whole words
+            (e.g. 'war' matches "civil war" but not "warsaw"); if False, term
+            matches anywhere, exactly like subset()
+        Returns (numpy array of ints): row positions
+        '''
+        assert not REGEX_CHARS_RE.search(term), "ClueIndex only handles plain terms; use subset()"
+        term = term.casefold()
+        texts = self.texts[col]
+        candidates = self._candidates(col, term, phrase)
+        if candidates is None:
+            candidates = np.arange(len(texts))
+
+        if phrase:
+            check_re = re.compile(r'\b' + re.escape(term) + r'\b')
+            hits = [i for i in candidates if check_re.search(texts[i])]
+        else:
+            hits = [i for i in candidates if term in texts[i]]
+        hits = np.array(hits, dtype=np.int64)
+
+        if col == 'answer':
+            hits = hits[self.answer_present[hits]]
+        return hits
+
+    def query(self, ans_terms=None, clue_terms=None, how='and', phrase=False):
+        '''
+        Rows matching any combination of answer and clue terms.
+
+        Inputs:
+            - ans_terms (str, list of strs, or None): terms to look for in answer
+            - clue_terms (str, list of strs, or None): terms to look for in clue
+            - how (str): 'and' to require every term, 'or' to require any
+            - phrase (boolean): whole-word matching; see match()
+        Returns (pandas DataFrame): matching rows in original order, with a
+        fresh index (as subset() returns them)
+        '''
+        assert how in ['and', 'or']
+        if isinstance(ans_terms, str):
+            ans_terms = [ans_terms]
+        if isinstance(clue_terms, str):
+            clue_terms = [clue_terms]
+
+        hit_lists = ([self.match('answer', t, phrase) for t in (ans_terms or [])] +
+                     [self.match('clue', t, phrase) for t in (clue_terms or [])])
+        if len(hit_lists) == 0:
+            return self.df
+
+        if how == 'and':
+            rows = reduce(np.intersect1d, sorted(hit_lists, key=len))
+        else:
+            rows = np.unique(np.concatenate([np.array([], dtype=np.int64)] + hit_lists))
+        return self.df.iloc[rows].reset_index(drop=True)
+
+
+def is_plain_term(term):
+    '''Whether a search term can be answered by a ClueIndex.'''
+    return term is None or not REGEX_CHARS_RE.search(term)
+
+
+def clue_index_test():
+    '''
+    Checks that subset() gives the same rows through a ClueIndex as by
+    scanning, on text whose case folds go beyond ASCII (long s, sharp s,
+    dotted capital I, final sigma).
+    '''
+    import contextlib
+    import io
+    import pandas as pd
+    from similarity import subset
+    clues = pd.DataFrame({
+        'clue': ["Thiſ poem was publiſhed in 1771.", "This street is the Hauptſtraße.",
+                 "This STRASSE runs through İstanbul.", "This king was ΣΊΣΥΦΟΣ.",
+                 "This man pushed a boulder as Sisyphus.", "This city was Constantinople."],
+        'answer': ["The Seaſons", "Straße", "ISTANBUL", "Σίσυφος", "Sisyphus", None]})
+    terms = [None, 's', 'S', 'ss', 'ß', 'strasse', 'straße', 'i̇stanbul', 'istanbul',
+             'σίσυφος', 'ΣΊΣΥΦΟΣ', 'this', 'the seasons']
+    with contextlib.redirect_stdout(io.StringIO()):
+        index = ClueIndex(clues)
+        for ans_term in terms:
+            for clue_term in terms:
+                scanned = subset(clues, ans_term, clue_term)
+                indexed = subset(clues, ans_term, clue_term, index=index)
+                assert indexed.equals(scanned), (ans_term, clue_term, indexed, scanned)
+    print("clue_index_test passed")
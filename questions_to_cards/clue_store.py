@@ -0,0 +1,80 @@
+import json
+import numpy as np
+import pandas as pd
+
+STORE_EXTENSIONS = ('.arrow', '.feather')
+STORE_COLUMNS = ['clue', 'answer', 'tags', 'simple_answer', 'bag_size', 'token_ids']
+
+
+def write_clue_store(df, token_ids, vocab, filepath, lemmatize=False):
+    '''
+    Write a prepared clue table to an uncompressed Arrow IPC (Feather v2)
+    file, as a single record batch so it can be memory-mapped back without
+    copying. Call through similarity.save_clue_store(), which computes the
+    columns.
+
+    Inputs:
+        - df (DataFrame): must have every column in STORE_COLUMNS but token_ids
+        - token_ids (numpy array): 2D array of word ids, one row per clue,
+        padded with -1
+        - vocab (numpy array of strs): word for each token id
+        - filepath (str): where to write; should end in .arrow or .feather
+        - lemmatize (boolean): whether clue bags were lemmatized
+    '''
+    import pyarrow as pa
+    width = token_ids.shape[1]
+    columns = {col: pa.array(df[col].to_numpy()) for col in STORE_COLUMNS[:-1]}
+    columns['token_ids'] = pa.FixedSizeListArray.from_arrays(
+        pa.array(token_ids.astype(np.int32).ravel()), width)
+
+    metadata = {'vocab': json.dumps(list(vocab)),
+                'lemmatize': json.dumps(lemmatize)}
+    table = pa.table(columns).replace_schema_metadata(metadata)
+
+    with pa.OSFile(filepath, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_batch(table.combine_chunks().to_batches()[0])
+    print(f"Wrote {len(df)} rows to clue store {filepath}")
+
+
+def open_clue_store(filepath):
+    '''
+    Memory-map a clue store written by write_clue_store(). The returned
+    DataFrame's columns are Arrow-backed views of the mapped file, so opening
+    is near-instant and processes reading the same store share the OS page
+    cache instead of each holding a copy.
+
+    Returns (tuple): DataFrame, vocabulary array, lemmatize flag
+    '''
+    import pyarrow as pa
+    source = pa.memory_map(filepath, 'r')
+    table = pa.ipc.open_file(source).read_all()
+    metadata = table.schema.metadata
+    vocab = np.array(json.loads(metadata[b'vocab']))
+    lemmatize = json.loads(metadata[b'lemmatize'])
+
+    df = table.to_pandas(types_mapper=pd.ArrowDtype)
+    print(f"Opened clue store {filepath} ({len(df)} rows)")
+    return df, vocab, lemmatize
+
+
+def token_id_matrix(token_ids):
+    '''
+    Turn a token_ids column from open_clue_store() back into the 2D numpy
+    array of word ids that remove_redundancies() compares. For an unfiltered
+    store this is a view of the mapped file; a filtered column is copied.
+
+    Inputs:
+        - token_ids (pandas Series): Arrow-backed fixed-size-list column
+    Returns (numpy array): one row of word ids per clue, padded with -1
+    '''
+    import pyarrow as pa
+    arr = pa.array(token_ids.array)
+    width = arr.type.list_size
+    flat = arr.flatten().to_numpy(zero_copy_only=False)
+    return flat.reshape(-1, width)
+
+
+def is_clue_store(filepath):
+    '''Whether a filepath names a clue store rather than a .csv'''
+    return type(filepath) == str and filepath.endswith(STORE_EXTENSIONS)
@@ -0,0 +1,234 @@
+import json
+import os
+import sqlite3
+import pandas as pd
+from tqdm import tqdm
+from backup_io import (open_backup_file, find_shards, mongo_fix, TOSSUP_COLUMNS,
+                       BONUS_COLUMNS, METADATA_COLUMNS)
+
+CORPUS_DB = "qbreader_corpus.db"
+INSERT_BATCH_SIZE = 10000
+#tables are named after qtype so queries can pick one by name
+TABLE_COLUMNS = {'tossup': TOSSUP_COLUMNS, 'bonus': BONUS_COLUMNS}
+TEXT_COLUMNS = {'tossup': ['question', 'answer'], 'bonus': ['leadin', 'parts', 'answers']}
+#bonus parts and answers are lists, stored as JSON text
+LIST_COLUMNS = ['parts', 'answers']
+#the backup files a database was built from, to tell when it is stale
+SOURCE_FILES_TABLE = 'source_files'
+
+
+def build_corpus_db(db_path=CORPUS_DB, source=None):
+    '''
+    One-time import of the QBReader backup into a SQLite database, with an
+    index on every metadata column and an FTS5 full-text index over question
+    and answer text. Afterwards, query_corpus() and search_corpus() pull
+    filtered questions without reading the backup again. The path and
+    modification time of every backup file read are stored too, for
+    newer_backup_files().
+
+    Inputs:
+        -db_path (str): database file to create; an existing one is replaced
+        -source (str or None): directory or glob of backup shards, as in
+        intake(); None reads tossups.json and bonuses.json from the current
+        directory
+    '''
+    if source is None:
+        assert ('tossups.json' in os.listdir() and
+                'bonuses.json' in os.listdir()), "You don't have the qbreader backup files in this directory!"
+        files = {'tossup': ["tossups.json"], 'bonus': ["bonuses.json"]}
+    else:
+        files = dict(zip(['tossup', 'bonus'], find_shards(source)))
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"CREATE TABLE {SOURCE_FILES_TABLE} (path TEXT PRIMARY KEY, mtime REAL)")
+        conn.executemany(f"INSERT INTO {SOURCE_FILES_TABLE} (path, mtime) VALUES (?, ?)",
+                         [(os.path.abspath(path), os.path.getmtime(path))
+                          for paths in files.values() for path in paths])
+        for table, columns in TABLE_COLUMNS.items():
+            conn.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, {', '.join(columns)})")
+            insert_sql = (f"INSERT INTO {table} ({', '.join(columns)}) " +
+                          f"VALUES ({', '.join('?' * len(columns))})")
+            num_rows = 0
+            for filepath in files[table]:
+                batch = []
+                with open_backup_file(filepath) as f:
+                    for line in tqdm(f, desc=f"Importing {filepath}"):
+                        if not line.strip():
+                            continue
+                        batch.append(db_row(json.loads(line), columns))
+                        if len(batch) == INSERT_BATCH_SIZE:
+                            conn.executemany(insert_sql, batch)
+                            num_rows += len(batch)
+                            batch = []
+                conn.executemany(insert_sql, batch)
+                num_rows += len(batch)
+
+            print(f"Indexing {num_rows} {table}s...")
+            for col in METADATA_COLUMNS:
+                conn.execute(f"CREATE INDEX {table}_{col} ON {table} ({col})")
+            text_cols = ', '.join(TEXT_COLUMNS[table])
+            conn.execute(f"CREATE VIRTUAL TABLE {table}_fts USING fts5({text_cols}, " +
+                         f"content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')")
+            conn.execute(f"INSERT INTO {table}_fts(rowid, {text_cols}) SELECT id, {text_cols} FROM {table}")
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Wrote corpus database {db_path}")
+
+
+def newer_backup_files(db_path=CORPUS_DB):
+    '''
+    Backup files changed or removed since the corpus database was built from
+    them, i.e. ones the database may not match anymore. Databases built
+    before their source files were recorded are compared against
+    tossups.json and bonuses.json in the current directory.
+
+    Inputs:
+        -db_path (str): database from build_corpus_db()
+    Returns (list of strs): backup files that changed since the build
+    '''
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        sources = conn.execute(f"SELECT path, mtime FROM {SOURCE_FILES_TABLE}").fetchall()
+    except sqlite3.OperationalError:
+        built = os.path.getmtime(db_path)
+        return [path for path in ('tossups.json', 'bonuses.json')
+                if os.path.exists(path) and os.path.getmtime(path) > built]
+    finally:
+        conn.close()
+    return [path for path, mtime in sources
+            if not os.path.exists(path) or os.path.getmtime(path) != mtime]
+
+
+def db_row(record, columns):
+    '''Project one backup record onto a table's columns, as SQLite values.'''
+    record['difficulty'] = mongo_fix(record.get('difficulty'))
+    record['setYear'] = mongo_fix(record.get('setYear'))
+    return tuple(json.dumps(record.get(col)) if col in LIST_COLUMNS else record.get(col)
+                 for col in columns)
+
+
+def where_clause(difficulties=None, categories=None, subcategories=None, years=None,
+                 set_names=None):
+    '''
+    SQL conditions and parameters for the intake() filters. A filter that is
+    None lets everything through.
+
+    Returns (tuple): list of condition strs, list of parameters
+    '''
+    conditions, params = [], []
+    for col, values in [('difficulty', difficulties), ('category', categories),
+                        ('subcategory', subcategories), ('setName', set_names)]:
+        if values is not None:
+            values = list(values)
+            conditions.append(f"{col} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+    if years is not None:
+        conditions.append("setYear BETWEEN ? AND ?")
+        params.extend(years)
+    return conditions, params
+
+
+def read_table(conn, table, conditions, params, join_fts=False):
+    '''Run a filtered SELECT on one table and shape it like intake() output.'''
+    columns = TABLE_COLUMNS[table]
+    sql = f"SELECT {', '.join(f'{table}.{col}' for col in columns)} FROM {table}"
+    if join_fts:
+        sql += f" JOIN {table}_fts ON {table}_fts.rowid = {table}.id"
+    if len(conditions) > 0:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {table}.id"
+    df = pd.read_sql_query(sql, conn, params=params)
+    for col in LIST_COLUMNS:
+        if col in df.columns:
+            df.loc[:, col] = df.loc[:, col].map(json.loads)
+    return df
+
+
+def query_corpus(
+        db_path=CORPUS_DB,
+        difficulties=None,
+        categories=None,
+        subcategories=None,
+        years=None,
+        qtype='all',
+        set_names=None
+):
+    '''
+    Drop-in replacement for intake() that reads from a database made by
+    build_corpus_db() instead of the raw backup.
+
+    Inputs:
+        -db_path (str): corpus database
+        -difficulties, categories, subcategories, years, qtype: see intake()
+        -set_names (iterable of strs or None): set names to keep
+    Returns (tuple of DataFrames): tossups, bonuses
+    '''
+    conditions, params = where_clause(difficulties, categories, subcategories, years, set_names)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        tossups, bonuses = [read_table(conn, table, conditions, params)
+                            if qtype in [table, 'all'] else pd.DataFrame(columns=TABLE_COLUMNS[table])
+                            for table in ['tossup', 'bonus']]
+    finally:
+        conn.close()
+    tossups.rename(columns={'question':'clue'}, inplace=True)
+    print(f"Pulled {len(tossups)} tossups and {len(bonuses)} bonuses from {db_path}")
+    return tossups, bonuses
+
+
+def fts_phrase(term):
+    '''Quote a search term as a single FTS5 phrase.'''
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_corpus(
+        db_path=CORPUS_DB,
+        ans_term=None,
+        clue_term=None,
+        qtype='all',
+        **filters
+):
+    '''
+    subset()-style search of the corpus database through its full-text index.
+    Unlike subset(), terms match whole words (as phrases), ignoring case and
+    accents, and regexes aren't supported.
+
+    Inputs:
+        -db_path (str): corpus database
+        -ans_term (str or None): phrase to look for in answer lines
+        -clue_term (str or None): phrase to look for in question text (for
+        bonuses, the leadin or any part)
+        -qtype (str): 'tossup', 'bonus', or 'all'
+        -filters: difficulties, categories, subcategories, years, set_names;
+        see query_corpus()
+    Returns (tuple of DataFrames): matching tossups, bonuses
+    '''
+    conditions, params = where_clause(**filters)
+    results = []
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        for table in ['tossup', 'bonus']:
+            if qtype not in [table, 'all']:
+                results.append(pd.DataFrame(columns=TABLE_COLUMNS[table]))
+                continue
+            question_cols, answer_col = TEXT_COLUMNS[table][:-1], TEXT_COLUMNS[table][-1]
+            match = []
+            if ans_term is not None:
+                match.append(f"{answer_col} : {fts_phrase(ans_term)}")
+            if clue_term is not None:
+                match.append(f"{{{' '.join(question_cols)}}} : {fts_phrase(clue_term)}")
+            table_conditions, table_params = list(conditions), list(params)
+            if len(match) > 0:
+                table_conditions.insert(0, f"{table}_fts MATCH ?")
+                table_params.insert(0, ' AND '.join(match))
+            results.append(read_table(conn, table, table_conditions, table_params,
+                                      join_fts=len(match) > 0))
+    finally:
+        conn.close()
+    tossups, bonuses = results
+    tossups.rename(columns={'question':'clue'}, inplace=True)
+    return tossups, bonuses
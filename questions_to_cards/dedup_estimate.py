@@ -0,0 +1,285 @@
+import contextlib
+import io
+import tempfile
+import time
+from collections import Counter
+import numpy as np
+import pandas as pd
+from dynamic_threshes import ans_thresh_hashtable, load_thresh_table
+from similarity import (remove_redundancies, prepare_dedup_table, normalize_column, distill,
+                        build_length_buckets, score_answer, jaro_upper_bound)
+from similarity_graph import build_similarity_graph
+from clue_store import is_clue_store, open_clue_store
+
+ENGINES = ('remove_redundancies', 'similarity_graph')
+#settings are keyword arguments of remove_redundancies(); {} is its defaults
+DEFAULT_SETTINGS = [
+    {},
+    {'skip_thresh': 3},
+    {'dynamic_threshes': False, 'ans_thresh': 0.7, 'clue_thresh': 0.6},
+    {'dynamic_threshes': False, 'ans_thresh': 0.85, 'clue_thresh': 0.6},
+    {'lemmatize': True},
+]
+BLOCK_SIZE_BINS = [1, 2, 3, 6, 11, 51, 201, np.inf]
+GRAPH_ANS_FLOOR = 0.6
+#src, dst, ans_sim and clue_sim of one saved similarity graph edge
+GRAPH_EDGE_BYTES = 32
+
+
+def simple_answer_freqs(clue_df, max_ans_len=50):
+    '''
+    The simplified answer line of every row, as remove_redundancies() will
+    compute it (without lemmatization), counted. This is the only full-corpus
+    pass the estimate needs.
+
+    Returns (Counter): simple answer -> number of rows
+    '''
+    if 'simple_answer' in clue_df.columns:
+        return Counter(clue_df.loc[:, 'simple_answer'])
+    answers = clue_df.loc[clue_df.loc[:, 'answer'].notna(), 'answer']
+    print("Simplifying answer lines for the estimate...")
+    simple_answers = normalize_column(answers, answerline=True).progress_apply(
+        lambda x: distill(x, answerline=True, max_length=max_ans_len, normalized=True))
+    return Counter(simple_answers)
+
+
+def block_histogram(ans_freqs):
+    '''
+    How rows are spread over answer blocks (rows sharing a simple answer).
+    Clue overlap is only computed between rows with matching answers, so
+    within-block pairs are a lower bound on the clue comparisons needed.
+
+    Returns (pandas DataFrame): one row per block size range, with the
+    number of blocks, rows and within-block pairs
+    '''
+    sizes = pd.Series(list(ans_freqs.values()), dtype='int64')
+    bins = pd.cut(sizes, BLOCK_SIZE_BINS, right=False)
+    hist = pd.DataFrame({'blocks': sizes.groupby(bins, observed=False).size(),
+                         'rows': sizes.groupby(bins, observed=False).sum(),
+                         'pairs': (sizes * (sizes - 1) // 2).groupby(bins, observed=False).sum()})
+    hist.index = [f"{int(b.left)}+" if b.right == np.inf else
+                  (f"{int(b.left)}" if b.right - b.left == 1 else f"{int(b.left)}-{int(b.right) - 1}")
+                  for b in hist.index]
+    return hist
+
+
+def jaro_comparisons(ans_freqs, ans_thresh_fn, skip_thresh=None):
+    '''
+    Exact number of answer similarity scores remove_redundancies() will
+    calculate: every scored block is compared with every unique answer whose
+    length could pass that block's threshold (see score_answer()).
+
+    Inputs:
+        - ans_freqs (Counter): from simple_answer_freqs()
+        - ans_thresh_fn (function): answer threshold for a simple answer length
+        - skip_thresh (int or None): as in remove_redundancies()
+    Returns (tuple of ints): blocks scored, similarity scores calculated
+    '''
+    unique_lens = Counter(len(ans) for ans in ans_freqs)
+    scored_lens = Counter(len(ans) for ans, freq in ans_freqs.items()
+                          if skip_thresh is None or freq >= skip_thresh)
+    comparisons = 0
+    for length, num_blocks in scored_lens.items():
+        thresh = ans_thresh_fn(length)
+        comparable = sum(count for other, count in unique_lens.items()
+                         if jaro_upper_bound(length, other) + 1e-6 > thresh)
+        comparisons += num_blocks * comparable
+    return sum(scored_lens.values()), comparisons
+
+
+def block_sample(clue_df, ans_freqs, sample_rows, max_ans_len=50, seed=0):
+    '''
+    Random whole answer blocks adding up to about sample_rows rows, so the
+    sample has the corpus's block sizes rather than thinned-out blocks.
+
+    Returns (pandas DataFrame): sampled rows of clue_df
+    '''
+    rng = np.random.default_rng(seed)
+    answers = np.array(list(ans_freqs.keys()), dtype=object)
+    sizes = np.array(list(ans_freqs.values()))
+    order = rng.permutation(len(answers))
+    chosen = set(answers[order[:np.searchsorted(np.cumsum(sizes[order]), sample_rows) + 1]])
+    if 'simple_answer' in clue_df.columns:
+        simple_answers = clue_df.loc[:, 'simple_answer']
+    else:
+        simple_answers = normalize_column(clue_df.loc[:, 'answer'], answerline=True).map(
+            lambda x: distill(x, answerline=True, max_length=max_ans_len, normalized=True))
+    in_sample = simple_answers.isin(chosen).to_numpy() & clue_df.loc[:, 'answer'].notna().to_numpy()
+    return clue_df.loc[in_sample, :].reset_index(drop=True)
+
+
+def quiet_seconds(func, *args, **kwargs):
+    '''Run func with its printing silenced and return how long it took.'''
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def seconds_per_jaro(ans_freqs, num_queries=200):
+    '''Measured cost of one batch_jaro_winkler answer similarity score.'''
+    unique_strs = np.unique(np.array(list(ans_freqs.keys()), dtype=object).astype(str))
+    with contextlib.redirect_stdout(io.StringIO()):
+        ans_buckets = build_length_buckets(unique_strs)
+    queries = unique_strs[:num_queries]
+    start = time.perf_counter()
+    for answer in queries:
+        score_answer(answer, ans_buckets, len(unique_strs), -1)
+    return (time.perf_counter() - start) / max(len(queries) * len(unique_strs), 1)
+
+
+def seconds_per_scan(prepared, num_rows, max_scan_rows=200000, repeats=20):
+    '''
+    Measured cost of the whole-table work each engine repeats as it goes:
+    remove_redundancies() masks and slices the full table for every row it
+    visits, and build_similarity_graph() scans an array of every row for
+    every answer block. Timed on a table of up to max_scan_rows rows built
+    from the prepared sample, then scaled linearly to num_rows.
+
+    Returns (tuple of floats): seconds per table slice, seconds per array scan
+    '''
+    scan_rows = max(min(num_rows, max_scan_rows), 1)
+    table = prepared.iloc[np.resize(np.arange(len(prepared)), scan_rows)].reset_index(drop=True)
+    mask = np.zeros(scan_rows, dtype=bool)
+    mask[::max(scan_rows // 20, 1)] = True
+    start = time.perf_counter()
+    for i in range(repeats):
+        mask[:i+1] = False
+        table.loc[mask, :]
+    slice_seconds = (time.perf_counter() - start) / repeats
+
+    scores = np.random.default_rng(0).random(len(prepared))
+    idxs = np.resize(np.arange(len(prepared)), scan_rows)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        np.flatnonzero(scores[idxs] > GRAPH_ANS_FLOOR)
+    array_seconds = (time.perf_counter() - start) / repeats
+    return slice_seconds * num_rows / scan_rows, array_seconds * num_rows / scan_rows
+
+
+def estimate_redundancy_cost(
+        clue_df,
+        settings=DEFAULT_SETTINGS,
+        engines=ENGINES,
+        sample_rows=2000,
+        max_ans_len=50,
+        seed=0
+):
+    '''
+    Predict how long redundancy removal will take and how much memory it
+    will need, for each engine and each setting, without running it on the
+    whole corpus.
+
+    Simplifies every answer line once to get the answer-block histogram and
+    exact counts of answer similarity scores, then times each engine on a
+    block-preserving sample. The prediction adds up:
+        - clue preparation (and lemmatization), scaled linearly from the sample
+        - answer similarity scores, at their measured unit cost
+        - whole-table scans (see seconds_per_scan()): one per visited row for
+        remove_redundancies, one per answer block for similarity_graph
+        - the rest of each engine's per-row work, measured on the sample
+    Answer blocks are counted without lemmatization, which merges a few.
+
+    Inputs:
+        - clue_df (str or DataFrame): as in remove_redundancies()
+        - settings (list of dicts): remove_redundancies() keyword arguments
+        to estimate (skip_thresh, lemmatize, ans_thresh, clue_thresh,
+        dynamic_threshes, thresh_table). The graph engine only depends on
+        lemmatize.
+        - engines (tuple of strs): any of ENGINES
+        - sample_rows (int): rows in the larger timed sample
+        - max_ans_len (int): as in remove_redundancies()
+        - seed (int): random seed for the sample
+    Returns (pandas DataFrame): one row per engine and setting, with
+    predicted minutes and peak memory in MB
+    '''
+    if is_clue_store(clue_df):
+        clue_df, _, _ = open_clue_store(clue_df)
+    elif type(clue_df) == str:
+        clue_df = pd.read_csv(clue_df, sep="\t")
+    num_rows = int(clue_df.loc[:, 'answer'].notna().sum())
+    ans_freqs = simple_answer_freqs(clue_df, max_ans_len)
+    hist = block_histogram(ans_freqs)
+    print(f"\nANSWER BLOCKS ({num_rows} rows, {len(ans_freqs)} distinct simple answers)")
+    print(hist.to_string())
+
+    print("\nTiming redundancy removal on a sample...")
+    sample = block_sample(clue_df, ans_freqs, sample_rows, max_ans_len, seed)
+    sample_freqs = simple_answer_freqs(sample, max_ans_len)
+    sample_size = max(sum(sample_freqs.values()), 1)
+    jaro_cost = seconds_per_jaro(sample_freqs)
+    dynamic_fn = lambda n, table=ans_thresh_hashtable(max_ans_len+1): table[n]
+
+    prep_seconds = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        prepared, _, _, numeric_clue_bag, _ = prepare_dedup_table(sample.copy(), max_ans_len=max_ans_len)
+    bytes_per_row = ((prepared.memory_usage(deep=True).sum() + numeric_clue_bag.nbytes) /
+                     max(len(prepared), 1))
+    input_bytes = clue_df.memory_usage(deep=True).sum()
+    #lemmatize=False is always timed: the per-row costs below are measured against it
+    for lemmatize in sorted({False} | {setting.get('lemmatize', False) for setting in settings}):
+        #precomputed simple answers aren't lemmatized, so they'd be redone
+        prep_sample = sample.drop(columns=['simple_answer'], errors='ignore') if lemmatize else sample.copy()
+        try:
+            prep_seconds[lemmatize] = quiet_seconds(prepare_dedup_table, prep_sample,
+                                                    max_ans_len=max_ans_len, lemmatize=lemmatize)
+        except (ImportError, OSError) as e:
+            print(f"Can't time lemmatize={lemmatize}: {e}")
+    prep_per_row = {lem: seconds / sample_size for lem, seconds in prep_seconds.items()}
+
+    #per-row cost left over once preparation, scores and scans are accounted for
+    sample_slice, sample_scan = seconds_per_scan(prepared, sample_size)
+    full_slice, full_scan = seconds_per_scan(prepared, num_rows)
+    per_row = {}
+    if 'remove_redundancies' in engines:
+        _, num_scores = jaro_comparisons(sample_freqs, dynamic_fn)
+        total = quiet_seconds(remove_redundancies, sample.copy(), max_ans_len=max_ans_len)
+        rest = total - prep_seconds[False] - jaro_cost * num_scores - sample_slice * sample_size
+        per_row['remove_redundancies'] = max(rest, 0) / sample_size
+    if 'similarity_graph' in engines:
+        _, num_scores = jaro_comparisons(sample_freqs, lambda n: GRAPH_ANS_FLOOR)
+        with tempfile.TemporaryDirectory() as graph_dir:
+            total = quiet_seconds(build_similarity_graph, sample.copy(), graph_dir,
+                                  max_ans_len=max_ans_len, ans_floor=GRAPH_ANS_FLOOR)
+        rest = total - prep_seconds[False] - jaro_cost * num_scores - sample_scan * len(sample_freqs)
+        per_row['similarity_graph'] = max(rest, 0) / sample_size
+
+    within_pairs = int(hist.loc[:, 'pairs'].sum())
+    rows = []
+    for engine in engines:
+        engine_settings = settings if engine == 'remove_redundancies' else \
+            [{'lemmatize': lem} for lem in sorted({s.get('lemmatize', False) for s in settings})]
+        for setting in engine_settings:
+            lemmatize = setting.get('lemmatize', False)
+            if lemmatize not in prep_per_row:
+                continue
+            if engine == 'remove_redundancies':
+                if setting.get('thresh_table') is not None:
+                    ans_thresh_fn, _ = load_thresh_table(setting['thresh_table'])
+                elif setting.get('dynamic_threshes', True):
+                    ans_thresh_fn = dynamic_fn
+                else:
+                    ans_thresh_fn = lambda n, t=setting.get('ans_thresh', 0.7): t
+                skip_thresh = setting.get('skip_thresh')
+                num_blocks, num_scores = jaro_comparisons(ans_freqs, ans_thresh_fn, skip_thresh)
+                visited = sum(freq for freq in ans_freqs.values()
+                              if skip_thresh is None or freq >= skip_thresh)
+                loop_seconds = (per_row[engine] + full_slice) * visited
+                peak_bytes = input_bytes + bytes_per_row * num_rows
+            else:
+                num_blocks, num_scores = jaro_comparisons(ans_freqs, lambda n: GRAPH_ANS_FLOOR)
+                loop_seconds = per_row[engine] * num_rows + full_scan * len(ans_freqs)
+                peak_bytes = input_bytes + bytes_per_row * num_rows + GRAPH_EDGE_BYTES * within_pairs
+            seconds = prep_per_row[lemmatize] * num_rows + jaro_cost * num_scores + loop_seconds
+            rows.append({'engine': engine,
+                         'setting': ', '.join(f"{k}={v['name'] if type(v) == dict else v}"
+                                              for k, v in setting.items()) or 'defaults',
+                         'blocks_scored': num_blocks,
+                         'jaro_scores': num_scores,
+                         'minutes': round(seconds / 60, 2),
+                         'peak_mb': round(peak_bytes / 2**20)})
+
+    estimates = pd.DataFrame(rows)
+    print(f"\nREDUNDANCY REMOVAL ESTIMATES ({within_pairs} within-block clue pairs)")
+    print(estimates.to_string(index=False))
+    return estimates
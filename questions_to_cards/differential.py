@@ -0,0 +1,321 @@
+import contextlib
+import importlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import types
+import pandas as pd
+
+# The reference is the pipeline as committed at a git revision, by default
+# where this branch forked from upstream, so a regression is still caught
+# after it has been committed. Pass a tag or commit as rev to compare against
+# anything else. Changes in the working tree are the candidate.
+UPSTREAM_REF = "origin/main"
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIR = "golden_outputs"
+STAGES = ['my_split', 'clean_clue_text', 'clean_answer_text', 'tagstring',
+          'remove_redundancies']
+
+
+def resolve_reference(rev=None):
+    '''
+    The commit to use as the frozen reference: rev if given, otherwise the
+    merge base of HEAD and UPSTREAM_REF.
+
+    Inputs:
+        - rev (str or None): any git revision, e.g. a tag or a commit hash
+    Returns (str): full commit hash
+    '''
+    if rev is None:
+        merge_base = subprocess.run(['git', 'merge-base', 'HEAD', UPSTREAM_REF], cwd=PACKAGE_DIR,
+                                    capture_output=True, text=True)
+        if merge_base.returncode != 0:
+            raise Exception(f"Can't find where HEAD forked from {UPSTREAM_REF} " +
+                            f"({merge_base.stderr.strip()}). Fetch it, or pass the " +
+                            "reference revision as rev (a tag or commit hash).")
+        rev = merge_base.stdout.strip()
+    commit = subprocess.run(['git', 'rev-parse', '--verify', '--quiet', rev + '^{commit}'],
+                            cwd=PACKAGE_DIR, capture_output=True, text=True)
+    if commit.returncode != 0:
+        raise Exception(f"Reference revision {rev!r} isn't a commit in this repository")
+    return commit.stdout.strip()
+
+
+def load_reference(rev=None, stages=STAGES):
+    '''
+    Import the pipeline modules exactly as they were at a git revision,
+    without disturbing the working-tree modules already imported. The frozen
+    modules import each other, not the current ones.
+
+    The frozen similarity module is only imported if remove_redundancies is
+    among the stages, since older revisions load spaCy as soon as it is
+    imported. Until then a placeholder stands in for it.
+
+    Inputs:
+        - rev (str or None): git revision; see resolve_reference()
+        - stages (list of strs): stages that will be compared
+    Returns (SimpleNamespace): my_split, clean_clue_text, clean_answer_text,
+    tagstring and remove_redundancies from that revision
+    '''
+    rev = resolve_reference(rev)
+    repo_root = subprocess.run(['git', 'rev-parse', '--show-toplevel'], cwd=PACKAGE_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    pkg_path = os.path.relpath(PACKAGE_DIR, repo_root)
+    tmpdir = tempfile.mkdtemp(prefix=f"reference_{rev}_")
+    files = subprocess.run(['git', 'ls-tree', '--name-only', rev, pkg_path + '/'], cwd=repo_root,
+                           capture_output=True, text=True, check=True).stdout.split()
+    module_names = []
+    for path in files:
+        if not path.endswith('.py'):
+            continue
+        source = subprocess.run(['git', 'show', f"{rev}:{path}"], cwd=repo_root,
+                                capture_output=True, check=True).stdout
+        with open(os.path.join(tmpdir, os.path.basename(path)), 'wb') as f:
+            f.write(source)
+        module_names.append(os.path.basename(path)[:-3])
+
+    current_modules = {name: sys.modules.pop(name) for name in module_names if name in sys.modules}
+    sys.path.insert(0, tmpdir)
+    try:
+        if 'remove_redundancies' in stages:
+            similarity = importlib.import_module('similarity')
+        else:
+            similarity = types.ModuleType('similarity')
+            def remove_redundancies(*args, **kwargs):
+                raise Exception("Pass 'remove_redundancies' in stages to load_reference()")
+            similarity.remove_redundancies = remove_redundancies
+            sys.modules['similarity'] = similarity
+        text_processing = importlib.import_module('text_processing')
+        backup_to_cards = importlib.import_module('backup_to_cards')
+    finally:
+        sys.path.remove(tmpdir)
+        for name in module_names:
+            sys.modules.pop(name, None)
+        sys.modules.update(current_modules)
+
+    return types.SimpleNamespace(my_split=text_processing.my_split,
+                                 clean_clue_text=text_processing.clean_clue_text,
+                                 clean_answer_text=text_processing.clean_answer_text,
+                                 tagstring=backup_to_cards.tagstring,
+                                 remove_redundancies=similarity.remove_redundancies)
+
+
+def load_candidate():
+    '''The same functions from the working tree.'''
+    from text_processing import my_split, clean_clue_text, clean_answer_text
+    from backup_to_cards import tagstring
+    from similarity import remove_redundancies
+    return types.SimpleNamespace(my_split=my_split,
+                                 clean_clue_text=clean_clue_text,
+                                 clean_answer_text=clean_answer_text,
+                                 tagstring=tagstring,
+                                 remove_redundancies=remove_redundancies)
+
+
+def synthetic_corpus(n=500, seed=0):
+    '''
+    Generate n tossup-like questions that exercise the splitting and cleaning
+    rules: abbreviations, initials, quotations, pronunciation guides, power
+    marks, FTP phrases, moderator notes and messy answer lines.
+
+    Each question also gets a few made-up facts about its answer. The same
+    facts recur across questions, often slightly reworded, so
+    remove_redundancies() has many distinct clues to compare and real
+    near-duplicates to delete.
+
+    Returns (DataFrame): columns like put_together() output
+    '''
+    rng = random.Random(seed)
+    sentences = [
+        "This author wrote “The Windhover.” and other poems.",
+        "In one work by this author, Dr. Faustus meets Mr. Smith on St. Mark's Day.",
+        "This leader's troops fought at the Battle of Lepanto in 1571.",
+        "J. R. R. Tolkien praised this man's translation of \"Beowulf. The poem\" in 1936.",
+        "Note to players: description acceptable.",
+        "This compound (*) has formula CO. It reacts with Fe.",
+        "A character in this novel says “Call me Ishmael. Some years ago…” to the reader.",
+        "This country's capital, Ouagadougou [“wah-gah-DOO-goo”], hosts a film festival.",
+        "For 10 points, name this French painter of Water Lilies.",
+        "FTP, name this element with atomic number 79.",
+        "Moderator note: read slowly and carefully.",
+        "This equation (pronounced “NAH-vee-ay”) describes viscous flow.",
+        "Two answers required.",
+        "The Condor Legion bombed Guernica during this war.",
+        "During this war, the German Condor Legion bombed the Basque city of Guernica.",
+    ]
+    answers = [
+        "Python", "Spanish Civil War [or Guerra Civil Española; prompt on War in Spain]",
+        "gold [or Au; do not accept “silver”]", "<b>Claude Monet</b>",
+        "Gerard Manley Hopkins (accept G. M. Hopkins)", "[MISSING]", "",
+        "carbon monoxide [accept CO, but do not otherwise reveal]",
+        "Moby-Dick &lt;Editor&gt;", "Burkina Faso (reject “Upper Volta”)",
+    ]
+    syllables = ['ka', 'lo', 'mer', 'tin', 'sa', 'vo', 'dra', 'pel', 'qui', 'nor', 'ba', 'ru']
+    def name():
+        return ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).capitalize()
+    nouns = ['treaty', 'opera', 'reaction', 'dynasty', 'novel', 'theorem', 'river', 'painting']
+    verbs = ['inspired', 'ended', 'named', 'funded', 'described', 'replaced', 'translated']
+    facts = [[f"This {rng.choice(nouns)} {rng.choice(verbs)} the {rng.choice(nouns)} of " +
+              f"{name()} {name()} near {name()} in {rng.randint(1500, 2020)}."
+              for _ in range(12)]
+             for _ in answers]
+    rewordings = [lambda fact: fact,
+                  lambda fact: fact.replace("This ", "One ", 1),
+                  lambda fact: fact.replace(" the ", " the famous ", 1),
+                  lambda fact: fact[:-1] + " after a long war."]
+
+    rows = []
+    for i in range(n):
+        answer_i = rng.randrange(len(answers))
+        clue = rng.sample(sentences, rng.randint(2, 6))
+        clue += [rng.choice(rewordings)(fact) for fact in rng.sample(facts[answer_i], 3)]
+        rng.shuffle(clue)
+        rows.append({
+            'clue': ' '.join(clue),
+            'answer': answers[answer_i],
+            'subcategory': rng.choice(['Other Science', 'Religion', None, 'British Literature']),
+            'category': rng.choice(['Science', 'Religion', None, 'Literature']),
+            'type': rng.choice(['tossup', 'bonus', 'bonus_leadin']),
+            'difficulty': rng.randint(1, 10),
+            'setName': f"Set {i % 7}",
+            'setYear': rng.choice([2012, 2018, 2023]),
+        })
+    return pd.DataFrame(rows)
+
+
+def stage_inputs(corpus, ref):
+    '''
+    Build the input of every row-wise stage from the corpus, using the
+    reference pipeline for upstream stages so each stage is compared on
+    identical input.
+    '''
+    split_clues = []
+    clue_rows = []
+    for row in corpus.itertuples(index=False):
+        for clue in ref.my_split(row.clue):
+            split_clues.append(clue)
+            clue_rows.append(row._replace(clue=clue)._asdict())
+    tag_rows = pd.DataFrame(clue_rows)
+    tag_rows['len'] = tag_rows['clue'].str.len()
+    return {'my_split': list(corpus['clue']),
+            'clean_clue_text': split_clues,
+            'clean_answer_text': [str(ans) for ans in corpus['answer']],
+            'tagstring': [row for _, row in tag_rows.iterrows()]}
+
+
+def dedup_input(corpus, ref):
+    '''Clue table for remove_redundancies(), prepared by the reference pipeline.'''
+    inputs = stage_inputs(corpus, ref)
+    clues = pd.DataFrame({
+        'clue': [ref.clean_clue_text(clue) for clue in inputs['clean_clue_text']],
+        'answer': [ref.clean_answer_text(str(row['answer'])) for row in inputs['tagstring']],
+        'tags': [ref.tagstring(row) for row in inputs['tagstring']]})
+    return clues.loc[clues['clue'].str.len() > 25, :].drop_duplicates('clue').reset_index(drop=True)
+
+
+def compare_stage(name, inputs, ref_outputs, cand_outputs):
+    '''
+    Row-by-row comparison of one stage.
+
+    Returns (DataFrame): one row per differing input, with the input,
+    reference output and candidate output
+    '''
+    diffs = [{'stage': name, 'row': i, 'input': str(inp)[:200], 'reference': ref, 'candidate': cand}
+             for i, (inp, ref, cand) in enumerate(zip(inputs, ref_outputs, cand_outputs))
+             if ref != cand]
+    return pd.DataFrame(diffs, columns=['stage', 'row', 'input', 'reference', 'candidate'])
+
+
+def run_differential(
+        corpus=None,
+        rev=None,
+        candidate=None,
+        stages=STAGES,
+        golden_dir=GOLDEN_DIR,
+        save_golden=False,
+        max_diffs_shown=5
+):
+    '''
+    Run the reference pipeline and a candidate (by default, the working
+    tree) side by side on a corpus and report every output that differs.
+
+    Inputs:
+        - corpus (DataFrame or None): questions in put_together() format;
+        a synthetic corpus is generated if None
+        - rev (str or None): git revision to use as the frozen reference;
+        see resolve_reference()
+        - candidate (SimpleNamespace or None): functions to test, in the
+        format of load_candidate(); defaults to the working tree
+        - stages (list of strs): subset of STAGES to compare.
+        remove_redundancies is slow and needs spaCy and batch_jaro_winkler.
+        - golden_dir (str or None): directory of saved golden outputs. If
+        outputs are saved there, the candidate is checked against them too.
+        - save_golden (boolean): save the reference outputs as the new goldens
+        - max_diffs_shown (int): per-row diffs printed for each failing stage
+    Returns (tuple): whether every stage passed, DataFrame of all diffs
+    '''
+    if corpus is None:
+        corpus = synthetic_corpus()
+    corpus = corpus.fillna({'clue': '', 'answer': ''})
+    ref = load_reference(rev, stages)
+    cand = candidate if candidate is not None else load_candidate()
+    inputs = stage_inputs(corpus, ref)
+
+    all_diffs = []
+    summary = []
+    for stage in stages:
+        if stage == 'remove_redundancies':
+            stage_in = [dedup_input(corpus, ref)]
+            # the dedup pass prints every row it considers; keep the report readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                ref_out = [sorted(ref.remove_redundancies(stage_in[0].copy())['clue'])]
+                cand_out = [sorted(cand.remove_redundancies(stage_in[0].copy())['clue'])]
+        else:
+            stage_in = inputs[stage]
+            ref_out = [getattr(ref, stage)(inp) for inp in stage_in]
+            cand_out = [getattr(cand, stage)(inp) for inp in stage_in]
+        diffs = compare_stage(stage, stage_in, ref_out, cand_out)
+
+        golden_path = None if golden_dir is None else os.path.join(golden_dir, f"{stage}.json")
+        if save_golden:
+            os.makedirs(golden_dir, exist_ok=True)
+            with open(golden_path, 'w', encoding='utf-8') as f:
+                json.dump(ref_out, f, ensure_ascii=False)
+        elif golden_path is not None and os.path.exists(golden_path):
+            with open(golden_path, encoding='utf-8') as f:
+                golden_out = json.load(f)
+            if len(golden_out) != len(cand_out):
+                print(f"WARNING: golden outputs for {stage} were saved from a different corpus")
+            else:
+                golden_diffs = compare_stage(stage + ' (golden)', stage_in, golden_out,
+                                             json.loads(json.dumps(cand_out)))
+                diffs = pd.concat((diffs, golden_diffs), axis=0)
+
+        summary.append((stage, len(stage_in), len(diffs)))
+        all_diffs.append(diffs)
+        if len(diffs) > 0:
+            print(f"\n{stage}: {len(diffs)} differing rows. First {max_diffs_shown}:")
+            print(diffs.head(max_diffs_shown).to_string(index=False))
+
+    print("\nDIFFERENTIAL TEST SUMMARY")
+    for stage, num_rows, num_diffs in summary:
+        print(f"{'PASS' if num_diffs == 0 else 'FAIL'}  {stage}: {num_rows} rows, {num_diffs} diffs")
+    all_diffs = pd.concat(all_diffs, axis=0).reset_index(drop=True)
+    passed = len(all_diffs) == 0
+    print("ALL STAGES MATCH" if passed else "DIFFERENCES FOUND")
+    return passed, all_diffs
+
+
+if __name__ == '__main__':
+    if os.path.exists('tossups.json') and os.path.exists('bonuses.json'):
+        from backup_to_cards import intake, reformat, put_together
+        tossups, bonuses = intake()
+        corpus = put_together(tossups, reformat(bonuses))
+        corpus = corpus.sample(min(2000, len(corpus)), random_state=0)
+    else:
+        corpus = None
+    run_differential(corpus, rev=sys.argv[1] if len(sys.argv) > 1 else None, stages=STAGES[:-1])
@@ -1,5 +1,9 @@
+import json
 import math
 
+#clue bags bigger than this use the threshold for this size
+CLUE_TABLE_SIZE = 200
+
 def dynamic_ans_thresh(n: int) -> float:
     '''
     Returns a Jaro-winkler similarity threshold for a simple answer string
@@ -77,6 +81,66 @@ def dynamic_clue_thresh(n: int) -> float:
     else:
         return (math.floor(n/2) + 1.0) / n
     
+def clue_thresh_hashtable(n=CLUE_TABLE_SIZE, frac=0.5, short_bag=3) -> dict:
+    '''
+    Clue overlap thresholds for every bag size up to n, generalizing
+    dynamic_clue_thresh(): total overlap for bags of short_bag words or
+    fewer, then (floor(n * frac) + 1) / n. Defaults give dynamic_clue_thresh().
+    '''
+    return {i: 1.0 if i <= short_bag else (math.floor(i * frac) + 1.0) / i
+            for i in range(n + 1)}
+
+
+def make_thresh_table(ans_params=None, clue_params=None, max_ans_len=50) -> dict:
+    '''
+    A threshold table remove_redundancies() can load (see load_thresh_table()):
+    answer thresholds from ans_thresh_hashtable() and clue thresholds from
+    clue_thresh_hashtable(), with their keyword arguments recorded so the
+    curve can be rebuilt.
+
+    Inputs:
+        -ans_params (dict or None): keyword arguments of ans_thresh_hashtable()
+        besides n; None for its defaults
+        -clue_params (dict or None): keyword arguments of clue_thresh_hashtable()
+        besides n; None for its defaults
+        -max_ans_len (int): as in remove_redundancies()
+    Returns (dict): name, params, 'ans' and 'clue' thresholds by length/size
+    '''
+    ans_params, clue_params = ans_params or {}, clue_params or {}
+    describe = lambda params: ','.join(f"{k}={v}" for k, v in params.items()) or 'default'
+    return {'name': f"ans({describe(ans_params)}) clue({describe(clue_params)})",
+            'params': {'ans': ans_params, 'clue': clue_params},
+            'ans': ans_thresh_hashtable(max_ans_len + 1, **ans_params),
+            'clue': clue_thresh_hashtable(**clue_params)}
+
+
+def save_thresh_table(table, filepath):
+    '''Write a threshold table as JSON.'''
+    with open(filepath, 'w') as f:
+        json.dump(table, f, indent=1)
+
+
+def load_thresh_table(table):
+    '''
+    Turn a threshold table (or the path of one saved by save_thresh_table())
+    into lookup functions. Lengths and bag sizes past the end of the table
+    use its last threshold.
+
+    Returns (tuple of functions): answer threshold by simple answer length,
+    clue threshold by bag size
+    '''
+    if type(table) == str:
+        with open(table) as f:
+            table = json.load(f)
+    lookups = []
+    for kind in ['ans', 'clue']:
+        # JSON object keys are strings
+        threshes = {int(n): thresh for n, thresh in table[kind].items()}
+        largest = max(threshes)
+        lookups.append(lambda n, threshes=threshes, largest=largest: threshes[min(n, largest)])
+    return tuple(lookups)
+
+
 if __name__ == '__main__':
     print(ans_thresh_hashtable(50))
 
@@ -1,6 +1,5 @@
 import pandas as pd
-from qbreader import query
-from backup_to_cards import intake
+import os
 import re
 
 ALL_CATEGORIES = {
@@ -75,7 +74,8 @@ def user_interface():
             difficulties = sorted(list(difficulties))
             print(f"You selected difficulties: {difficulties}")
         else:
-            print("That's not a valid difficulty string")   
+            print("That's not a valid difficulty string. All difficulties will be included")
+            difficulties = list(range(1,11))
 
         cats_raw = input(f"What categories would you like to include?\n" +
                          f"Type TOP-LEVEL qbreader categories separated by COMMAS.\n" +
@@ -83,7 +83,7 @@ def user_interface():
         cats_raw = re.split(',', cats_raw)
         cats_raw = list({i.strip().lower().capitalize() for i in cats_raw if i != ''})
         categories = set()
-        if ("all" in cats_raw or len(cats_raw) == 0):
+        if ("All" in cats_raw or len(cats_raw) == 0):
             print("Getting all categories")
             categories = categories.union({key for key in ALL_CATEGORIES.keys()}) 
         else:
@@ -114,8 +114,9 @@ def user_interface():
         print(f"You selected categories: {categories}")
         print(f'(Invalid categories were removed)')
 
-        #TODO: subcategories
         CATS_WITH_SUBCATS = ["Literature", "Science", "History", "Fine Arts"]
+        subcategories = set()
+        narrowed_subcats = False
         for cat in categories:
             if cat in CATS_WITH_SUBCATS:
                 print(f"Valid subcategories for {cat}: {ALL_CATEGORIES[cat]}")
@@ -123,7 +124,31 @@ def user_interface():
                                     "Type valid SUBCATEGORIES separated by COMMAS.\n" +
                                     "To get all subcategories, type 'ALL' or just press Enter.\n" +
                                     f"Valid subcategories for {cat} are: {ALL_CATEGORIES[cat]}")
-                print("TODO: add cleaned version of those subcategories you just typed to the list")
+                these_subcats = {i.strip().lower() for i in re.split(',', these_subcats) if i.strip() != ''}
+                valid_subcats = {sub for sub in ALL_CATEGORIES[cat] if sub.lower() in these_subcats}
+                if len(valid_subcats) == 0 or 'all' in these_subcats:
+                    subcategories = subcategories.union(ALL_CATEGORIES[cat])
+                else:
+                    subcategories = subcategories.union(valid_subcats)
+                    narrowed_subcats = True
+            else:
+                # categories without subcategories use their own name as one
+                subcategories.add(cat)
+        if narrowed_subcats:
+            subcategories = sorted(list(subcategories))
+            print(f"You selected subcategories: {subcategories}")
+        else:
+            subcategories = None
+
+        years_raw = input("What range of years would you like to include?\n" +
+                          "Type two years separated by a hyphen (e.g. 2015-2020), " +
+                          "or press Enter to skip/include all: ")
+        years = None
+        if re.match(r'^\s*[0-9]{4}\s*-\s*[0-9]{4}\s*$', years_raw):
+            years = tuple(sorted(int(yr) for yr in re.split('-', years_raw)))
+            print(f"You selected years: {years[0]} to {years[1]}")
+        elif years_raw != '':
+            print("That's not a valid year range. All years will be included")
         #TODO: searchType
         #TODO: queryString
         #TODO: questionType
@@ -131,14 +156,35 @@ def user_interface():
 
         if source == 'db':
             print("Querying QBReader API...")
-            api_call = query(difficulties=difficulties, categories=categories)
-
-            tossups = pd.json_normalize(api_call['tossups']['questionArray'])
-            bonuses = pd.json_normalize(api_call['bonuses']['questionArray'])
+            from qbreader_client import query_all
+            tossups, bonuses = query_all(difficulties=difficulties,
+                                         categories=categories,
+                                         subcategories=subcategories,
+                                         qtype=qtype)
 
         if source == 'backup':
-            #TODO: filter down backup using user input
-            tossups, bonuses = intake()
+            # a full selection is passed as None so unlabeled questions survive
+            filters = {'difficulties': (None if len(difficulties) == 10 else difficulties),
+                       'categories': (None if len(categories) == len(ALL_CATEGORIES) else categories),
+                       'subcategories': subcategories,
+                       'years': years,
+                       'qtype': qtype}
+            # the indexed database from corpus_db.build_corpus_db() is much
+            # faster than reading the backup, if it has been built from the
+            # backup files that are here now
+            from corpus_db import CORPUS_DB, newer_backup_files, query_corpus
+            newer_files = newer_backup_files(CORPUS_DB) if os.path.exists(CORPUS_DB) else []
+            if len(newer_files) > 0:
+                print(f"WARNING: {', '.join(newer_files)} changed or went missing after {CORPUS_DB} was built. " +
+                      "Reading the backup instead; rebuild the database with " +
+                      "corpus_db.build_corpus_db() to speed this up again.")
+            if os.path.exists(CORPUS_DB) and len(newer_files) == 0:
+                print(f"Reading questions from corpus database {CORPUS_DB}...")
+                tossups, bonuses = query_corpus(CORPUS_DB, **filters)
+            else:
+                print("Reading questions from QBReader backup files...")
+                from backup_to_cards import intake
+                tossups, bonuses = intake(**filters)
 
         #Feed result of this function into rest of pipeline from backup_to_cards()
         return tossups, bonuses
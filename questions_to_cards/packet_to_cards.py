@@ -1,5 +1,3 @@
-from PyPDF2 import PdfReader
-from docx import Document
 from datetime import datetime
 import re
 import pandas as pd
@@ -65,6 +63,7 @@ def pdf_to_text(packet_filepath):
         than the question/part level
     Returns (pandas DataFrame): DataFrame of cards
     '''
+    from PyPDF2 import PdfReader
     reader = PdfReader(packet_filepath) 
 
     all_text = ''
@@ -86,6 +85,7 @@ def docx_to_text(packet_filepath):
     #TODO: Check whether ANSWER: is in the right place (every odd-index up until
     # bonuses start, at which point it's 3-2-2 to account for bonus leadins)
 
+    from docx import Document
     all_text = ""
     doc = Document(packet_filepath)
     for para in doc.paragraphs:
@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import json
+import os
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pandas as pd
+
+API_URL = "https://www.qbreader.org/api/query"
+CACHE_DIR = ".qbreader_cache"
+PAGE_SIZE = 500
+MAX_CONNECTIONS = 8
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def query_all(
+        difficulties=None,
+        categories=None,
+        subcategories=None,
+        qtype='all',
+        query_string='',
+        base_url=API_URL,
+        cache_dir=CACHE_DIR,
+        page_size=PAGE_SIZE,
+        max_connections=MAX_CONNECTIONS
+):
+    '''
+    Pull every question matching a selection from the QBReader API. The
+    selection is split into one shard per (difficulty, category) pair, and
+    every page of every shard is fetched concurrently. Synchronous wrapper
+    around fetch_all() so it can be called like qbreader.query().
+
+    Inputs:
+        -difficulties (list of ints or None): difficulties to pull
+        -categories (list of strs or None): top-level categories to pull
+        -subcategories (list of strs or None): sent along with every shard
+        -qtype (str): 'tossup', 'bonus', or 'all'
+        -query_string (str): text search, empty for everything
+        -base_url (str): query endpoint; point at a stub server for testing
+        -cache_dir (str or None): where to keep cached responses; None disables
+        -page_size (int): maxReturnLength for each request
+        -max_connections (int): most requests allowed in flight at once
+    Returns (tuple of DataFrames): tossups, bonuses, deduplicated by _id
+    '''
+    tossup_list, bonus_list = asyncio.run(fetch_all(
+        difficulties=difficulties,
+        categories=categories,
+        subcategories=subcategories,
+        qtype=qtype,
+        query_string=query_string,
+        base_url=base_url,
+        cache_dir=cache_dir,
+        page_size=page_size,
+        max_connections=max_connections
+    ))
+
+    tossups = pd.json_normalize(tossup_list)
+    bonuses = pd.json_normalize(bonus_list)
+    return tossups, bonuses
+
+
+async def fetch_all(
+        difficulties=None,
+        categories=None,
+        subcategories=None,
+        qtype='all',
+        query_string='',
+        base_url=API_URL,
+        cache_dir=CACHE_DIR,
+        page_size=PAGE_SIZE,
+        max_connections=MAX_CONNECTIONS
+):
+    '''
+    Async body of query_all(). Fetches the first page of each shard to learn
+    how many questions it holds, then schedules the remaining pages.
+
+    Returns (tuple of lists of dicts): tossups, bonuses
+    '''
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    shards = []
+    for diff in (difficulties or [None]):
+        for cat in (categories or [None]):
+            params = {'queryString': query_string,
+                      'questionType': qtype,
+                      'maxReturnLength': page_size}
+            if diff is not None:
+                params['difficulties'] = str(diff)
+            if cat is not None:
+                params['categories'] = cat
+            if subcategories:
+                params['subcategories'] = ','.join(subcategories)
+            shards.append(params)
+
+    import aiohttp
+    semaphore = asyncio.Semaphore(max_connections)
+    connector = aiohttp.TCPConnector(limit=max_connections)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        first_pages = await asyncio.gather(*[
+            fetch_page(session, semaphore, base_url, shard, 1, cache_dir)
+            for shard in shards
+        ])
+
+        later_requests = []
+        for shard, first_page in zip(shards, first_pages):
+            num_pages = max(math.ceil(first_page['tossups']['count'] / page_size),
+                            math.ceil(first_page['bonuses']['count'] / page_size))
+            for page in range(2, num_pages + 1):
+                later_requests.append(
+                    fetch_page(session, semaphore, base_url, shard, page, cache_dir))
+        later_pages = await asyncio.gather(*later_requests)
+
+    tossups = {}
+    bonuses = {}
+    for response in first_pages + later_pages:
+        for question in response['tossups']['questionArray']:
+            tossups.setdefault(question['_id'], question)
+        for question in response['bonuses']['questionArray']:
+            bonuses.setdefault(question['_id'], question)
+
+    print(f"Fetched {len(tossups)} unique tossups and {len(bonuses)} unique bonuses " +
+          f"in {len(first_pages) + len(later_pages)} pages")
+    return list(tossups.values()), list(bonuses.values())
+
+
+async def fetch_page(session, semaphore, base_url, shard, page, cache_dir):
+    '''
+    Fetch one page of one shard, serving it from the on-disk cache when
+    possible and retrying with exponential backoff on connection errors and
+    throttled/server-error responses.
+
+    Returns (dict): parsed API response
+    '''
+    import aiohttp
+    params = dict(shard, tossupPagination=page, bonusPagination=page)
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, cache_key(base_url, params) + ".json")
+        if os.path.exists(cache_path):
+            with open(cache_path, encoding='utf-8') as f:
+                return json.load(f)
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with semaphore:
+                async with session.get(base_url, params=params) as resp:
+                    if resp.status in RETRY_STATUSES:
+                        raise aiohttp.ClientResponseError(
+                            resp.request_info, resp.history, status=resp.status)
+                    resp.raise_for_status()
+                    response = await resp.json(content_type=None)
+            break
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if (attempt == MAX_RETRIES or
+                    (isinstance(e, aiohttp.ClientResponseError) and e.status not in RETRY_STATUSES)):
+                raise
+            await asyncio.sleep(BACKOFF_BASE * 2**attempt)
+
+    if cache_path is not None:
+        # write then rename so a crash never leaves a half-written cache entry
+        with open(cache_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(response, f)
+        os.replace(cache_path + ".tmp", cache_path)
+    return response
+
+
+def cache_key(base_url, params):
+    '''Stable filename for a request: hash of the URL and sorted parameters.'''
+    request_str = base_url + '?' + json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(request_str.encode('utf-8')).hexdigest()
+
+
+###TESTS###
+
+class StubQBReaderHandler(BaseHTTPRequestHandler):
+    '''
+    Minimal stand-in for the QBReader /api/query endpoint. Serves
+    num_questions tossups and bonuses per (difficulty, category) shard with
+    the API's pagination, and fails every third request with a 503 to
+    exercise the retry path.
+    '''
+    num_questions = 23
+    requests_served = 0
+
+    def do_GET(self):
+        cls = type(self)
+        cls.requests_served += 1
+        if cls.requests_served % 3 == 0:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        page_size = int(params.get('maxReturnLength', 25))
+        shard = f"{params.get('difficulties', 'x')}-{params.get('categories', 'x')}"
+
+        def page_of(kind, page):
+            # question 0 of every shard is shared, to check dedup by _id
+            ids = [f"{kind}-shared"] + [f"{kind}-{shard}-{i}" for i in range(1, cls.num_questions)]
+            start = (page - 1) * page_size
+            return {'count': len(ids),
+                    'questionArray': [{'_id': i, 'question': i, 'answer': 'stub'}
+                                      for i in ids[start:start + page_size]]}
+
+        body = json.dumps({
+            'tossups': page_of('tossup', int(params.get('tossupPagination', 1))),
+            'bonuses': page_of('bonus', int(params.get('bonusPagination', 1)))
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def stub_server_test(cache_dir=".qbreader_cache_test"):
+    '''
+    Run query_all() against a local stub server twice: the first run must
+    fetch every page despite injected failures, the second must be served
+    entirely from the cache.
+    '''
+    import shutil
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubQBReaderHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/api/query"
+
+    try:
+        tossups, bonuses = query_all(difficulties=[1, 2], categories=['Science', 'History'],
+                                     base_url=base_url, cache_dir=cache_dir, page_size=5)
+        expected = 4 * (StubQBReaderHandler.num_questions - 1) + 1
+        assert len(tossups) == expected and len(bonuses) == expected
+        assert tossups['_id'].is_unique
+
+        served_before = StubQBReaderHandler.requests_served
+        cached_tossups, _ = query_all(difficulties=[1, 2], categories=['Science', 'History'],
+                                      base_url=base_url, cache_dir=cache_dir, page_size=5)
+        assert StubQBReaderHandler.requests_served == served_before, "Cache was not used"
+        assert len(cached_tossups) == expected
+    finally:
+        server.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    print("Stub server test passed")
+
+
+if __name__ == '__main__':
+    stub_server_test()
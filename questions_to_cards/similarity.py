@@ -2,15 +2,30 @@ import pandas as pd
 import numpy as np
 import string
 import re
+import os
+import json
+import hashlib
+import time
 from unidecode import unidecode
 from tqdm import tqdm
 tqdm.pandas()
 from collections import Counter
-import spacy
-import batch_jaro_winkler as bjw # by Dominik Bousquet, https://github.com/dbousque/batch_jaro_winkler
-from dynamic_threshes import ans_thresh_hashtable, dynamic_clue_thresh
+from dynamic_threshes import ans_thresh_hashtable, dynamic_clue_thresh, load_thresh_table
+from clue_index import is_plain_term
+from clue_store import write_clue_store, open_clue_store, token_id_matrix, is_clue_store
+from utility import arrow_strings, uses_arrow_strings, str_values
 
-nlp = spacy.load("en_core_web_sm", exclude=["parser", "ner"])
+#spaCy and batch_jaro_winkler are slow to import, so they load on first use
+NLP = None
+
+
+def get_nlp():
+    '''Load the spaCy model the first time lemmatization needs it.'''
+    global NLP
+    if NLP is None:
+        import spacy
+        NLP = spacy.load("en_core_web_sm", exclude=["parser", "ner"])
+    return NLP
 
 CLUES_FILEPATH = 'test_output/clues_2023512-104755.csv'
 
@@ -29,28 +44,47 @@ ans_stopwords = {'accept', 'prompt', 'reject', 'directed', 'antiprompt',
 all_stopwords = qb_stopwords | more_stopwords | indicator_stopwords
 qb_punctuation = string.punctuation + '“”'
 
+# text-normalization patterns, shared by distill(), wordify() and normalize_column()
+REJECT_SPLIT_RE = re.compile(r'(?:do not|don’t)\s(?:accept|prompt|take)\s|reject\s')
+BRACKETS_RE = re.compile(r'\[[^\[]+\]|\([^\(]+\)|{[^\{]+}')
+NON_WORD_RE = re.compile(r'[^\w\s\d]')
+NORM_COLUMNS = ['norm_clue', 'norm_answer']
+#hash of the clue and answer each row's normalized columns were made from
+NORM_HASH_COLUMN = 'norm_hash'
+
 pd.set_option('display.max_colwidth', 400)
 
 
-def subset(clues, ans_term=None, clue_term=None, write_out=False):
+def subset(clues, ans_term=None, clue_term=None, write_out=False, index=None,
+           normalized=False):
     '''
     Generate subsets of a DataFrame for quicker similarity comparison.
 
     Inputs:
         - clues (string or DataFrame): can take a filepath string to import
-        from filepath; otherwise, take an existing DataFrame of clues
+        from filepath (a .csv, or a clue store written by save_clue_store());
+        otherwise, take an existing DataFrame of clues
         - ans_term (string or None): term that must be in answer line upon
         filtering.
         - clue_term (string or None): term that must be in clue upon
         filtering. As of now, ans_term filter is applied FIRST, and having
         a non-null value for both ans_term and clue_term produces the strict
         INTERSECTION in which both are present.
-        #TODO: Consider altering behavior to allow for UNION/OR.
         - write_out (boolean): whether to write to file or not.
+        - index (ClueIndex or None): prebuilt index over clues. If given and
+        both terms are plain strings (no regex characters), the lookup is
+        served from the index instead of scanning every row. For AND/OR or
+        whole-word queries, use index.query() directly.
+        - normalized (boolean): match terms against the norm_clue and
+        norm_answer columns (see add_normalized_columns()) as plain substrings
+        instead of scanning raw text with a regex. Ignores case, accents and
+        punctuation; bracketed alternates in answer lines are not searched.
 
     Returns (pandas DataFrame): the subset you want.
     '''
-    if type(clues) == str:
+    if is_clue_store(clues):
+        clues, _, _ = open_clue_store(clues)
+    elif type(clues) == str:
         clues = pd.read_csv(clues, sep='\t')
 
     assert type(clues) == pd.core.frame.DataFrame, "You don't have a working df"
@@ -58,60 +92,155 @@ def subset(clues, ans_term=None, clue_term=None, write_out=False):
     if ans_term is None and clue_term is None:
         return clues
 
+    if normalized:
+        subset = normalized_subset(add_normalized_columns(clues), ans_term, clue_term)
+    elif index is not None and is_plain_term(ans_term) and is_plain_term(clue_term):
+        assert index.df is clues, "This index was built for a different DataFrame"
+        subset = index.query(ans_term, clue_term, how='and')
+    else:
+        subset = scan_subset(clues, ans_term, clue_term)
+
+    if write_out:
+        write_filepath = f'subset_{ans_term}_{clue_term}.csv'
+        subset.to_csv(write_filepath, sep='\t', escapechar='\\', index=False)
+    return subset
+
+
+def scan_subset(clues, ans_term, clue_term):
+    '''
+    Filter clues by scanning the answer and clue columns with a regex,
+    ignoring case. Case is folded with str.casefold() on both the terms and
+    the text, as ClueIndex does, so the two always agree. Helper for
+    subset() when no index is available.
+    '''
     subset = clues
 
     if ans_term is not None:
-        ans_term = ans_term.lower()
+        ans_term = ans_term.casefold()
         print(ans_term)
-        subset = subset.loc[(subset.loc[:, 'answer'].str.contains(ans_term, flags=re.IGNORECASE)) &
+        subset = subset.loc[(subset.loc[:, 'answer'].str.casefold().str.contains(ans_term)) &
                             (~subset.loc[:, 'answer'].isna()), :]  # some answers are 'nan'
         subset.reset_index(drop=True, inplace=True)
     if clue_term is not None:
         print(clue_term)
-        clue_term = clue_term.lower()
-        subset = subset.loc[(subset.loc[:, 'clue'].str.contains(clue_term, flags=re.IGNORECASE)), :]
+        clue_term = clue_term.casefold()
+        subset = subset.loc[(subset.loc[:, 'clue'].str.casefold().str.contains(clue_term)), :]
         subset.reset_index(drop=True, inplace=True)
-
-    if write_out:
-        write_filepath = f'subset_{ans_term}_{clue_term}.csv'
-        subset.to_csv(write_filepath, sep='\t', escapechar='\\', index=False)
     return subset
 
 
+def normalized_subset(clues, ans_term, clue_term):
+    '''
+    Filter clues by plain substring search of normalized terms in the
+    normalized columns. Helper for subset(normalized=True).
+    '''
+    mask = np.full((len(clues),), True)
+    if ans_term is not None:
+        ans_term = normalize_column(pd.Series([ans_term]), answerline=True)[0]
+        mask &= clues.loc[:, 'norm_answer'].str.contains(ans_term, regex=False).to_numpy()
+        mask &= ~clues.loc[:, 'answer'].isna().to_numpy()
+    if clue_term is not None:
+        clue_term = normalize_column(pd.Series([clue_term]))[0]
+        mask &= clues.loc[:, 'norm_clue'].str.contains(clue_term, regex=False).to_numpy()
+    return clues.loc[mask, :].reset_index(drop=True)
+
+
+def normalize_column(texts, answerline=False):
+    '''
+    Normalize a whole column of clues or answer lines at once: unidecode,
+    lowercase and strip punctuation. For answer lines, also drop everything
+    after reject/do not accept and any bracketed text first. This is the
+    text distill() and wordify() work from, so it only has to be done once.
+
+    Inputs:
+        - texts (pandas Series): 'clue' or 'answer' column
+        - answerline (boolean): whether these are answer lines
+    Returns (pandas Series): normalized text
+    '''
+    texts = str_values(texts)
+    if answerline:
+        # get rid of everything after reject/do not accept
+        texts = texts.str.split(REJECT_SPLIT_RE, n=1, regex=True).str[0]
+        texts = texts.str.replace(BRACKETS_RE, '', regex=True)
+    texts = texts.str.lower().map(unidecode)
+    return texts.str.replace(NON_WORD_RE, '', regex=True)
+
+
+def add_normalized_columns(clue_df, cache_path=None):
+    '''
+    Add norm_clue and norm_answer columns (see normalize_column()) to a clue
+    DataFrame. Columns that are already there are reused only if each row's
+    clue and answer still hash to the NORM_HASH_COLUMN stored with them.
+    With a cache_path, the columns are saved as a .feather file and reloaded
+    on later runs, as long as the clues and answers haven't changed.
+
+    Returns (df): the same DataFrame, with normalized columns
+    '''
+    row_hashes = pd.util.hash_pandas_object(
+        str_values(clue_df.loc[:, ['clue', 'answer']]), index=False).to_numpy()
+    if all(col in clue_df.columns for col in NORM_COLUMNS + [NORM_HASH_COLUMN]):
+        if np.array_equal(clue_df.loc[:, NORM_HASH_COLUMN].to_numpy(), row_hashes):
+            return clue_df
+
+    if any(col in clue_df.columns for col in NORM_COLUMNS):
+        print("Clues or answers changed since they were normalized")
+        # simple answers are made from norm_answer, so they are out of date too
+        clue_df = clue_df.drop(columns=['simple_answer'], errors='ignore')
+
+    if cache_path is not None and os.path.exists(cache_path):
+        cached = pd.read_feather(cache_path)
+        if np.array_equal(cached.loc[:, 'row_hash'].to_numpy(), row_hashes):
+            print(f"Using normalized text cached at {cache_path}")
+            for col in NORM_COLUMNS:
+                clue_df.loc[:, col] = cached.loc[:, col].to_numpy()
+            clue_df.loc[:, NORM_HASH_COLUMN] = row_hashes
+            return arrow_strings(clue_df) if uses_arrow_strings(clue_df) else clue_df
+
+    print("Normalizing clue and answer text...")
+    clue_df.loc[:, 'norm_clue'] = normalize_column(clue_df.loc[:, 'clue'])
+    clue_df.loc[:, 'norm_answer'] = normalize_column(clue_df.loc[:, 'answer'], answerline=True)
+    clue_df.loc[:, NORM_HASH_COLUMN] = row_hashes
+
+    if cache_path is not None:
+        cached = clue_df.loc[:, NORM_COLUMNS].reset_index(drop=True)
+        cached.insert(0, 'row_hash', row_hashes)
+        cached.to_feather(cache_path)
+    return arrow_strings(clue_df) if uses_arrow_strings(clue_df) else clue_df
+
+
 def distill(
         phrase: str,
         answerline=False,
         remove_brackets=True,
         lemmatize=False,
-        max_length=50) -> str:
+        max_length=50,
+        normalized=False) -> str:
     '''
     Distill a clue or answer line down by removing stopwords, spaces, and
     punctuation to make Jaro-Winkler string distance score more robust.
     If it's an answer line, removes acceptable/promptable answers to expand
-    range of matching.
+    range of matching. Pass normalized=True if phrase already came out of
+    normalize_column() (with the same answerline setting).
     '''
     if type(phrase) != str:
         phrase = str(phrase)
 
-    if answerline:
-        REJECT_RE = r'(?:do not|don’t)\s(?:accept|prompt|take)\s|reject\s'
-        # get rid of everything after reject/do not accept
-        phrase = re.split(REJECT_RE, phrase)[0]
+    if not normalized:
+        if answerline:
+            # get rid of everything after reject/do not accept
+            phrase = REJECT_SPLIT_RE.split(phrase)[0]
 
-    if remove_brackets:
-        phrase = re.sub(r'\[[^\[]+\]|\([^\(]+\)|{[^\{]+}', '', phrase)
+        if remove_brackets:
+            phrase = BRACKETS_RE.sub('', phrase)
 
-    try:
-        phrase = re.sub(r'[^\w\s\d]', '', unidecode(phrase.lower()))
-    except AttributeError:  # it gets 'nan' sometimes which messes it up
-        phrase = re.sub(r'[^\w\s\d]', '', unidecode(phrase.lower()))
+        phrase = NON_WORD_RE.sub('', unidecode(phrase.lower()))
     phrase = [word for word in phrase.split() if word not in qb_stopwords]
     if answerline:
         phrase = [word for word in phrase if word not in ans_stopwords]
 
     #Source: https://www.machinelearningplus.com/nlp/lemmatization-examples-python/
     if lemmatize:
-        doc = nlp(' '.join(phrase))
+        doc = get_nlp()(' '.join(phrase))
         distilled_phrase = ''.join([token.lemma_ for token in doc])
     else:
         distilled_phrase = ''.join(phrase)
@@ -122,20 +251,21 @@ def distill(
     return distilled_phrase
 
 
-def wordify(clue: str, answerline=False, lemmatize=False):
+def wordify(clue: str, answerline=False, lemmatize=False, normalized=False):
     '''
     Convert a sentence/clue/answer into a set of unique non-stopword words.
     This prepares the input for Jaccard or overlap similarity comparisons.
+    Pass normalized=True if clue already came out of normalize_column().
     '''
-    if answerline:
-        REJECT_RE = r'(?:do not|don’t)\s(?:accept|prompt|take)\s|reject\s'
-        # get rid of everything after reject/do not accept
-        clue = re.split(REJECT_RE, clue)[0]
+    if not normalized:
+        if answerline:
+            # get rid of everything after reject/do not accept
+            clue = REJECT_SPLIT_RE.split(clue)[0]
 
-    clue = re.sub(r'[^\w\s\d]', '', unidecode(clue.lower()))
+        clue = NON_WORD_RE.sub('', unidecode(clue.lower()))
 
     if lemmatize:
-        doc = nlp(clue)
+        doc = get_nlp()(clue)
         word_set = {token.lemma_ for token in doc}
         word_set = {wd for wd in word_set if wd not in all_stopwords}
     else:
@@ -147,6 +277,332 @@ def wordify(clue: str, answerline=False, lemmatize=False):
         return word_set
 
 
+def fingerprint_clue(clue: str, normalized=False) -> str:
+    '''
+    Reduce a clue to the words that matter, in order: unidecoded, lowercased,
+    and stripped of punctuation, extra whitespace and qb_stopwords. Clues
+    that differ only in quote style, accents or case get the same fingerprint.
+    '''
+    if not normalized:
+        clue = NON_WORD_RE.sub('', unidecode(str(clue).lower()))
+    return ' '.join(word for word in clue.split() if word not in qb_stopwords)
+
+
+def fingerprint_dedup(clue_df):
+    '''
+    Cheap exact-duplicate pass to run before remove_redundancies(). Hashes
+    each row's fingerprinted clue together with its distilled answer line and
+    keeps one row per hash, preferring the longest clue.
+
+    Inputs:
+        - clue_df (DataFrame): clues with 'clue' and 'answer' columns
+    Returns (df): the dataframe with fingerprint duplicates dropped, in its
+    original order
+    '''
+    clue_df = add_normalized_columns(clue_df)
+    print("Fingerprinting clues and answers...")
+    clue_fps = clue_df.loc[:, 'norm_clue'].progress_apply(
+        lambda x: fingerprint_clue(x, normalized=True))
+    ans_fps = clue_df.loc[:, 'norm_answer'].progress_apply(
+        lambda x: distill(x, answerline=True, normalized=True))
+    fingerprints = pd.util.hash_array((clue_fps + '|' + ans_fps).to_numpy(dtype=object))
+
+    # the first occurrence in longest-first order is the row we keep
+    longest_first = np.argsort(-clue_df.loc[:, 'clue'].str.len().to_numpy(), kind='stable')
+    _, first_idxs = np.unique(fingerprints[longest_first], return_index=True)
+    keep_mask = np.full((len(clue_df),), False)
+    keep_mask[longest_first[first_idxs]] = True
+
+    num_removed = len(clue_df) - keep_mask.sum()
+    print(f"Fingerprint dedup removed {num_removed} of {len(clue_df)} rows " +
+          f"({100 * num_removed / max(len(clue_df), 1):.1f}%)")
+    return clue_df.loc[keep_mask, :]
+
+
+def jaro_upper_bound(len_a: int, len_b: int) -> float:
+    '''
+    Highest Jaro similarity two strings of these lengths could possibly have:
+    every character of the shorter string matches, with no transpositions.
+    Used to skip answer pairs that can't clear the similarity threshold.
+    '''
+    if len_a == 0 or len_b == 0:
+        return 1.0 # don't try to reason about empty strings; just score them
+    shorter, longer = min(len_a, len_b), max(len_a, len_b)
+    return (2 + shorter / longer) / 3
+
+
+def build_length_buckets(unique_strs):
+    '''
+    Group sorted unique simple answers by length and build one
+    batch_jaro_winkler model per length, so that a query only has to be scored
+    against lengths that could pass its threshold.
+
+    Inputs:
+        - unique_strs (numpy array of strs): sorted, as from np.unique
+    Returns (dict): length -> (runtime model, positions in unique_strs of
+    that model's strings, in the order the model returns its results)
+    '''
+    import batch_jaro_winkler as bjw # by Dominik Bousquet, https://github.com/dbousque/batch_jaro_winkler
+    lengths = np.array([len(ans) for ans in unique_strs])
+    buckets = {}
+    for length in np.unique(lengths):
+        exp_model = bjw.build_exportable_model(unique_strs[lengths == length])
+        rt_model = bjw.build_runtime_model(exp_model)
+        # batch_jaro_winkler returns results in its own (not alphabetical) order
+        bjw_order_strs = np.array([result_tuple[0] for result_tuple in bjw.jaro_distance(rt_model, "_")])
+        buckets[int(length)] = (rt_model, np.searchsorted(unique_strs, bjw_order_strs))
+    return buckets
+
+
+def score_answer(answer, ans_buckets, num_unique, ans_thresh):
+    '''
+    Jaro similarity of answer against every unique simple answer, skipping
+    length buckets whose upper bound can't exceed ans_thresh. Skipped answers
+    get a score of 0, which gives the same matches as scoring everything.
+
+    Returns (tuple): numpy array of scores aligned with unique_strs, and the
+    number of strings actually scored
+    '''
+    import batch_jaro_winkler as bjw
+    unique_res_vals = np.zeros(num_unique)
+    num_scored = 0
+    for length, (rt_model, unique_positions) in ans_buckets.items():
+        # small slack because batch_jaro_winkler scores are float32
+        if jaro_upper_bound(len(answer), length) + 1e-6 <= ans_thresh:
+            continue
+        bjw_result = bjw.jaro_distance(rt_model, answer)
+        unique_res_vals[unique_positions] = [result_tuple[1] for result_tuple in bjw_result]
+        num_scored += len(unique_positions)
+    return unique_res_vals, num_scored
+
+
+def numeric_clue_bags(clue_bags, bag_sizes):
+    '''
+    Convert clue bags (sets of words) into a 2D array of word ids, one row per
+    clue padded with -1, so that word overlap can be counted with numpy.
+
+    Inputs:
+        - clue_bags (iterable of sets of strs)
+        - bag_sizes (numpy array of ints): size of each clue bag
+    Returns (tuple): sorted vocabulary array, 2D array of word ids
+    '''
+    word_counter = Counter()
+    for clue_bag in clue_bags:
+        word_counter.update(clue_bag)
+    all_word_arr = np.sort(np.array([word for word in word_counter.keys()]))
+    numeric_clue_bag = np.zeros((len(bag_sizes), np.amax(bag_sizes)), dtype=int)-1
+    for clue_i, clue_bag in enumerate(tqdm(clue_bags)):
+        word_to_idx = np.searchsorted(all_word_arr, np.array(list(clue_bag)))
+        numeric_clue_bag[clue_i, :len(word_to_idx)] = word_to_idx
+    return all_word_arr, numeric_clue_bag
+
+
+def save_clue_store(clue_df, filepath, max_ans_len=50, lemmatize=False):
+    '''
+    Do the per-row preparation for remove_redundancies() once (simple answers,
+    bag sizes, word ids, sort order) and save the result as a memory-mappable
+    clue store, so later runs can open it instantly instead of re-parsing and
+    re-preparing a .csv.
+
+    Inputs:
+        - clue_df (str or DataFrame): .csv filepath or DataFrame with 'clue',
+        'answer' and 'tags' columns
+        - filepath (str): where to write the store (.arrow or .feather)
+        - max_ans_len (int), lemmatize (boolean): as in remove_redundancies()
+    '''
+    df = add_normalized_columns(subset(clue_df).copy())
+
+    print("Generating simplified answer lines for every row...")
+    df.loc[:, 'simple_answer'] = df.loc[:, 'norm_answer'].progress_apply(
+        lambda x: distill(x, answerline=True, max_length=max_ans_len,
+                          lemmatize=lemmatize, normalized=True))
+    print("generating clue bag...")
+    df.loc[:, 'clue_bag'] = df.loc[:, 'norm_clue'].progress_apply(
+        lambda x: wordify(x, lemmatize=lemmatize, normalized=True))
+    df.loc[:, 'bag_size'] = df.loc[:, 'clue_bag'].apply(len)
+
+    # stored in the order remove_redundancies() works through, so it can skip sorting
+    df = df.sort_values(by=['simple_answer', 'clue'], ascending=True)
+    df = df.dropna(how="any", subset=["answer", "simple_answer"]).reset_index(drop=True)
+
+    print("Generating numeric_clue_bag table...")
+    vocab, token_ids = numeric_clue_bags(df["clue_bag"], df["bag_size"].to_numpy())
+    write_clue_store(df, token_ids, vocab, filepath, lemmatize=lemmatize)
+
+
+def input_fingerprint(df, params):
+    '''
+    Digest of the prepared (sorted) clue table and the settings that affect
+    which rows get deleted, so a checkpoint is only ever resumed against the
+    run that wrote it.
+    '''
+    row_hashes = pd.util.hash_pandas_object(
+        str_values(df.loc[:, ['clue', 'simple_answer', 'bag_size']]), index=True)
+    digest = hashlib.sha1(row_hashes.to_numpy().tobytes())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def save_checkpoint(checkpoint_path, state):
+    '''Write checkpoint state as JSON, atomically, so a crash mid-write
+    never leaves a corrupt checkpoint behind.'''
+    with open(checkpoint_path + ".tmp", 'w') as f:
+        json.dump(state, f)
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+
+def load_checkpoint(checkpoint_path, fingerprint):
+    '''
+    Read a checkpoint written by remove_redundancies(), if there is one.
+
+    Returns (dict or None): checkpoint state
+    '''
+    if not os.path.exists(checkpoint_path):
+        print(f"No checkpoint at {checkpoint_path}. Starting from the beginning")
+        return None
+    with open(checkpoint_path) as f:
+        state = json.load(f)
+    if state['fingerprint'] != fingerprint:
+        raise Exception(f"Checkpoint {checkpoint_path} was written for different input or settings")
+    print(f"Resuming from row {state['next_row']} with {len(state['deleted_rows'])} rows already deleted")
+    return state
+
+
+def payoff_order(simple_answers, simple_ans_freqs, skip_thresh=None):
+    '''
+    Order answer blocks (runs of rows sharing a simple answer, which are
+    contiguous once the table is sorted) so that the ones likeliest to hold
+    redundant clues come first: most frequent simple answer, then largest
+    block. Blocks that skip_thresh would skip anyway go last.
+
+    Inputs:
+        - simple_answers (pandas Series): sorted simple answer column
+        - simple_ans_freqs (Counter): frequency of each simple answer
+        - skip_thresh (int or None): as in remove_redundancies()
+    Returns (tuple): row positions in processing order, and the size of each
+    block in that same order
+    '''
+    answers = simple_answers.to_numpy()
+    if len(answers) == 0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    block_starts = np.flatnonzero(np.r_[True, answers[1:] != answers[:-1]])
+    block_ends = np.r_[block_starts[1:], len(answers)]
+
+    def payoff(block):
+        freq = simple_ans_freqs[answers[block_starts[block]]]
+        skipped = skip_thresh is not None and freq < skip_thresh
+        return (skipped, -freq, -(block_ends[block] - block_starts[block]), block_starts[block])
+
+    order = sorted(range(len(block_starts)), key=payoff)
+    row_order = np.concatenate([np.arange(block_starts[b], block_ends[b]) for b in order])
+    return row_order, (block_ends - block_starts)[order]
+
+
+def resolve_deletions(actions):
+    '''
+    Replay the deletions recorded for each visited row in ascending row
+    order, the order the unbudgeted loop makes them in: a row deleted by an
+    earlier row is skipped there, so it deletes nothing itself.
+
+    Inputs:
+        - actions (dict): row -> (index of matching shorter later rows,
+        whether any matching later row is longer)
+    Returns (set): rows to delete
+    '''
+    deleted_rows = set()
+    for row in sorted(actions):
+        if row in deleted_rows:
+            continue
+        smaller_rows, has_bigger = actions[row]
+        deleted_rows.update(smaller_rows)
+        if has_bigger:
+            deleted_rows.add(row)
+    return deleted_rows
+
+
+def prepare_dedup_table(
+        clue_df,
+        max_ans_len=50,
+        ans_term=None,
+        clue_term=None,
+        simplify_answers=True,
+        lemmatize=False,
+        asc=True,
+        norm_cache=None
+):
+    '''
+    Per-row preparation shared by remove_redundancies() and
+    build_similarity_graph(): subset, simplify answers, build clue bags, sort
+    by simple answer and convert clue bags to word ids. Columns already in a
+    clue store are used as-is. norm_cache is the cache_path of
+    add_normalized_columns().
+
+    Returns (tuple): prepared df (sorted, fresh index), Counter of simple
+    answer frequencies, numpy array of bag sizes, 2D array of word ids, and
+    whether the input came from a clue store
+    '''
+    if is_clue_store(clue_df):
+        clue_df, _, store_lemmatized = open_clue_store(clue_df)
+        if store_lemmatized != lemmatize:
+            print(f"WARNING: clue store was built with lemmatize={store_lemmatized}; using that")
+
+    if ans_term is not None or clue_term is not None:
+        print("Subsetting dataframe...")
+    df = subset(clue_df, ans_term, clue_term)
+    from_store = 'token_ids' in df.columns
+    if not from_store:
+        df = add_normalized_columns(df, cache_path=norm_cache)
+
+    if "simple_answer" not in df.columns:
+        print("Generating simplified answer lines for every row...")
+        if simplify_answers:
+            df.loc[:,'simple_answer'] = df.loc[:,'norm_answer'].progress_apply(
+                lambda x:distill(x, 
+                                 answerline=True,
+                                 max_length = max_ans_len,
+                                 lemmatize=lemmatize,
+                                 normalized=True)
+                )
+        else:
+            df.loc[:,'simple_answer'] = df.loc[:,'answer']
+        if uses_arrow_strings(df):
+            df = arrow_strings(df)
+
+    print("Counting frequency of each simplified answer...")
+    simple_ans_freqs = Counter(df.loc[:, 'simple_answer'])
+    #TODO: You probably want to create an ans_len column here instead of calculating
+    # each time you have a new similarity threshold.
+
+    if from_store:
+        # store rows are already sorted (ascending) with missing answers dropped
+        print("Using clue bags from clue store...")
+        if not asc:
+            df = df.sort_values(by=['simple_answer', 'clue'], ascending=asc).reset_index(drop=True)
+        bag_size_numpy = df["bag_size"].to_numpy()
+        numeric_clue_bag = token_id_matrix(df["token_ids"])
+    else:
+        print("generating clue bag...")
+        df.loc[:, 'clue_bag'] = df.loc[:, 'norm_clue'].progress_apply(
+            lambda x: wordify(x, lemmatize=lemmatize, normalized=True)
+            )
+
+        # this needs to be recalculated every time even if csv has it as a column
+        print("Calculating number of unique words in each clue...")
+        df.loc[:,'bag_size'] = df.loc[:,'clue_bag'].progress_apply(len)
+
+        # greatly reduce runtime, by allowing us to calculate all matches for each
+        # simple answerline only once.
+        print("Sorting database...")
+        df = df.sort_values(by=['simple_answer', 'clue'], ascending=asc)
+        df = df.dropna(how="any", subset=["answer", "simple_answer"]).reset_index(drop=True)
+
+        print("Generating numeric_clue_bag table...")
+        bag_size_numpy = df["bag_size"].to_numpy()
+        _, numeric_clue_bag = numeric_clue_bags(df["clue_bag"], bag_size_numpy)
+
+    return df, simple_ans_freqs, bag_size_numpy, numeric_clue_bag, from_store
+
+
 def remove_redundancies(
         clue_df,
         max_ans_len=50,
@@ -158,7 +614,14 @@ def remove_redundancies(
         dynamic_threshes=True,
         simplify_answers=True,
         lemmatize=False,
-        asc=True
+        asc=True,
+        checkpoint_path=None,
+        checkpoint_every=10000,
+        resume=False,
+        time_budget=None,
+        answer_blocking=False,
+        thresh_table=None,
+        norm_cache=None
 ):
     '''
     Most up-to-date function for finding repetitious clues and deleting them
@@ -180,7 +643,8 @@ def remove_redundancies(
 
     Inputs:
         - clues_filepath (str or DataFrame): location of clues DataFrame in directory
-        or the DataFrame itself.
+        or the DataFrame itself. A clue store from save_clue_store() is opened
+        memory-mapped and its precomputed columns are used as-is.
         - ans_term (str): used for subsetting the DataFrame to look only at answer
         lines that contain this substring. Greatly increases runtime.
         - clue_term (str): used for subsetting the DataFrame to look only at clues
@@ -200,59 +664,49 @@ def remove_redundancies(
         prior to comparison. Should be set to True.
         - asc (boolean): Determines whether simplified answer lines are sorted
         alphabetically (0-Z, True) or in reverse alphabetical order (Z-0, False).
+        - checkpoint_path (str or None): if given, the row cursor and the set
+        of deleted rows are saved here every checkpoint_every rows, and the
+        file is removed once the run finishes.
+        - resume (boolean): continue from the checkpoint at checkpoint_path.
+        The result is identical to an uninterrupted run.
+        - time_budget (float or None): if given, the number of seconds to spend
+        comparing clues. Answer blocks are processed in payoff_order() rather
+        than alphabetically, and the run stops cleanly when time is up. Each
+        visited row's matches are recorded and applied in row order at the end
+        (see resolve_deletions()), so a budget that is never used up gives the
+        unbudgeted result. The
+        returned frame is partially deduplicated, and a coverage report is
+        printed and stored in its .attrs['coverage']. Can't be combined with
+        checkpointing.
+        - answer_blocking (boolean): narrow answer comparisons with an
+        AnswerIndex over the words and alternates of each full answer line.
+        An answer is only scored against answers it shares a word, a prefix or
+        an accepted form with, and answers that share a distinctive accepted
+        form match regardless of score (see AnswerIndex). Much fewer Jaro-Winkler comparisons on a large
+        vocabulary; catches "databases [or DBs]" vs. "DBs", but misses
+        lookalike answers with nothing in common (e.g. misspelled first words).
+        - thresh_table (str, dict or None): threshold table (or the path of one)
+        to use instead of the built-in dynamic thresholds, e.g. one written
+        by calibrate_threshes(). Overrides ans_thresh, clue_thresh and
+        dynamic_threshes.
+        - norm_cache (str or None): .feather file to cache normalized text
+        in; see add_normalized_columns()
 
     Returns (df): the dataframe with repetitious rows deleted.
     '''
-    if dynamic_threshes:
+    if thresh_table is not None:
+        print("USING THRESHOLD TABLE")
+        ans_thresh_fn, clue_thresh_fn = load_thresh_table(thresh_table)
+        dynamic_threshes = True
+    elif dynamic_threshes:
         print("DYNAMIC THRESHOLD-SETTING IS ON")
         ALL_ANS_THRESHES = ans_thresh_hashtable(max_ans_len+1)
+        ans_thresh_fn = lambda n: ALL_ANS_THRESHES[n]
+        clue_thresh_fn = dynamic_clue_thresh
 
-    if ans_term is not None or clue_term is not None:
-        print("Subsetting dataframe...")
-    df = subset(clue_df, ans_term, clue_term)
-
-    if "simple_answer" not in df.columns:
-        print("Generating simplified answer lines for every row...")
-        if simplify_answers:
-            df.loc[:,'simple_answer'] = df.loc[:,'answer'].progress_apply(
-                lambda x:distill(str(x), 
-                                 answerline=True,
-                                 max_length = max_ans_len,
-                                 lemmatize=lemmatize)
-                )
-        else:
-            df.loc[:,'simple_answer'] = df.loc[:,'answer']
-
-    print("Counting frequency of each simplified answer...")
-    simple_ans_freqs = Counter(df.loc[:, 'simple_answer'])
-    #TODO: You probably want to create an ans_len column here instead of calculating
-    # each time you have a new similarity threshold.
-
-    print("generating clue bag...")
-    df.loc[:, 'clue_bag'] = df.loc[:, 'clue'].progress_apply(
-        lambda x: wordify(x, lemmatize=lemmatize)
-        )
-
-    # this needs to be recalculated every time even if csv has it as a column
-    print("Calculating number of unique words in each clue...")
-    df.loc[:,'bag_size'] = df.loc[:,'clue_bag'].progress_apply(len)
-
-    # greatly reduce runtime, by allowing us to calculate all matches for each
-    # simple answerline only once.
-    print("Sorting database...")
-    df = df.sort_values(by=['simple_answer', 'clue'], ascending=asc)
-    df = df.dropna(how="any", subset=["answer", "simple_answer"]).reset_index(drop=True)
-
-    print("Generating numeric_clue_bag table...")
-    bag_size_numpy = df["bag_size"].to_numpy()
-    word_counter = Counter()
-    for clue_bag in df["clue_bag"]:
-        word_counter.update(clue_bag)
-    all_word_arr = np.sort(np.array([word for word in word_counter.keys()]))
-    numeric_clue_bag = np.zeros((len(df), np.amax(bag_size_numpy)), dtype=int)-1
-    for clue_i, clue_bag in enumerate(tqdm(df["clue_bag"])):
-        word_to_idx = np.searchsorted(all_word_arr, np.array(list(clue_bag)))
-        numeric_clue_bag[clue_i, :len(word_to_idx)] = word_to_idx
+    df, simple_ans_freqs, bag_size_numpy, numeric_clue_bag, from_store = prepare_dedup_table(
+        clue_df, max_ans_len=max_ans_len, ans_term=ans_term, clue_term=clue_term,
+        simplify_answers=simplify_answers, lemmatize=lemmatize, asc=asc, norm_cache=norm_cache)
 
     df.loc[:, 'ans_similarity'] = -1.0
     df.loc[:, 'clue_similarity'] = -1.0
@@ -260,21 +714,63 @@ def remove_redundancies(
     print("Preparing for batch Jaro-Winkler similarity score calculation...")
     # this line breaks if I don't dropna (if "nan" is an answer). TODO: fix
     unique_strs, unique_idxs = np.unique(df[["simple_answer"]].to_numpy().flatten(), return_inverse=True)
-    exp_model = bjw.build_exportable_model(unique_strs.flatten())
-    rt_model = bjw.build_runtime_model(exp_model)
-
-    # re-order Jaro-Winkler results from original sort order (based on length)
-    init_bjw_result = bjw.jaro_distance(rt_model, "_")
-    bjw_order_strs = np.array([result_tuple[0] for result_tuple in init_bjw_result])
-    bjw_order_to_alphabetical_idxs = np.argsort(bjw_order_strs)
+    if answer_blocking:
+        # answer_index imports from this module, so it can't be imported up top
+        from answer_index import AnswerIndex
+        answer_index = AnswerIndex(unique_strs, unique_idxs, str_values(df.loc[:, 'answer']),
+                                   max_length=max_ans_len)
+    else:
+        ans_buckets = build_length_buckets(unique_strs)
 
     # initialize variables
     prev_answer = None
     rows_marked_del = 0
+    jaro_comparisons = 0
+    unpruned_comparisons = 0
     ans_similarity_bin = np.full((len(df),), False)
     deleted_rows = set()
-
-    for row_tuple in df.itertuples():
+    start_row = 0
+
+    if checkpoint_path is not None:
+        fingerprint = input_fingerprint(df, {
+            'skip_thresh': skip_thresh, 'ans_thresh': ans_thresh,
+            'clue_thresh': clue_thresh, 'dynamic_threshes': dynamic_threshes,
+            'max_ans_len': max_ans_len, 'lemmatize': lemmatize, 'asc': asc,
+            'answer_blocking': answer_blocking, 'thresh_table': thresh_table})
+        state = load_checkpoint(checkpoint_path, fingerprint) if resume else None
+        if state is not None:
+            # similarity scores are recalculated for the first row's answer,
+            # since prev_answer starts out as None
+            start_row = state['next_row']
+            deleted_rows = set(state['deleted_rows'])
+            rows_marked_del = len(deleted_rows)
+            jaro_comparisons = state['jaro_comparisons']
+            unpruned_comparisons = state['unpruned_comparisons']
+
+    row_order = np.arange(start_row, len(df))
+    if time_budget is not None:
+        assert checkpoint_path is None, "time_budget can't be combined with checkpointing"
+        row_order, block_sizes = payoff_order(df.loc[:, 'simple_answer'], simple_ans_freqs, skip_thresh)
+        deadline = time.monotonic() + time_budget
+        # visited out of row order, a row can't tell yet whether an earlier
+        # row deletes it, so deletions wait for resolve_deletions()
+        actions = {}
+    rows_visited = 0
+
+    for row_tuple in df.iloc[row_order].itertuples():
+        if time_budget is not None and time.monotonic() > deadline:
+            print("\nTIME BUDGET EXHAUSTED. Stopping early.")
+            break
+        rows_visited += 1
+        if (checkpoint_path is not None and row_tuple.Index > start_row and
+                row_tuple.Index % checkpoint_every == 0):
+            # every row before this one is finished
+            save_checkpoint(checkpoint_path, {
+                'fingerprint': fingerprint,
+                'next_row': int(row_tuple.Index),
+                'deleted_rows': sorted(int(i) for i in deleted_rows),
+                'jaro_comparisons': int(jaro_comparisons),
+                'unpruned_comparisons': int(unpruned_comparisons)})
         print(f"\nNOW CONSIDERING ROW {row_tuple.Index}.")
         if row_tuple.Index in deleted_rows:
             print(f"Row {row_tuple.Index} has been marked for deletion. Continuing")
@@ -289,14 +785,20 @@ def remove_redundancies(
             continue
 
         if row_tuple.simple_answer != prev_answer:
-            # Recalculate similarity scores
-            bjw_result = bjw.jaro_distance(rt_model, row_tuple.simple_answer)
-            unique_res_vals = np.array([result_tuple[1] for result_tuple in bjw_result])[bjw_order_to_alphabetical_idxs]
             if dynamic_threshes:
-                ans_thresh = ALL_ANS_THRESHES[len(row_tuple.simple_answer)]
+                ans_thresh = ans_thresh_fn(len(row_tuple.simple_answer))
                 print(f"New similarity threshold for {row_tuple.simple_answer} = {ans_thresh}")
+            # Recalculate similarity scores, only for answers of plausible length
+            if answer_blocking:
+                unique_matches, num_scored = answer_index.match(unique_idxs[row_tuple.Index], ans_thresh)
+            else:
+                unique_res_vals, num_scored = score_answer(
+                    row_tuple.simple_answer, ans_buckets, len(unique_strs), ans_thresh)
+                unique_matches = unique_res_vals > ans_thresh
+            jaro_comparisons += num_scored
+            unpruned_comparisons += len(unique_strs)
             # Find which rows have answer with a high enough similarity score
-            ans_similarity_bin = (unique_res_vals > ans_thresh)[unique_idxs]
+            ans_similarity_bin = unique_matches[unique_idxs]
             prev_answer = row_tuple.simple_answer
 
         # make ans_similarity_bin (ans_similarity > ans_thresh) & (index > row_idx)
@@ -315,16 +817,22 @@ def remove_redundancies(
         clue_overlap_vals = shared_words/min_vals
         clue_overlap_vals[min_vals==1000] = 1
         if dynamic_threshes:
-            clue_thresh = dynamic_clue_thresh(row_tuple.bag_size)
+            clue_thresh = clue_thresh_fn(row_tuple.bag_size)
             print(f"Similarity threshold for this clue: {clue_thresh}")
         CLUE_MATCH_MASK = clue_overlap_vals > clue_thresh
 
         if CLUE_MATCH_MASK.sum() > 0:
             # within those, get strictly shorter clues
-            print(f"This clue: {row_tuple.clue_bag}")
+            print(f"This clue: {row_tuple.clue_bag if not from_store else row_tuple.clue}")
             SMALLER_MASK = (df_subset.loc[:, 'bag_size'] < row_tuple.bag_size)
             DEL_MASK = ~df_subset.index.isin(deleted_rows)
             SMALLER_SUBSET_MASK = CLUE_MATCH_MASK & SMALLER_MASK & DEL_MASK
+            BIGGER_MASK = (df_subset.loc[:, 'bag_size'] > row_tuple.bag_size)
+            BIGGER_SUBSET_MASK = CLUE_MATCH_MASK & BIGGER_MASK
+            if time_budget is not None:
+                actions[row_tuple.Index] = (df_subset.index[SMALLER_SUBSET_MASK],
+                                            BIGGER_SUBSET_MASK.sum() > 0)
+                continue
             if (num_subset_del := SMALLER_SUBSET_MASK.sum()) > 0:
                 # mark all such rows for deletion
                 print(f"{num_subset_del} rows ready to be marked for deletion")
@@ -335,8 +843,6 @@ def remove_redundancies(
                 print("NO MATCHING CLUES OF SMALLER LENGTH FOUND")
 
             # within those, check for ANY strictly longer clue
-            BIGGER_MASK = (df_subset.loc[:, 'bag_size'] > row_tuple.bag_size)
-            BIGGER_SUBSET_MASK = CLUE_MATCH_MASK & BIGGER_MASK
             if BIGGER_SUBSET_MASK.sum() > 0:
                 print("THIS ROW IS SHORTER THAN A MATCHING CLUE. MARKING IT FOR DELETION...")
                 print("(For reference, here is a LONGER row we are KEEPING:)")
@@ -346,18 +852,107 @@ def remove_redundancies(
 
         print(f"Rows marked for deletion so far: {rows_marked_del}")
 
+    if time_budget is not None:
+        deleted_rows = resolve_deletions(actions)
+        rows_marked_del = len(deleted_rows)
     assert rows_marked_del == len(deleted_rows)
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
     print(f"{rows_marked_del} total rows marked for deletion")
+    print(f"{jaro_comparisons} answer similarity scores calculated " +
+          f"({unpruned_comparisons} without {'blocking' if answer_blocking else 'length pruning'})")
+    if time_budget is not None:
+        # a block counts as covered once every one of its rows was visited
+        blocks_done = np.searchsorted(np.cumsum(block_sizes), rows_visited, side='right')
+        coverage = {
+            'rows_visited': rows_visited,
+            'rows_total': len(df),
+            'blocks_done': int(blocks_done),
+            'blocks_total': len(block_sizes),
+            'pair_coverage': float((block_sizes[:blocks_done]**2).sum() / max((block_sizes**2).sum(), 1)),
+            'rows_deleted': int(rows_marked_del)
+        }
+        print(f"Coverage: {coverage['rows_visited']}/{coverage['rows_total']} rows, " +
+              f"{coverage['blocks_done']}/{coverage['blocks_total']} answer blocks, " +
+              f"{100 * coverage['pair_coverage']:.1f}% of within-block clue pairs")
     deleted_rows_mask = df.index.isin(deleted_rows)
     df = df.loc[~deleted_rows_mask, ["clue", "answer", "tags"]]
+    if time_budget is not None:
+        df.attrs['coverage'] = coverage
     print("Redundant row deletion complete")
     return df
 
 
+def normalized_columns_test():
+    '''
+    Checks that add_normalized_columns() reuses normalized columns only while
+    the clues and answers they were made from are unchanged, and that a
+    cache file is reused on a fresh copy of the same clues.
+    '''
+    import tempfile
+    clues = pd.DataFrame({'clue': ["This Élan was seen in 1901.", "This river floods."],
+                          'answer': ["Élan [or Elan Vital]", "Nile River"]})
+    clues = add_normalized_columns(clues)
+    assert [ans.strip() for ans in clues.loc[:, 'norm_answer']] == ['elan', 'nile river']
+
+    clues.loc[:, 'simple_answer'] = 'stale'
+    same = add_normalized_columns(clues)
+    assert same is clues and 'simple_answer' in same.columns
+    edited = clues.copy()
+    edited.loc[1, 'answer'] = "Amazon River"
+    edited = add_normalized_columns(edited)
+    assert edited.loc[1, 'norm_answer'] == 'amazon river', edited.loc[1, 'norm_answer']
+    assert 'simple_answer' not in edited.columns
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache_path = os.path.join(tmpdir, 'norm.feather')
+        fresh = clues.loc[:, ['clue', 'answer']].copy()
+        add_normalized_columns(fresh.copy(), cache_path=cache_path)
+        assert os.path.exists(cache_path)
+        cached = add_normalized_columns(fresh.copy(), cache_path=cache_path)
+        assert cached.loc[:, NORM_COLUMNS].equals(clues.loc[:, NORM_COLUMNS])
+    print("normalized_columns_test passed")
+
+
+def time_budget_test(num_rows=900, seed=0):
+    '''
+    Checks that remove_redundancies() with a time budget that is never used
+    up deletes exactly the rows an unbudgeted run deletes, on a seeded
+    corpus of overlapping clues whose answer blocks differ in size, so
+    payoff_order() visits them out of row order.
+    '''
+    import contextlib
+    import io
+    rng = np.random.default_rng(seed)
+    words = ['captain', 'comedy', 'estate', 'war', 'prince', 'queen', 'denmark', 'sea',
+             'novel', 'river', 'battle', 'opera', 'painter', 'treaty', 'empire', 'island']
+    answers = [f"{name} {surname}" for name in ['john', 'mary', 'peter', 'anne']
+               for surname in ['smith', 'smyth', 'jones', 'brown', 'black']]
+    # Zipf-like answer frequencies, so big blocks sit between small ones
+    weights = 1 / np.arange(1, len(answers) + 1)
+    chosen = rng.choice(len(answers), size=num_rows, p=weights / weights.sum())
+    clues = pd.DataFrame({
+        'clue': ["This " + " ".join(rng.choice(words, size=rng.integers(3, 10), replace=False)) + "."
+                 for _ in range(num_rows)],
+        'answer': [answers[i] for i in chosen],
+        'tags': ""})
+    with contextlib.redirect_stdout(io.StringIO()):
+        full = remove_redundancies(clues.copy())
+        budgeted = remove_redundancies(clues.copy(), time_budget=1e9)
+    coverage = budgeted.attrs['coverage']
+    assert coverage['rows_visited'] == coverage['rows_total'], coverage
+    assert len(budgeted) == len(full), (len(budgeted), len(full))
+    assert budgeted.sort_index().equals(full.sort_index())
+    print("time_budget_test passed")
+
+
 if __name__ == '__main__':
-    print("Loading clue csv...")
     CLUES_FILEPATH = "clues_sample100_092023.csv"
-    clues = pd.read_csv(CLUES_FILEPATH, sep="\t")
+    CLUE_STORE_FILEPATH = "clues_sample100_092023.arrow"
+    if not os.path.exists(CLUE_STORE_FILEPATH):
+        print("No clue store yet. Building one from clue csv...")
+        save_clue_store(CLUES_FILEPATH, CLUE_STORE_FILEPATH)
+    clues = CLUE_STORE_FILEPATH
     ans_input = input("Choose phrase to filter answer line by, or type Enter to continue:")
     if ans_input == '':
         ans_input = None
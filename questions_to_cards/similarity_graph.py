@@ -0,0 +1,166 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from dynamic_threshes import ans_thresh_hashtable, dynamic_clue_thresh
+from similarity import prepare_dedup_table, build_length_buckets, score_answer
+
+EDGES_FILENAME = "edges.npz"
+ROWS_FILENAME = "rows.feather"
+PARAMS_FILENAME = "params.json"
+
+
+def build_similarity_graph(
+        clue_df,
+        graph_dir,
+        ans_floor=0.6,
+        clue_floor=0.3,
+        max_ans_len=50,
+        simplify_answers=True,
+        lemmatize=False,
+        asc=True
+):
+    '''
+    Score every candidate clue pair once and save it, so thresholds can be
+    re-tuned with replay_similarity_graph() without recomputing any
+    Jaro-Winkler or overlap scores.
+
+    An edge (i, j) is kept for every pair of rows i < j (in
+    remove_redundancies() order) whose answer similarity is above ans_floor
+    and whose clue overlap is above clue_floor. Any replay threshold at or
+    above the floors gives the same result as remove_redundancies().
+
+    Inputs:
+        - clue_df (str or DataFrame): as in remove_redundancies()
+        - graph_dir (str): directory to save the graph in
+        - ans_floor (float): lowest answer similarity worth keeping
+        - clue_floor (float): lowest clue overlap worth keeping
+        - max_ans_len, simplify_answers, lemmatize, asc: as in remove_redundancies()
+    '''
+    df, simple_ans_freqs, bag_size_numpy, numeric_clue_bag, _ = prepare_dedup_table(
+        clue_df, max_ans_len=max_ans_len, simplify_answers=simplify_answers,
+        lemmatize=lemmatize, asc=asc)
+
+    print("Preparing for batch Jaro-Winkler similarity score calculation...")
+    simple_answers = df.loc[:, 'simple_answer'].to_numpy()
+    unique_strs, unique_idxs = np.unique(simple_answers, return_inverse=True)
+    ans_buckets = build_length_buckets(unique_strs)
+
+    srcs, dsts, ans_sims, clue_sims = [], [], [], []
+    block_starts = np.flatnonzero(np.r_[True, simple_answers[1:] != simple_answers[:-1]])
+    block_ends = np.r_[block_starts[1:], len(df)]
+    print("Scoring candidate pairs...")
+    for start, end in tqdm(list(zip(block_starts, block_ends))):
+        unique_res_vals, _ = score_answer(simple_answers[start], ans_buckets,
+                                          len(unique_strs), ans_floor)
+        row_ans_sims = unique_res_vals[unique_idxs]
+        candidate_rows = np.flatnonzero(row_ans_sims > ans_floor)
+        for i in range(start, end):
+            js = candidate_rows[candidate_rows > i]
+            if len(js) == 0:
+                continue
+            # same overlap coefficient as remove_redundancies()
+            shared_words = np.sum(np.isin(numeric_clue_bag[js, :], numeric_clue_bag[i, :bag_size_numpy[i]]), axis=1)
+            min_vals = np.minimum(bag_size_numpy[i], bag_size_numpy[js])
+            min_vals[min_vals<1] = 1000
+            clue_overlap_vals = shared_words/min_vals
+            clue_overlap_vals[min_vals==1000] = 1
+            keep = clue_overlap_vals > clue_floor
+            srcs.append(np.full(keep.sum(), i))
+            dsts.append(js[keep])
+            ans_sims.append(row_ans_sims[js[keep]])
+            clue_sims.append(clue_overlap_vals[keep])
+
+    def joined(arrays, dtype):
+        return np.concatenate(arrays).astype(dtype) if len(arrays) > 0 else np.array([], dtype=dtype)
+
+    os.makedirs(graph_dir, exist_ok=True)
+    np.savez(os.path.join(graph_dir, EDGES_FILENAME),
+             src=joined(srcs, np.int64),
+             dst=joined(dsts, np.int64),
+             ans_sim=joined(ans_sims, np.float64),
+             clue_sim=joined(clue_sims, np.float64),
+             bag_size=np.asarray(bag_size_numpy, dtype=np.int64),
+             ans_len=np.array([len(ans) for ans in simple_answers]),
+             ans_freq=np.array([simple_ans_freqs[ans] for ans in simple_answers]))
+    df.loc[:, ['clue', 'answer', 'tags']].reset_index(drop=True).to_feather(
+        os.path.join(graph_dir, ROWS_FILENAME))
+    with open(os.path.join(graph_dir, PARAMS_FILENAME), 'w') as f:
+        json.dump({'ans_floor': ans_floor, 'clue_floor': clue_floor,
+                   'max_ans_len': max_ans_len, 'lemmatize': lemmatize, 'asc': asc}, f)
+    print(f"Saved {sum(len(d) for d in dsts)} candidate pairs over {len(df)} rows to {graph_dir}")
+
+
+def replay_similarity_graph(
+        graph_dir,
+        ans_thresh=0.7,
+        clue_thresh=0.6,
+        dynamic_threshes=True,
+        skip_thresh=None,
+        ans_thresh_fn=None,
+        clue_thresh_fn=None
+):
+    '''
+    Apply a threshold policy and the keep-longer rule of
+    remove_redundancies() to a saved similarity graph. Takes seconds, since
+    every score was already computed.
+
+    Inputs:
+        - graph_dir (str): directory written by build_similarity_graph()
+        - ans_thresh, clue_thresh, dynamic_threshes, skip_thresh: as in
+        remove_redundancies()
+        - ans_thresh_fn (function or None): custom answer threshold, given the
+        length of a row's simple answer. Overrides ans_thresh/dynamic_threshes.
+        - clue_thresh_fn (function or None): custom clue threshold, given a
+        row's bag size. Overrides clue_thresh/dynamic_threshes.
+    Returns (df): the dataframe with repetitious rows deleted
+    '''
+    with open(os.path.join(graph_dir, PARAMS_FILENAME)) as f:
+        params = json.load(f)
+    graph = np.load(os.path.join(graph_dir, EDGES_FILENAME))
+    src, dst = graph['src'], graph['dst']
+    ans_sim, clue_sim = graph['ans_sim'], graph['clue_sim']
+    bag_size, ans_len, ans_freq = graph['bag_size'], graph['ans_len'], graph['ans_freq']
+
+    if ans_thresh_fn is None:
+        if dynamic_threshes:
+            ALL_ANS_THRESHES = ans_thresh_hashtable(params['max_ans_len']+1)
+            ans_thresh_fn = lambda n: ALL_ANS_THRESHES[n]
+        else:
+            ans_thresh_fn = lambda n: ans_thresh
+    if clue_thresh_fn is None:
+        clue_thresh_fn = dynamic_clue_thresh if dynamic_threshes else (lambda n: clue_thresh)
+
+    # edges are written in src order, so each row's edges are one slice
+    edge_starts = np.searchsorted(src, np.arange(len(bag_size)), side='left')
+    edge_ends = np.searchsorted(src, np.arange(len(bag_size)), side='right')
+
+    deleted = np.full((len(bag_size),), False)
+    below_floor = False
+    for i in range(len(bag_size)):
+        if deleted[i]:
+            continue
+        if skip_thresh is not None and ans_freq[i] < skip_thresh:
+            continue
+        this_ans_thresh = ans_thresh_fn(ans_len[i])
+        this_clue_thresh = clue_thresh_fn(bag_size[i])
+        below_floor |= this_ans_thresh < params['ans_floor'] or this_clue_thresh < params['clue_floor']
+
+        edges = slice(edge_starts[i], edge_ends[i])
+        match = (ans_sim[edges] > this_ans_thresh) & (clue_sim[edges] > this_clue_thresh)
+        if not match.any():
+            continue
+        matched = dst[edges][match]
+        # delete shorter matches; delete this row if any match is longer
+        smaller = matched[bag_size[matched] < bag_size[i]]
+        deleted[smaller] = True
+        if (bag_size[matched] > bag_size[i]).any():
+            deleted[i] = True
+
+    if below_floor:
+        print("WARNING: some thresholds were below the graph's floors; " +
+              "pairs between the threshold and the floor were never saved")
+    rows = pd.read_feather(os.path.join(graph_dir, ROWS_FILENAME))
+    print(f"{deleted.sum()} total rows marked for deletion")
+    return rows.loc[~deleted, :]
@@ -1,71 +1,268 @@
 import pandas as pd
 import numpy as np
 import re
+import time
+from collections import namedtuple
 from tqdm import tqdm
+from utility import arrow_strings, uses_arrow_strings
 
 tqdm.pandas()
 
 BRACKET_RE = r'<[^>]+>'
 DUMB_QUOTE_RE = re.compile('(?:“|\")([^\"”]+)(?:\"|”)')
 
-def my_split(qtext):
+# One text-cleaning rule: a regex substitution with a name for reporting.
+# precheck is a tuple of substrings, at least one of which must be in the text
+# for the pattern to possibly match (None to always run the regex); repeat
+# reapplies the substitution until the text stops changing.
+Rule = namedtuple('Rule', ['name', 'pattern', 'repl', 'precheck', 'repeat'],
+                  defaults=[None, False])
+
+#name -> [texts that passed the precheck, texts changed, seconds]; None
+#unless instrumented (see start_rule_stats())
+RULE_STATS = None
+
+
+def compile_rules(rules):
     '''
-    Use a regex split questions at the clue (standalone sentence) level.
+    Turn a list of Rules with pattern strings into Rules with compiled patterns.
+    Patterns that need flags can be passed in already compiled.
+    '''
+    return [rule._replace(pattern=re.compile(rule.pattern)) if isinstance(rule.pattern, str)
+            else rule for rule in rules]
+
+
+def apply_rule(text, rule):
+    '''Apply one Rule to a single string, if it passes the rule's precheck.'''
+    if rule.precheck is not None:
+        for sub in rule.precheck:
+            if sub in text:
+                break
+        else:
+            return text
+    if rule.repeat:
+        while text != rule.pattern.sub(rule.repl, text):
+            text = rule.pattern.sub(rule.repl, text)
+        return text
+    return rule.pattern.sub(rule.repl, text)
+
+
+def apply_rules(text, rules):
+    '''
+    Run an ordered rule table over a single string.
 
     Inputs:
-        -qtext (str): The tossup or bonus part to be split up
-    Returns (lst): A list of the clue-sentences in the tossup or bonus part,
-    to be converted later into one card apiece 
+        -text (str): clue, question or answer line
+        -rules (list of Rules): compiled rule table, e.g. CLUE_RULES
+    Returns (str): the text after every rule has been applied
     '''
-    #PRE-PROCESSING 
+    if RULE_STATS is None:
+        for rule in rules:
+            text = apply_rule(text, rule)
+        return text
+
+    for rule in rules:
+        start = time.perf_counter()
+        before = text
+        text = apply_rule(text, rule)
+        stats = RULE_STATS.setdefault(rule.name, [0, 0, 0.0])
+        stats[0] += int(rule.precheck is None or any(sub in before for sub in rule.precheck))
+        stats[1] += int(text != before)
+        stats[2] += time.perf_counter() - start
+    return text
+
+
+def apply_rules_to_column(texts, rules):
+    '''
+    Batched version of apply_rules(): each rule runs once over the whole
+    column, and only over the rows that pass its precheck.
 
-    qtext = re.sub(r'…', '...', qtext)
+    Inputs:
+        -texts (pandas Series of strs)
+        -rules (list of Rules): compiled rule table
+    Returns (pandas Series): cleaned texts, same index
+    '''
+    texts = texts.copy()
+    for rule in rules:
+        start = time.perf_counter()
+        if rule.precheck is None:
+            rows = np.full((len(texts),), True)
+        else:
+            rows = np.full((len(texts),), False)
+            for sub in rule.precheck:
+                rows |= texts.str.contains(sub, regex=False).to_numpy()
+        before = texts.iloc[rows]
+        after = before.str.replace(rule.pattern, rule.repl, regex=True)
+        if rule.repeat:
+            # keep reapplying to the rows the last pass changed
+            pending = np.flatnonzero((after != before).to_numpy())
+            while len(pending) > 0:
+                again = after.iloc[pending].str.replace(rule.pattern, rule.repl, regex=True)
+                changed = (again != after.iloc[pending]).to_numpy()
+                after.iloc[pending] = again.to_numpy()
+                pending = pending[changed]
+        texts.iloc[rows] = after.to_numpy()
+        if RULE_STATS is not None:
+            stats = RULE_STATS.setdefault(rule.name, [0, 0, 0.0])
+            stats[0] += int(rows.sum())
+            stats[1] += int((before != after).sum())
+            stats[2] += time.perf_counter() - start
+    return texts
+
+
+def start_rule_stats():
+    '''Start counting, for every rule, how many texts it changes and how long it takes.'''
+    global RULE_STATS
+    RULE_STATS = {}
+
+
+def rule_stats_report(stop=True):
+    '''
+    Print and return the counters collected since start_rule_stats().
 
+    Inputs:
+        -stop (boolean): whether to turn instrumentation back off
+    Returns (pandas DataFrame): one row per rule, most expensive first
+    '''
+    global RULE_STATS
+    assert RULE_STATS is not None, "Call start_rule_stats() first"
+    report = pd.DataFrame([(name, checked, changed, seconds)
+                           for name, (checked, changed, seconds) in RULE_STATS.items()],
+                          columns=['rule', 'checked', 'changed', 'seconds'])
+    report = report.sort_values('seconds', ascending=False).reset_index(drop=True)
+    print(report.to_string(index=False))
+    if stop:
+        RULE_STATS = None
+    return report
+
+
+#Rules run by my_split() before splitting, in order
+SPLIT_RULES = compile_rules([
+    Rule('ellipsis', r'…', '...', ('…',)),
     #replace dumb quotes with smart quotes
-    qtext = re.sub(DUMB_QUOTE_RE, r'“\1”', qtext)
-
+    Rule('dumb_quotes', DUMB_QUOTE_RE, r'“\1”', ('"', '”')),
     #replace double apostrophes on one end of a quote with dumb quotes
     #e.g. “The Windhover''
     #but beware things like D'' layer or 4'33''
-    qtext = re.sub(r'\'\'', '”', qtext)
-
+    Rule('double_apostrophes', r'\'\'', '”', ("''",)),
     #prevent splitting on common titles
-    ABBREVS_RE = r'(“|\s)(Mr|Mrs|Ms|Mx|Messrs|Dr|Prof|Rev|Lt|Col|Gen|Gov|No|St|Ste|Mme|Mlle|v|vs|Blvd|Op|Mt|Ft)\.'
-    qtext = re.sub(ABBREVS_RE, r'\1\2_DOT_', qtext)
-
+    Rule('abbreviations',
+         r'(“|\s)(Mr|Mrs|Ms|Mx|Messrs|Dr|Prof|Rev|Lt|Col|Gen|Gov|No|St|Ste|Mme|Mlle|v|vs|Blvd|Op|Mt|Ft)\.',
+         r'\1\2_DOT_', ('.',)),
     #fix order of period-close quote so other REs work better
-    WRONG_ENDQUOTE_RE = r'(?<=[a-z])\.“(?= [A-Z])'
-    qtext = re.sub(WRONG_ENDQUOTE_RE, '.”', qtext)
-
+    Rule('wrong_endquote', r'(?<=[a-z])\.“(?= [A-Z])', '.”', ('.“',)),
     #prevent from splitting quotations
-    PERIOD_IN_SMART_QUOTES_RE = r'(?<=“)([^”]+)\.([^”]+)(?=”)'
-    #this operation only replaces one so you need to while loop it
-    while qtext != re.sub(PERIOD_IN_SMART_QUOTES_RE, r'\1_DOT_\2', qtext):
-        qtext = re.sub(PERIOD_IN_SMART_QUOTES_RE, r'\1_DOT_\2', qtext)
-        
+    #this operation only replaces one so it has to be repeated
+    Rule('period_in_smart_quotes', r'(?<=“)([^”]+)\.([^”]+)(?=”)', r'\1_DOT_\2', ('“',), True),
     #Should be obviated by replacement of dumb quotes
-    PERIOD_IN_DUMB_QUOTES_RE = r'(\"[^\.\"]+)\.( [^\.\"]+(\.|\?|\!|)\")'
-    qtext = re.sub(PERIOD_IN_DUMB_QUOTES_RE, r'\1_DOT_\2', qtext)
-
+    Rule('period_in_dumb_quotes', r'(\"[^\.\"]+)\.( [^\.\"]+(\.|\?|\!|)\")', r'\1_DOT_\2', ('"',)),
     #remove pronunciation guides where possible
-    PRONUNC_GUIDE_RE = r'\s(\[“[^\[\]]+”\]|\(“[^\(\)]+”\)|\(pron[^\)]+\)|\[pron[^\]]+\])'
-    qtext = re.sub(PRONUNC_GUIDE_RE, '', qtext)
-
+    Rule('pronunciation_guides',
+         r'\s(\[“[^\[\]]+”\]|\(“[^\(\)]+”\)|\(pron[^\)]+\)|\[pron[^\]]+\])', '',
+         ('[“', '(“', '(pron', '[pron')),
     #remove power marks
-    POWER_MARK_RE = r'\((\*|\+){1,2}\)\s?'
-    qtext = re.sub(POWER_MARK_RE, '', qtext)
-
-    #TODO: improve documentation for this monster regex
-    #Default behavior: split at end-of-sentence periods that aren't within quotation marks
-    TEST_BEST_SPLIT_RE = re.compile(r'(?<=[^ A-Z]\.\s)' #prevent splitting on initials or ellipses
-                                    r'(?=[\s0-9A-Z“])|' #look ahead to see if next sentence
-                                    #starts with number, capital letter, or left quotation mark
-                                    r'(?<=(?:\?|\.|\!)(?:”|\")\s)(?=[^a-z])|' # "core"
-                                    r'(?<=[A-Z]{2}\. )|' #deal with sentences that end with
-                                    #an initialism like 'CO' or 'DRNA'
-                                    r'(?<=\.”|\.\")(?=[0-9A-Z])') #handle sentences with no space;
-                                    #e.g. 2023 ACF Regionals 'House of Usher' tossup
+    Rule('power_marks', r'\((\*|\+){1,2}\)\s?', '', ('(*', '(+')),
+])
+
+#TODO: improve documentation for this monster regex
+#Default behavior: split at end-of-sentence periods that aren't within quotation marks
+TEST_BEST_SPLIT_RE = re.compile(r'(?<=[^ A-Z]\.\s)' #prevent splitting on initials or ellipses
+                                r'(?=[\s0-9A-Z“])|' #look ahead to see if next sentence
+                                #starts with number, capital letter, or left quotation mark
+                                r'(?<=(?:\?|\.|\!)(?:”|\")\s)(?=[^a-z])|' # "core"
+                                r'(?<=[A-Z]{2}\. )|' #deal with sentences that end with
+                                #an initialism like 'CO' or 'DRNA'
+                                r'(?<=\.”|\.\")(?=[0-9A-Z])') #handle sentences with no space;
+                                #e.g. 2023 ACF Regionals 'House of Usher' tossup
+
+#Rules run by clean_clue_text(), in order
+CLUE_RULES = compile_rules([
+    #revert _DOT_s back
+    Rule('revert_dots', '_DOT_', '.', ('_DOT_',)),
+    #remove HTML-y tags
+    Rule('html_tags', BRACKET_RE, '', ('<',)),
+    #edge case: a bonus where "The FTP" is an actual organization in the clue
+    Rule('the_ftp', 'The FTP', 'The F.T.P.', ('The FTP',)),
+    #get rid of ftp/ftpe throughout
+    Rule('ftp', re.compile('(, |–{1,2}|—)?(for (5|five|10|ten|15|fifteen|the stated number of) po?i(nt|tn)s?(,)?( each| ecah)?(,|:)?)|f(t|f)(sno)?p(e)?(,|:|\.|–{1,2}|—)?',
+                           re.IGNORECASE), r'\1'),
+    #get rid of stray point markers (beware that sometimes these result from mis-parsing "A.")
+    #will also remove empty brackets
+    Rule('point_marks', r'\[(5|10|)\]\s', '', ('[',)),
+    #remove "description acceptable" phrase (does not handle "warning/note to players")
+    Rule('description_acceptable',
+         re.compile(r'(a )?(name or )?(a )?(general )?description\s(is|)acceptable(\.|:|)\s?',
+                    re.IGNORECASE), ''),
+    #remove "warning"s and "notes"
+    Rule('warnings_and_notes',
+         re.compile('^(Note( to (teams|players?|reader|moderator)|)|Moderator note|(Content |)warning):?',
+                    re.IGNORECASE), ''),
+    #the y in the non brackets is a kludge to save stuff inside "(read slowly)...
+    # (end read slowly) tags from getting eaten
+    Rule('read_slowly', r'(?<![A-Z])read[^“y]+(slowly|carefully)', '', ('read',)),
+    #remove mod instructions to emphasize
+    Rule('emphasize', r'(\[|\()emphasize(\]|\))', '', ('emphasize',)),
+    Rule('from_clues', 'from clues', '', ('from clues',)),
+    #TODO: remove dashes around the missing "--for 10 points--"
+    #DASH_RE = r'(—{1,2}|–{2,4}|--\s?--)s?what'
+])
+
+#Rules run by clean_answer_text(), in order
+ANSWER_RULES = compile_rules([
+    #Turn dumb quotes into smart quotes
+    Rule('dumb_quotes', DUMB_QUOTE_RE, r'“\1”', ('"', '”')),
+    #get rid of angle-brackets, e.g. author credits, html tags
+    Rule('html_tags', BRACKET_RE, '', ('<',)),
+    #get rid of improperly rendered angle brackets
+    Rule('escaped_brackets', '&lt;.+&gt;', '', ('&lt;',)),
+    Rule('do_not_reveal', re.compile('(,|) but do not( otherwise|) reveal(,|)', re.IGNORECASE), ''),
+    Rule('reject', re.compile(r'(; |, |)(do not (accept|prompt|take)|reject)[^\]\)]+(?=\]|\))',
+                              re.IGNORECASE), ''),
+    #sweep out empty brackets, e.g. where reject instructions used to be
+    Rule('empty_brackets', r'\[\s?\]|\(\s?\)', '', ('[', '(')),
+    #TODO: "note:/Editors' note: / Ed’s note:" / parenthetical or bracketed statements
+])
+
+#Remove "n answers required / specific term required / genre and composer required etc."
+#inspecting the data, it looks like this is a good length threshold
+REQD_LEN_THRESHOLD = 70
+#remove remaining "...is/are acceptable" clues
+#inspecting the data, it looks like the shortest real clue with 'acceptable'
+#in it is of length 86
+#TODO: remove about fifteen 'false positive' non-clues above this length
+DESC_ACC_THRESHOLD = 86
+ANS_MISSING = "THE ANSWER TO THIS CLUE WAS MISSING ON QBREADER. LOOK IT UP"
+
+#Clues matching these are dropped rather than cleaned
+#TODO: use .pattern attribute to improve REs?
+ANSWER_FOLLOWING_RE = re.compile(r'(Answer|Identify|Respond appropriately to) '
+                                 r'(th(e|is)|these|some) '
+                                 r'(following|questions)',
+                                 re.IGNORECASE)
+#Remove non-clue bonus leadins
+#TODO: fix this to be an re_compile that also uses FTP_RE
+NO_CLUE_BONUS_LEADIN_RE = re.compile(r'(identify|name|give) '
+                                     r'(these|three|some).+'
+                                     r'(for 10 points each|ftpe)',
+                                     re.IGNORECASE)
+#cleaned clues this short or shorter are dropped, including:
+# - standalone numbers/letters/initials
+# - "pencil and paper ready"
+# - "you have n seconds"
+MIN_CLUE_LEN = 25
+
+
+def my_split(qtext):
+    '''
+    Use a regex split questions at the clue (standalone sentence) level.
 
+    Inputs:
+        -qtext (str): The tossup or bonus part to be split up
+    Returns (lst): A list of the clue-sentences in the tossup or bonus part,
+    to be converted later into one card apiece 
+    '''
+    #PRE-PROCESSING (see SPLIT_RULES)
+    qtext = apply_rules(qtext, SPLIT_RULES)
     return re.split(TEST_BEST_SPLIT_RE, qtext)
 
 
@@ -80,7 +277,9 @@ def tokenize_and_explode(clues):
     Returns (pandas DataFrame): modified DataFrame with one row per clue
     (TODO: figure out how to do a pandas inplace=True)
     '''
-    clues.loc[:,'clue'] = clues.loc[:,'clue'].progress_apply(lambda x: my_split(x))
+    #same as applying my_split() to each question, one rule at a time
+    questions = apply_rules_to_column(clues.loc[:,'clue'], SPLIT_RULES)
+    clues.loc[:,'clue'] = questions.str.split(TEST_BEST_SPLIT_RE, regex=True)
 
     clues_exploded = clues.explode(["clue"],ignore_index=True)
 
@@ -89,6 +288,120 @@ def tokenize_and_explode(clues):
     return clues_exploded
 
 
+def is_candidate_clue(clue, qtype=None):
+    '''
+    Whether a clue, as split, survives the filters cleanup() applies before
+    cleaning: 30-20-10s, "some stuff" bonus leadins and "answer the
+    following"-style instructions.
+
+    Inputs:
+        -clue (str): one clue, as split by my_split()
+        -qtype (str or None): the question's 'type' ('bonus_leadin' enables
+        the leadin-only filter)
+    Returns (boolean)
+    '''
+    if '30-20-10' in clue:
+        return False
+    if qtype == 'bonus_leadin' and 'some stuff' in clue:
+        return False
+    #each regex needs one of these words, which few clues have. They avoid 'i'
+    #and 's', which IGNORECASE also matches to 'ı', 'İ' and 'ſ'
+    lowered = clue.lower()
+    if ('follow' in lowered or 'que' in lowered) and ANSWER_FOLLOWING_RE.search(clue):
+        return False
+    if ('each' in lowered or 'ftpe' in lowered) and NO_CLUE_BONUS_LEADIN_RE.search(clue):
+        return False
+    return True
+
+
+def split_and_clean(qtext, qtype=None, seen=None):
+    '''
+    The whole per-clue pipeline for a single question, in one pass: split it
+    with my_split(), drop clues cleanup() would drop, clean the rest with
+    clean_clue_text() and drop the ones left too short.
+
+    Inputs:
+        -qtext (str): a tossup or bonus part
+        -qtype (str or None): see is_candidate_clue()
+        -seen (set or None): clues (as split) already met in earlier
+        questions. Repeats are skipped before any cleaning, and new clues are
+        added to it.
+    Returns (list of tuples): (clue as split, cleaned clue) for every clue
+    that survives
+    '''
+    survivors = []
+    for clue in my_split(qtext):
+        if seen is not None:
+            if clue in seen:
+                continue
+            seen.add(clue)
+        if not is_candidate_clue(clue, qtype):
+            continue
+        cleaned = clean_clue_text(clue)
+        if len(cleaned) > MIN_CLUE_LEN:
+            survivors.append((clue, cleaned))
+    return survivors
+
+
+def explode_clean(questions, drop_repeats=True):
+    '''
+    Replacement for tokenize_and_explode(), drop_duplicates('clue') and
+    cleanup() that never builds the exploded table. Questions are split with
+    the batched split rules; repeats and non-clues are dropped while walking
+    the pieces; only the survivors are cleaned, with the batched clue rules;
+    and rows are built only for clues that are still long enough. Answer
+    lines are cleaned once per question that keeps a clue.
+
+    As with the separate stages, repeated clues are dropped by their text as
+    split, keeping the first, and 'len' is the length of that text.
+
+    Inputs:
+        -questions (pandas DataFrame): one row per tossup or bonus part
+        -drop_repeats (boolean): whether to drop repeated clues. If False,
+        the text as split is kept in a 'split_clue' column instead, so
+        repeats can be dropped later (e.g. after filtering the rows)
+    Returns (pandas DataFrame): one row per kept clue
+    '''
+    #same as my_split() on each question, one rule at a time
+    texts = apply_rules_to_column(questions.loc[:,'clue'].astype(object), SPLIT_RULES)
+    qtypes = questions.loc[:,'type'] if 'type' in questions.columns else [None] * len(questions)
+    seen = set() if drop_repeats else None
+    positions, raw_clues = [], []
+    for position, (qtext, qtype) in enumerate(zip(tqdm(texts), qtypes)):
+        for clue in TEST_BEST_SPLIT_RE.split(qtext):
+            if seen is not None:
+                if clue in seen:
+                    continue
+                seen.add(clue)
+            if is_candidate_clue(clue, qtype):
+                positions.append(position)
+                raw_clues.append(clue)
+
+    print("Cleaning clue text...")
+    raw_clues = pd.Series(raw_clues, dtype=object)
+    cleaned = clean_clue_column(raw_clues)
+    long_enough = (cleaned.str.len() > MIN_CLUE_LEN).to_numpy()
+    positions = np.array(positions, dtype=np.int64)[long_enough]
+    print(f"Kept {len(positions)} clues from {len(questions)} questions")
+
+    #question and answer text are replaced, so they aren't copied per clue
+    clues = questions.drop(columns=['clue', 'answer']).iloc[positions].copy()
+    clues.loc[:,'clue'] = cleaned.to_numpy(dtype=object)[long_enough]
+    clues.loc[:,'len'] = raw_clues.str.len().to_numpy()[long_enough]
+    if not drop_repeats:
+        clues.loc[:,'split_clue'] = raw_clues.to_numpy(dtype=object)[long_enough]
+
+    print("Cleaning answer line text...")
+    answer_positions, per_clue = np.unique(positions, return_inverse=True)
+    clean_answers = clean_answer_column(questions.loc[:,'answer'].iloc[answer_positions])
+    clues.loc[:,'answer'] = clean_answers.to_numpy(dtype=object)[per_clue]
+    clues = clues.loc[:, list(questions.columns) +
+                      [col for col in clues.columns if col not in questions.columns]]
+    if uses_arrow_strings(questions):
+        clues = arrow_strings(clues)
+    return clues.reset_index(drop=True)
+
+
 def cleanup(clues):
     '''
     Cleans all clues and answers IN THE WHOLE DATAFRAME, calling helper functions
@@ -105,44 +418,37 @@ def cleanup(clues):
     TODO: Split into helpers for each kind of cleanup
     '''
     print("Removing unwanted rows (e.g. duplicates, obvious non-clues)...")
-    clues = clues.drop_duplicates('clue')
-
-    #TODO: use .pattern attribute to improve REs?
-    ANSWER_FOLLOWING_RE = re.compile(r'(Answer|Identify|Respond appropriately to) '
-                                     r'(th(e|is)|these|some) '
-                                     r'(following|questions)',
-                                     re.IGNORECASE)
-    clues = clues.loc[(~clues.loc[:,'clue'].str.contains(ANSWER_FOLLOWING_RE, regex=True)), :]
+    #every row filter goes into one mask, cheapest first; each regex only
+    #scans rows that are still alive, and the DataFrame is sliced once
+    clue_text = clues.loc[:,'clue']
+    keep = ~clue_text.duplicated().to_numpy()
 
-    #Remove non-clue bonus leadins
+    #30-20-10s
+    keep &= ~clue_text.str.contains('30-20-10', regex=False).to_numpy()
 
-    #TODO: fix this to be an re_compile that also uses FTP_RE
-    NO_CLUE_BONUS_LEADIN_RE = re.compile(r'(identify|name|give) '
-                                         r'(these|three|some).+'
-                                         r'(for 10 points each|ftpe)',
-                                         re.IGNORECASE)
-    clues = clues.loc[(~clues.loc[:,'clue'].str.contains(NO_CLUE_BONUS_LEADIN_RE, regex=True)), :]
+    if 'type' in clues.columns:
+        keep &= ~((clue_text.str.contains('some stuff', regex=False)) &
+                  (clues.loc[:,'type'] == 'bonus_leadin')).to_numpy()
 
-    if type in clues.columns:
-        clues = clues.loc[~((clues.loc[:,'clue'].str.contains('some stuff')) & 
-                (clues.loc[:,'type'] == 'bonus_leadin')), :]
-
-    print("Removing 30-20-10s...")
-    clues = clues.loc[(~clues.loc[:,'clue'].str.contains('30-20-10')), :]
+    for filter_re in [ANSWER_FOLLOWING_RE, NO_CLUE_BONUS_LEADIN_RE]:
+        alive = np.flatnonzero(keep)
+        keep[alive[clue_text.iloc[alive].str.contains(filter_re, regex=True).to_numpy()]] = False
 
     print("Cleaning clue text...")
-    clues.loc[:,'clue'] = clues.loc[:,'clue'].progress_apply(lambda x: 
-                                                             clean_clue_text(x))
+    alive = np.flatnonzero(keep)
+    cleaned = clean_clue_column(clue_text.iloc[alive])
+
+    #remove extremely short clues
+    keep[alive[(cleaned.str.len() <= MIN_CLUE_LEN).to_numpy()]] = False
+    clean_text = clue_text.to_numpy(dtype=object, copy=True)
+    clean_text[alive] = cleaned.to_numpy(dtype=object)
 
-    #remove extremely short clues, including:
-    # - standalone numbers/letters/initials
-    # - "pencil and paper ready"
-    # - "you have n seconds"
-    print("Removing extremely short clues...")
-    clues = clues.loc[(clues.loc[:,'clue'].str.len() > 25), :]
+    print(f"Removed {len(clues) - keep.sum()} of {len(clues)} rows")
+    clues = clues.iloc[keep].copy()
+    clues.loc[:,'clue'] = clean_text[keep]
 
     print("Cleaning answer line text...")
-    clues.loc[:,'answer'] = clues.loc[:,'answer'].progress_apply(lambda x: clean_answer_text(x))
+    clues.loc[:,'answer'] = clean_answer_column(clues.loc[:,'answer'])
 
     return clues
 
@@ -155,66 +461,18 @@ def clean_clue_text(qtext):
 
     This used to be written at the df level with selectors like:
         clues.loc[:,'clue'] = clues.loc[:,'clue'].str.replace('_DOT_', '.')
-    but now it's not.
+    but now it's not. The substitutions are in CLUE_RULES; clean_clue_column()
+    does the same thing to a whole column at once.
 
     Inputs:
         qtext (str): content of a single cell in the 'clue' column
     Returns (str): that string, with unwanted elements removed and text fixed
     '''
-    #revert _DOT_s back
-    qtext = re.sub('_DOT_', '.', qtext)
-
-    #remove HTML-y tags
-    BRACKET_RE = r'<[^>]+>'
-    qtext = re.sub(BRACKET_RE, '', qtext) 
-
-    #edge case: a bonus where "The FTP" is an actual organization in the clue
-    qtext = re.sub('The FTP', 'The F.T.P.', qtext)
-    #get rid of ftp/ftpe throughout
-    FTP_RE = re.compile('(, |–{1,2}|—)?(for (5|five|10|ten|15|fifteen|the stated number of) po?i(nt|tn)s?(,)?( each| ecah)?(,|:)?)|f(t|f)(sno)?p(e)?(,|:|\.|–{1,2}|—)?', 
-                        re.IGNORECASE)
-    qtext = re.sub(FTP_RE, r'\1', qtext)
-
-    #get rid of stray point markers (beware that sometimes these result from mis-parsing "A.")
-    POINT_MARK_RE = r'\[(5|10|)\]\s' #will also remove empty brackets
-    qtext = re.sub(POINT_MARK_RE, '', qtext)
-
-    #remove "description acceptable" phrase (does not handle "warning/note to players")
-    DESC_ACC_RE = re.compile('(a )?(name or )?(a )?(general )?description\s(is|)acceptable(\.|:|)\s?',
-                              re.IGNORECASE)
-    qtext = re.sub(DESC_ACC_RE, '', qtext)
-
-    #remove "warning"s and "notes"
-    WARNING_RE = re.compile('^(Note( to (teams|players?|reader|moderator)|)|Moderator note|(Content |)warning):?',
-                            re.IGNORECASE)
-    qtext = re.sub(WARNING_RE, '', qtext)
+    qtext = apply_rules(qtext, CLUE_RULES)
 
-    READ_SLOW_RE = r'(?<![A-Z])read[^“y]+(slowly|carefully)' 
-    #the y in the non brackets is a kludge to save stuff inside "(read slowly)...
-    # (end read slowly) tags from getting eaten
-    qtext = re.sub(READ_SLOW_RE, '', qtext)
-    
-    #remove mod instructions to emphasize
-    qtext = re.sub('(\[|\()emphasize(\]|\))', '', qtext)
-
-    qtext = re.sub('from clues', '', qtext)
-
-    #TODO: remove dashes around the missing "--for 10 points--"
-    #DASH_RE = r'(—{1,2}|–{2,4}|--\s?--)s?what'
-    #qtext = re.sub(DASH_RE, ' what', qtext)
-
-    #Remove "n answers required / specific term required / genre and composer required etc."
-    #inspecting the data, it looks like this is a good length threshold
-    REQD_LEN_THRESHOLD = 70
-    if len(qtext) < REQD_LEN_THRESHOLD and bool(re.search(r'required\.', qtext)):
+    if len(qtext) < REQD_LEN_THRESHOLD and 'required.' in qtext:
         qtext = ''
-
-    #remove remaining "...is/are acceptable" clues
-    #inspecting the data, it looks like the shortest real clue with 'acceptable'
-    #in it is of length 86
-    #TODO: remove about fifteen 'false positive' non-clues above this length
-    DESC_ACC_THRESHOLD = 86
-    if len(qtext) < DESC_ACC_THRESHOLD and bool(re.search(r'acceptable\.', qtext)):
+    if len(qtext) < DESC_ACC_THRESHOLD and 'acceptable.' in qtext:
         qtext = ''
 
     #capitalize clue-initial consonant
@@ -227,6 +485,23 @@ def clean_clue_text(qtext):
     return qtext
 
 
+def clean_clue_column(clues):
+    '''
+    clean_clue_text() for a whole Series of clues, one rule at a time.
+
+    Inputs:
+        -clues (pandas Series of strs)
+    Returns (pandas Series): cleaned clues, same index
+    '''
+    clues = apply_rules_to_column(clues, CLUE_RULES)
+    lengths = clues.str.len()
+    non_clue = (((lengths < REQD_LEN_THRESHOLD) & clues.str.contains('required.', regex=False)) |
+                ((lengths < DESC_ACC_THRESHOLD) & clues.str.contains('acceptable.', regex=False)))
+    clues = clues.mask(non_clue, '').str.strip()
+    #capitalize clue-initial consonant
+    return clues.str[:1].str.upper() + clues.str[1:]
+
+
 def clean_answer_text(atext):
     '''
     Function to be applied ON A SINGLE ANSWER LINE to take advantage of pandas 
@@ -235,37 +510,26 @@ def clean_answer_text(atext):
 
     This used to be written at the df level with selectors like:
         clues.loc[:,'answer'] = clues.loc[:,'answer'].str.replace('_DOT_', '.')
-    but now it's not.
+    but now it's not. The substitutions are in ANSWER_RULES;
+    clean_answer_column() does the same thing to a whole column at once.
 
     Inputs:
         atext (str): content of a single cell in the 'answer' column
     Returns (str): that string, with unwanted elements removed and text fixed
     '''
-    ANS_MISSING = "THE ANSWER TO THIS CLUE WAS MISSING ON QBREADER. LOOK IT UP"
     if len(atext) == 0 or atext == "[MISSING]":
         atext = ANS_MISSING
 
-    #Turn dumb quotes into smart quotes
-    atext = re.sub(DUMB_QUOTE_RE, r'“\1”', atext)
-
-    #get rid of angle-brackets, e.g. author credits, html tags
-    atext = re.sub(BRACKET_RE, '', atext)
-
-    #get rid of improperly rendered angle brackets
-    LTGT_RE = re.compile('&lt;.+&gt;')
-    atext = re.sub(LTGT_RE, '', atext)
-
-    DO_NOT_REVEAL_RE = re.compile('(,|) but do not( otherwise|) reveal(,|)', re.IGNORECASE)
-    atext = re.sub(DO_NOT_REVEAL_RE, '', atext)
-
-    REJECT_RE = re.compile('(; |, |)(do not (accept|prompt|take)|reject)[^\]\)]+(?=\]|\))',
-                           re.IGNORECASE)
-    atext = re.sub(REJECT_RE, '', atext)
+    return apply_rules(atext, ANSWER_RULES).strip()
 
-    #sweep out empty brackets, e.g. where reject instructions used to be
-    EMPTY_BRACKET_RE = r'\[\s?\]|\(\s?\)'
-    atext = re.sub(EMPTY_BRACKET_RE, '', atext)
 
-    #TODO: "note:/Editors' note: / Ed’s note:" / parenthetical or bracketed statements
+def clean_answer_column(answers):
+    '''
+    clean_answer_text() for a whole Series of answer lines, one rule at a time.
 
-    return atext.strip()
\ No newline at end of file
+    Inputs:
+        -answers (pandas Series of strs)
+    Returns (pandas Series): cleaned answer lines, same index
+    '''
+    answers = answers.mask((answers.str.len() == 0) | (answers == "[MISSING]"), ANS_MISSING)
+    return apply_rules_to_column(answers, ANSWER_RULES).str.strip()
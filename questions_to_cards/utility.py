@@ -1,9 +1,165 @@
 import pandas as pd
+import sqlite3
+import hashlib
+import html
+import os
+import re
+import subprocess
+import sys
+import time
 
-def write_out(clues, filepath):
+ANKI_FIELD_SEP = '\x1f'
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+#pandas dtype for Arrow-backed string columns; see arrow_strings()
+ARROW_STRING = 'string[pyarrow]'
+#text columns the pipeline can keep as ARROW_STRING
+TEXT_COLUMNS = ['question', 'leadin', 'clue', 'answer', 'subcategory', 'category', 'type',
+                'setName', 'setNames', 'setYears', 'tags', 'norm_clue', 'norm_answer',
+                'simple_answer']
+#entry-point modules whose import time import_benchmark() reports
+BENCHMARK_MODULES = ['text_processing', 'utility', 'similarity', 'backup_to_cards',
+                     'packet_to_cards', 'interface', 'card_service']
+
+def write_out(clues, filepath, anki_collection=None):
     '''
     Write out rows of (clue, answer, tagstring) to an Anki-compatible,
     tab-separated .csv file.
+
+    If anki_collection is the path to a local Anki collection file
+    (collection.anki2), cards whose front and back are already in that
+    collection are left out, so the import file holds only new or changed cards.
     '''
-    clues.loc[:,['clue', 'answer', 'tags']].to_csv(filepath, sep="\t", 
+    if anki_collection is not None:
+        clues = filter_existing_cards(clues, anki_collection)
+    clues.loc[:,['clue', 'answer', 'tags']].to_csv(filepath, sep="\t",
                                                    escapechar="\\", index=False)
+
+
+def normalize_field(text):
+    '''
+    Reduce a card field to what a reader would see, so that our text and the
+    HTML Anki stores compare equal: unescape entities, drop tags, collapse
+    whitespace and ignore case.
+    '''
+    text = HTML_TAG_RE.sub(' ', html.unescape(str(text)))
+    return ' '.join(text.split()).casefold()
+
+
+def field_hash(text):
+    '''Short, stable digest of a normalized field.'''
+    return hashlib.blake2b(normalize_field(text).encode('utf-8'), digest_size=8).digest()
+
+
+def load_anki_index(collection_path):
+    '''
+    Open an Anki collection read-only and index its notes by their first two
+    fields (front and back).
+
+    Inputs:
+        -collection_path (str): path to collection.anki2
+    Returns (dict): front hash -> set of back hashes
+    '''
+    conn = sqlite3.connect(f"file:{collection_path}?mode=ro", uri=True)
+    try:
+        index = {}
+        for (flds,) in conn.execute("SELECT flds FROM notes"):
+            fields = flds.split(ANKI_FIELD_SEP)
+            back = fields[1] if len(fields) > 1 else ''
+            index.setdefault(field_hash(fields[0]), set()).add(field_hash(back))
+    finally:
+        conn.close()
+    print(f"Indexed {len(index)} note fronts from {collection_path}")
+    return index
+
+
+def filter_existing_cards(clues, collection_path):
+    '''
+    Drop rows whose clue and answer already appear as the front and back of
+    a note in the Anki collection, and print how many cards are new, changed
+    (same front, different back) or already present.
+
+    Inputs:
+        -clues (pandas DataFrame): must have 'clue' and 'answer' columns
+        -collection_path (str): path to collection.anki2
+    Returns (pandas DataFrame): rows that are new or changed
+    '''
+    index = load_anki_index(collection_path)
+
+    status = []
+    for clue, answer in zip(clues.loc[:,'clue'], clues.loc[:,'answer']):
+        backs = index.get(field_hash(clue))
+        if backs is None:
+            status.append('new')
+        elif field_hash(answer) in backs:
+            status.append('present')
+        else:
+            status.append('changed')
+    status = pd.Series(status, index=clues.index)
+
+    counts = status.value_counts()
+    print(f"{counts.get('new', 0)} new cards, {counts.get('changed', 0)} changed cards, " +
+          f"{counts.get('present', 0)} cards already in collection (skipped)")
+    return clues.loc[status != 'present', :]
+
+
+def arrow_strings(df):
+    '''
+    Store whichever TEXT_COLUMNS df has as ARROW_STRING: one contiguous Arrow
+    buffer per column instead of a Python object per cell, which takes much
+    less memory and makes .str methods run in Arrow's compute kernels.
+    Missing values become pd.NA.
+
+    Returns (pandas DataFrame): the same DataFrame, converted in place
+    '''
+    for col in TEXT_COLUMNS:
+        if col in df.columns and df[col].dtype != ARROW_STRING:
+            df[col] = df[col].astype(ARROW_STRING)
+    return df
+
+
+def str_values(data):
+    '''
+    data.astype(str), for a Series or DataFrame. Goes through object first,
+    since astype(str) on an ARROW_STRING column builds a fixed-width numpy
+    array as wide as its longest text (hundreds of MB for a full backup).
+    '''
+    return data.astype(object).astype(str)
+
+
+def uses_arrow_strings(df):
+    '''Whether any of df's TEXT_COLUMNS is stored as ARROW_STRING.'''
+    return any(col in df.columns and df[col].dtype == ARROW_STRING for col in TEXT_COLUMNS)
+
+
+def import_benchmark(modules=BENCHMARK_MODULES, num_slowest=5):
+    '''
+    Time how long each entry-point module takes to import in a fresh
+    interpreter (so nothing is already cached), and list the dependencies
+    that take the longest, as reported by python -X importtime.
+
+    Inputs:
+        -modules (list of strs): module names in this directory
+        -num_slowest (int): how many of the slowest dependencies to list
+    Returns (pandas DataFrame): one row per module, with its import time in seconds
+    '''
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    rows = []
+    for module in modules:
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                                cwd=package_dir, capture_output=True, text=True)
+        seconds = time.perf_counter() - start
+        #importtime lines look like "import time:   self [us] | cumulative | name"
+        deps = []
+        for line in result.stderr.splitlines():
+            fields = line.split('|')
+            if (line.startswith('import time:') and fields[1].strip().isdigit()
+                    and fields[2].strip() != module):
+                deps.append((int(fields[1]), fields[2].strip()))
+        deps.sort(reverse=True)
+        status = 'ok' if result.returncode == 0 else 'FAILED'
+        rows.append({'module': module, 'seconds': round(seconds, 3), 'status': status})
+        print(f"{module}: {seconds:.2f}s ({status})")
+        for cumulative, name in deps[:num_slowest]:
+            print(f"    {name}: {cumulative / 1e6:.2f}s")
+    return pd.DataFrame(rows)